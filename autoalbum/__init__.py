@@ -2,6 +2,24 @@
 
 I wish
 '''
+import importlib
 
-from .api import API
-from . import auth, util
+# Submodules and names re-exported here. They're only imported on first use, so that
+# `import autoalbum` (and `python -m autoalbum --help`) doesn't pay for the Google client libraries
+_LAZY = {
+    'API': ('.api', 'API'),
+    'auth': ('.auth', None),
+    'util': ('.util', None),
+}
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    module_name, attr = _LAZY[name]
+    module = importlib.import_module(module_name, __name__)
+    value = module if attr is None else getattr(module, attr)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
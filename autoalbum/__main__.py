@@ -1,38 +1,158 @@
 '''Entrypoint for autoalbum
 
 Run autoalbum.configurator first. You'll need the config file
+
+The config file may list several jobs; see :mod:`autoalbum.runner`. With ``--daemon`` the process
+stays up and re-runs them every ``--interval`` seconds, reusing the same API instance (and its
+connections and index) throughout. A job is skipped when its source album looks unchanged.
+
+Album adds and removes are journaled (see :mod:`autoalbum.journal`). If an earlier run died
+partway through one, the chunks it didn't get to are sent before any job runs.
+
+With ``--async`` the jobs run on one event loop against an :class:`autoalbum.aio.AsyncAPI`
+instead (behaviors need a ``run_async`` for that; no index, journal or daemon mode there).
+
+Startup is kept cheap: nothing heavy (the Google client libraries, behavior modules) is imported
+until it's needed, so ``--help`` and ``--list-behaviors`` return right away.
 '''
 
 import argparse
-import importlib
+import atexit
 from pathlib import Path
 
 import autoalbum
+from autoalbum import behavior as behaviors
+from autoalbum import runner
+from autoalbum.api import JOB_MODES, BatchJobError
+from autoalbum.index import MediaIndex
+from autoalbum.journal import Journal
+from autoalbum.metrics import REGISTRY
+from autoalbum.scheduler import DEFAULT_RATE, RequestScheduler
 from autoalbum.util import load_json
 
-def main(behavior, conf, unknown_args):
+def main(behavior, conf, unknown_args, index_path=None, rebuild_index=False, interval=None,
+        parallelism=None, use_async=False, journal_path=None, **api_kwargs):
     if conf.is_dir():
         # If we are given a directory, append default config file name
         conf /= 'config.json'
     conf_data = load_json(conf)
 
-    # Load user-provided module
-    mod = importlib.import_module(behavior)
+    # Load user-provided module(s)
+    jobs = runner.load_jobs(conf_data, behavior, unknown_args)
+    parallelism = parallelism or conf_data.get('parallelism', 1)
+
+    if use_async:
+        main_async(conf_data['auth'], jobs, parallelism, **api_kwargs)
+        return
 
-    # Build new API instance
-    api = autoalbum.API.new(conf_data['auth'], mod.SCOPES)
+    # Open the local album index (it lives next to the config file unless told otherwise)
+    index = MediaIndex(index_path or conf.parent / 'index.sqlite')
+    if rebuild_index:
+        index.clear()
 
-    # Parse the module's arguments and execute its logic
-    args = mod.parse_args(unknown_args)
-    mod.run(api, conf_data, **vars(args))
+    # Same for the journal of album edits
+    journal = Journal(journal_path or conf.parent / 'journal.jsonl')
+
+    # Build one API instance for everybody
+    if api_kwargs.get('concurrency') is None:
+        api_kwargs.pop('concurrency', None)
+    api = autoalbum.API.new(conf_data['auth'], runner.required_scopes(jobs), index=index,
+        journal=journal, **api_kwargs)
+
+    # Execute the jobs' logic
+    try:
+        # Finish whatever album edits the last run didn't get to
+        pending = sum(len(job.pending) for job in journal.unfinished())
+        if pending:
+            print('Resuming {} unfinished album edit chunks from the journal'.format(pending))
+            try:
+                api.resume()
+            except BatchJobError as e:
+                print('Could not finish them all ({}); will try again next run'.format(e))
+        if interval:
+            runner.run_daemon(api, jobs, interval, parallelism)
+        else:
+            runner.print_summary(runner.run_jobs(api, jobs, parallelism))
+    finally:
+        api.close()
+        journal.close()
+        index.close()
+
+def main_async(client_config, jobs, parallelism, concurrency=None, job_mode=None, **api_kwargs):
+    '''Run jobs once on an event loop. `job_mode` doesn't apply: every call is a coroutine'''
+    import asyncio
+    from autoalbum.aio import DEFAULT_CONCURRENCY, AsyncAPI
+
+    async def run():
+        async with AsyncAPI.new(client_config, runner.required_scopes(jobs),
+                concurrency=concurrency or DEFAULT_CONCURRENCY, **api_kwargs) as api:
+            return await runner.run_jobs_async(api, jobs, parallelism)
+    runner.print_summary(asyncio.run(run()))
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='AutoAlbum executor')
-    parser.add_argument('behavior', type=str, default='autoalbum.behavior.n_most_recent',
-        nargs='?', help='Python module of desired behavior to run (must be on path already)')
+    parser.add_argument('behavior', type=str, default='n_most_recent', nargs='?',
+        help='Behavior to run: a registered name (see --list-behaviors) or a Python module on '
+            'the path. Default n_most_recent')
+    parser.add_argument('--list-behaviors', action='store_true',
+        help='List the registered behaviors and exit')
     parser.add_argument('--conf', '-c', type=Path, default=Path(),
         help='The file or directory location of the AutoAlbum config file. Default ./conf.json')
+    parser.add_argument('--index', type=Path, default=None,
+        help='Location of the local album index. Default: index.sqlite next to the config file')
+    parser.add_argument('--credentials', type=Path, default=None,
+        help='Shared credentials file. Default: $AUTOALBUM_CREDENTIALS, or '
+            'credentials.json in ~/.config/autoalbum')
+    parser.add_argument('--journal', type=Path, default=None,
+        help='Journal of album adds/removes, to resume them if a run dies partway. Default: '
+            'journal.jsonl next to the config file')
+    parser.add_argument('--rebuild-index', action='store_true',
+        help='Throw away the local album index and re-scan everything from Google')
+    parser.add_argument('--batch-size', type=int, default=50,
+        help='Media ids per album add/remove call (max 50). Default 50')
+    parser.add_argument('--concurrency', type=int, default=None,
+        help='Album add/remove calls in flight at once (threads, or calls per multipart request). '
+            'Default: 1 serial, 8 threads, 50 http_batch. With --async, requests in flight at '
+            'once. Default 8')
+    parser.add_argument('--job-mode', choices=JOB_MODES, default='serial',
+        help='How album add/remove calls are sent. Default serial')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+        help='Most API requests per second. Default {}'.format(DEFAULT_RATE))
+    parser.add_argument('--max-retries', type=int, default=5,
+        help='Retries for throttled or failed requests before giving up. Default 5')
+    parser.add_argument('--request-budget', type=int, default=None,
+        help='Most API requests this run may make (retries included). Default unlimited')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+        help='Run on asyncio (needs aiohttp): many requests in flight from one thread')
+    parser.add_argument('--daemon', action='store_true',
+        help='Keep running, re-checking the source album every --interval seconds')
+    parser.add_argument('--interval', type=float, default=None,
+        help='Seconds between runs in daemon mode (implies --daemon). Default 300')
+    parser.add_argument('--parallelism', '-j', type=int, default=None,
+        help='How many jobs from the config file may run at once. Default: the config file\'s '
+            '"parallelism", or 1')
+
+    parser.add_argument('--metrics-json', type=Path, default=None,
+        help='Write call/latency/retry metrics here as JSON on exit')
+    parser.add_argument('--metrics-prom', type=Path, default=None,
+        help='Write the same metrics here as a Prometheus text-file snapshot on exit')
 
     args, unknowns = parser.parse_known_args()
-    main(args.behavior, args.conf, unknowns)
+    if args.list_behaviors:
+        for name, module in sorted(behaviors.available().items()):
+            print('{:<24} {}'.format(name, module))
+        parser.exit()
+    if args.metrics_json:
+        atexit.register(REGISTRY.write_json, args.metrics_json)
+    if args.metrics_prom:
+        atexit.register(REGISTRY.write_prometheus, args.metrics_prom)
+    if args.use_async and (args.daemon or args.interval):
+        parser.error('--async runs once; it can\'t be combined with --daemon')
+    if args.daemon and not args.interval:
+        args.interval = 300
+    main(args.behavior, args.conf, unknowns, args.index, args.rebuild_index, args.interval,
+        args.parallelism, args.use_async, args.journal, credentials_path=args.credentials,
+        batch_size=args.batch_size, concurrency=args.concurrency, job_mode=args.job_mode,
+        scheduler=RequestScheduler(rate=args.rate, max_retries=args.max_retries,
+            budget=args.request_budget))
@@ -0,0 +1,350 @@
+'''Asyncio flavor of :class:`autoalbum.api.API`
+
+:class:`AsyncAPI` has the same methods as :class:`autoalbum.api.API`, but as coroutines, with async
+iterators for paged results. Everything goes through one pooled aiohttp session, and a semaphore
+caps how many requests are in flight at once. Scanning many albums (all owned and shared albums,
+several sources, a source and its destination) then overlaps instead of going one at a time:
+
+    >>> async with AsyncAPI.new(client_config, concurrency=8) as api:
+    ...     owned, shared = await asyncio.gather(
+    ...         api.list_all_albums(), api.list_all_albums(is_shared=True))
+
+It talks REST directly rather than through googleapiclient, so ``root_url`` can point it at
+:class:`autoalbum.fakeserver.FakePhotosServer` instead of Google. Requests still go through a
+:class:`autoalbum.scheduler.RequestScheduler` for rate limiting, retries and budgets, and failures
+raise the same ``googleapiclient.errors.HttpError``.
+
+Needs aiohttp: ``pip install autoalbum[async]``. There's no local index support (yet); every
+listing goes to the server.
+'''
+import asyncio
+import json
+
+from autoalbum.api import (MAX_ALBUMS_PAGE_SIZE, MAX_BATCH_SIZE, MAX_MEDIA_ITEMS_PAGE_SIZE,
+    BatchJobError, ChunkResult, _chunked, _page_fields)
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import PAGE_ITEMS_BUCKETS, REGISTRY, instrumented
+from autoalbum.scheduler import RequestScheduler
+
+#: Where the Photos Library API lives
+ROOT_URL = 'https://photoslibrary.googleapis.com/'
+#: Default for how many requests may be in flight at once
+DEFAULT_CONCURRENCY = 8
+
+def _http_error(status, headers, content, url):
+    '''Build the googleapiclient HttpError the sync API would have raised'''
+    import httplib2
+    from googleapiclient.errors import HttpError
+    resp = httplib2.Response({k.lower(): v for k, v in headers.items()})
+    resp.status = status
+    return HttpError(resp, content, uri=url)
+
+def _prefetch(prefetches, coro):
+    '''Start fetching a page in the background, remembering the task in `prefetches`'''
+    task = asyncio.ensure_future(coro)
+    prefetches.add(task)
+    return task
+
+async def _iter_pages(prefetches, method, attr, *args):
+    '''Async twin of :func:`autoalbum.api._iter_pages`: the next page is fetched while the caller
+    is busy with this one
+
+    Prefetch tasks stay in `prefetches` until they've been awaited. A caller that breaks out of
+    ``async for`` early doesn't close this generator, so the last one can outlive the loop over
+    it; :meth:`AsyncAPI.close` cancels and reaps whatever's left.
+    '''
+    pending = _prefetch(prefetches, method(*args, None)) # Assumes page_token is last
+    try:
+        while pending is not None:
+            page = await pending
+            prefetches.discard(pending)
+            page_token = page.get('nextPageToken')
+            pending = _prefetch(prefetches, method(*args, page_token)) if page_token else None
+            items = page.get(attr, [])
+            REGISTRY.inc('autoalbum_pages_fetched_total', attr=attr)
+            REGISTRY.observe('autoalbum_page_items', len(items), PAGE_ITEMS_BUCKETS, attr=attr)
+            yield items
+    finally:
+        # The caller stopped early (or something broke); don't leave the prefetch dangling
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+class AsyncAPI:
+    '''Asyncio convenience API for required Google Photos functionality
+
+    Probably construct this with :meth:`new`, and use it as an async context manager so the HTTP
+    session gets closed.
+
+    Args:
+        creds: Login credentials, e.g. from :func:`autoalbum.auth.get_credentials`. None to send
+            requests unauthenticated (fine for the fake server)
+        root_url (str, optional): Where the API lives. Default :data:`ROOT_URL`
+        concurrency (int, optional): Most requests in flight at once, across all methods.
+            Default :data:`DEFAULT_CONCURRENCY`
+        batch_size (int, optional): Media ids per add/remove call. Default (and max) 50
+        scheduler (autoalbum.scheduler.RequestScheduler, optional): Rate limits, retries and
+            budgets every request. Default: a scheduler with default settings
+        store (autoalbum.credentials.CredentialStore, optional): Where `creds` came from, and
+            where refreshed tokens get shared through. Default: the default store
+    '''
+
+    @staticmethod
+    def new(client_config, scopes=None, credentials_path=None, **kwargs):
+        '''Static factory method for AsyncAPI
+
+        Args:
+            client_config (dict): Contents of a client_secret.json (or similarly named) file from
+                the Google API Console.
+            scopes (list, optional): A list of scope strings for which to authenticate.
+                (Default: :data:`autoalbum.auth.DEFAULT_SCOPES`)
+            credentials_path (PathLike, optional): The shared credentials file.
+                (Default: :func:`autoalbum.credentials.default_credentials_path`)
+            kwargs: Further keyword arguments are forwarded to :class:`AsyncAPI`
+
+        Returns:
+            AsyncAPI: AsyncAPI instance
+        '''
+        from autoalbum.auth import get_credentials
+        from autoalbum.credentials import CredentialStore
+        return AsyncAPI(get_credentials(client_config, scopes, credentials_path),
+            store=CredentialStore(credentials_path), **kwargs)
+
+    def __init__(self, creds=None, root_url=ROOT_URL, concurrency=DEFAULT_CONCURRENCY,
+            batch_size=MAX_BATCH_SIZE, scheduler=None, store=None):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError('AsyncAPI needs aiohttp: pip install autoalbum[async]') from None
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError('batch_size must be between 1 and {}'.format(MAX_BATCH_SIZE))
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        self._aiohttp = aiohttp
+        self.creds = creds
+        self.root_url = root_url if root_url.endswith('/') else root_url + '/'
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.scheduler = scheduler or RequestScheduler()
+        self.store = store
+        self._prefetches = set()
+        self._session = None
+        self._semaphore = None
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        '''Cancel any page prefetches still going, then close the HTTP session'''
+        if self._prefetches:
+            prefetches, self._prefetches = list(self._prefetches), set()
+            for task in prefetches:
+                task.cancel()
+            # Reap them, so nothing's left to fail later against a closed session
+            await asyncio.gather(*prefetches, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        # Made on first use, since aiohttp wants a running event loop
+        if self._session is None:
+            aiohttp = self._aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                raise_for_status=False)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._refresh_lock = asyncio.Lock()
+        return self._session
+
+    async def _headers(self):
+        headers = {'Accept': 'application/json'}
+        if self.creds is not None:
+            if not self.creds.valid:
+                await self._refresh_creds()
+            headers['Authorization'] = 'Bearer {}'.format(self.creds.token)
+        return headers
+
+    async def _refresh_creds(self):
+        '''Refresh the access token off the event loop, once for everybody waiting on it
+
+        The background refresher normally gets there first; this is the fallback. It goes
+        through the credential store like every other refresh, so the new token gets saved for
+        other processes (or picked up from there, if one of them already refreshed).
+        '''
+        async with self._refresh_lock:
+            if self.creds.valid:
+                return
+            if self.store is None:
+                from autoalbum.credentials import CredentialStore
+                self.store = CredentialStore()
+            # File locking and a blocking HTTP round trip; on the loop they would stall every
+            # request in flight
+            await asyncio.get_running_loop().run_in_executor(None, self.store.refresh,
+                self.creds, 'request')
+
+    async def _request(self, method, path, params=None, body=None):
+        '''Send one API call through the scheduler, limited by the concurrency semaphore
+
+        Returns:
+            dict: The decoded JSON response
+        '''
+        session = self._get_session()
+        url = self.root_url + path
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+
+        async def send():
+            async with self._semaphore:
+                headers = await self._headers()
+                async with session.request(method, url, params=params, json=body,
+                        headers=headers) as resp:
+                    content = await resp.read()
+            REGISTRY.inc('autoalbum_http_bytes_received_total', len(content))
+            REGISTRY.inc('autoalbum_http_responses_total', status=str(resp.status))
+            if resp.status >= 300:
+                raise _http_error(resp.status, resp.headers, content, url)
+            return json.loads(content.decode('utf-8')) if content else {}
+
+        return await self.scheduler.execute_async(send,
+            transport_errors=(self._aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    @instrumented
+    async def list_albums(self, is_shared=False, page_token=None, page_size=MAX_ALBUMS_PAGE_SIZE,
+            fields=None):
+        '''Get one page of albums. See :meth:`autoalbum.api.API.list_albums`'''
+        attr = 'sharedAlbums' if is_shared else 'albums'
+        params = {'pageSize': page_size, 'pageToken': page_token,
+            'fields': _page_fields(attr, fields)}
+        return await self._request('GET', 'v1/' + attr, params)
+
+    @instrumented
+    async def iter_all_albums(self, is_shared=False, fields=None):
+        '''Stream all albums, page by page as they arrive
+
+        Yields:
+            dict: Album
+        '''
+        attr = 'sharedAlbums' if is_shared else 'albums'
+        async def method(page_token):
+            return await self.list_albums(is_shared, page_token, fields=fields)
+        async for page in _iter_pages(self._prefetches, method, attr):
+            for album in page:
+                yield album
+
+    @instrumented
+    async def list_all_albums(self, is_shared=False, fields=None):
+        '''Get a list of all albums. See :meth:`autoalbum.api.API.list_all_albums`'''
+        return [album async for album in self.iter_all_albums(is_shared, fields)]
+
+    @instrumented
+    async def get_album(self, album_id, fields=None):
+        '''Get an album's metadata. See :meth:`autoalbum.api.API.get_album`'''
+        return await self._request('GET', 'v1/albums/' + album_id, {'fields': fields})
+
+    @instrumented
+    async def get_album_contents(self, album_id, page_token=None,
+            page_size=MAX_MEDIA_ITEMS_PAGE_SIZE, fields=None):
+        '''Get one page of an album's media items. See
+        :meth:`autoalbum.api.API.get_album_contents`
+        '''
+        body = {'albumId': album_id, 'pageSize': page_size}
+        if page_token:
+            body['pageToken'] = page_token
+        return await self._request('POST', 'v1/mediaItems:search',
+            {'fields': _page_fields('mediaItems', fields)}, body)
+
+    async def _iter_album_pages(self, album_id, fields=None):
+        async def method(page_token):
+            return await self.get_album_contents(album_id, page_token, fields=fields)
+        async for page in _iter_pages(self._prefetches, method, 'mediaItems'):
+            yield page
+
+    @instrumented
+    async def iter_all_album_contents(self, album_id, fields=None):
+        '''Stream all media items in a specified album, page by page as they arrive
+
+        Yields:
+            dict: Media item
+        '''
+        async for page in self._iter_album_pages(album_id, fields):
+            for item in page:
+                yield item
+
+    @instrumented
+    async def iter_album_records(self, album_id, fields=MediaRecord.FIELDS):
+        '''Stream compact records of all media items in a specified album. See
+        :meth:`autoalbum.api.API.iter_album_records`
+
+        Yields:
+            autoalbum.media.MediaRecord: Media item record
+        '''
+        async for page in self._iter_album_pages(album_id, fields):
+            for record in MediaRecord.from_items(page):
+                yield record
+
+    @instrumented
+    async def get_all_album_contents(self, album_id, fields=None):
+        '''Get a list of all media items in a specified album'''
+        return [item async for item in self.iter_all_album_contents(album_id, fields)]
+
+    @instrumented
+    async def get_media_item(self, media_id):
+        '''Get a media item by id. See :meth:`autoalbum.api.API.get_media_item`'''
+        return await self._request('GET', 'v1/mediaItems/' + media_id)
+
+    @instrumented
+    async def create_album(self, title):
+        '''Create a new album. See :meth:`autoalbum.api.API.create_album`'''
+        return await self._request('POST', 'v1/albums', body={'album': {'title': title}})
+
+    @instrumented
+    async def remove_album_media_contents(self, album_id, media_ids):
+        '''Remove media items from an album. See
+        :meth:`autoalbum.api.API.remove_album_media_contents`
+
+        Returns:
+            list: A :class:`autoalbum.api.ChunkResult` per call, in order
+
+        Raises:
+            autoalbum.api.BatchJobError: If any call failed
+        '''
+        return await self._run_album_edit('batchRemoveMediaItems', album_id, media_ids)
+
+    @instrumented
+    async def add_album_media_contents(self, album_id, media_ids):
+        '''Add media items to an album. See :meth:`autoalbum.api.API.add_album_media_contents`
+
+        Returns:
+            list: A :class:`autoalbum.api.ChunkResult` per call, in order
+
+        Raises:
+            autoalbum.api.BatchJobError: If any call failed
+        '''
+        return await self._run_album_edit('batchAddMediaItems', album_id, media_ids)
+
+    async def _run_album_edit(self, action, album_id, media_ids):
+        '''Send a call per chunk of ids, all at once (the semaphore does the limiting)'''
+        chunks = _chunked(list(media_ids), self.batch_size)
+        if not chunks:
+            return []
+        REGISTRY.inc('autoalbum_batch_jobs_total', mode='async')
+
+        async def run_chunk(chunk):
+            try:
+                response = await self._request('POST',
+                    'v1/albums/{}:{}'.format(album_id, action), body={'mediaItemIds': chunk})
+                return ChunkResult(chunk, response, None)
+            except Exception as e:
+                return ChunkResult(chunk, None, e)
+
+        results = await asyncio.gather(*(run_chunk(c) for c in chunks))
+        for r in results:
+            REGISTRY.inc('autoalbum_batch_chunks_total', mode='async',
+                outcome='ok' if r.error is None else 'failed')
+        if any(r.error is not None for r in results):
+            raise BatchJobError(results)
+        return list(results)
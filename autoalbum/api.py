@@ -1,32 +1,97 @@
 '''Defines a convenience API for Google Photos for the needs of this project
 '''
-from autoalbum.auth import get_service
+import functools
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import PAGE_ITEMS_BUCKETS, REGISTRY, CountingHttp, instrumented
+from autoalbum.scheduler import RequestScheduler
+
+# Largest page sizes the Photos Library API will honor
+MAX_ALBUMS_PAGE_SIZE = 50
+MAX_MEDIA_ITEMS_PAGE_SIZE = 100
+# Most media ids batchAddMediaItems/batchRemoveMediaItems accept in one call
+MAX_BATCH_SIZE = 50
+# Most calls Google will take in a single multipart batch request
+MAX_HTTP_BATCH_CALLS = 1000
+#: Default number of threads fetching the next page of listings. One per listing in progress
+PREFETCH_THREADS = 4
+
+#: Ways of running the chunks of a batched album job. See :class:`API`
+JOB_MODES = ('serial', 'threads', 'http_batch')
+#: Default concurrency per job mode: worker threads for "threads", calls per multipart request
+#: for "http_batch"
+JOB_MODE_CONCURRENCY = {'serial': 1, 'threads': 8, 'http_batch': 50}
+
+ChunkResult = namedtuple('ChunkResult', ['media_ids', 'response', 'error'])
+ChunkResult.__doc__ = '''Outcome of one chunk of a batched album job
+
+The media ids that were sent, and either the response or the exception that came back.
+'''
 
-def _get_paged_data(method, attr, *args):
-    '''Utility function to get paged data by repeating calls to provided method
+class BatchJobError(Exception):
+    '''Raised when one or more chunks of a batched album job failed
 
     Args:
+        results (list): :class:`ChunkResult` for every chunk in the job, failed or not
+    '''
+    def __init__(self, results):
+        self.results = results
+        failed = sum(1 for r in results if r.error is not None)
+        super().__init__('{} of {} chunks failed'.format(failed, len(results)))
+
+def _iter_pages(prefetcher, method, attr, *args):
+    '''Generator to get paged data by repeating calls to provided method
+
+    While the caller is busy with one page, the next one is already being fetched on a background
+    thread.
+
+    Args:
+        prefetcher (concurrent.futures.Executor): Where the next page is fetched
         method: A bound method to invoke until we run out of pages. This method's final argument
             must be page_token. Preceding arguments are handled by *args.
-        attr (str): The attr we're interested in aggregating
+        attr (str): The attr we're interested in
         args: Further arguments are forwarded straight to `method`
+
+    Yields:
+        list: The contents of `attr` for each page, in order
     '''
-    data = []
-    page_token = None
-
-    while True:
-        page = method(*args, page_token) # Assumes page_token is last
-        data += page[attr]
-        if 'pageToken' in page:
-            page_token = page['pageToken']
-        else:
-            break
+    pending = prefetcher.submit(method, *args, None) # Assumes page_token is last
+    while pending is not None:
+        page = pending.result()
+        page_token = page.get('nextPageToken')
+        pending = prefetcher.submit(method, *args, page_token) if page_token else None
+        # Empty albums don't get an empty list; they get no key at all
+        items = page.get(attr, [])
+        REGISTRY.inc('autoalbum_pages_fetched_total', attr=attr)
+        REGISTRY.observe('autoalbum_page_items', len(items), PAGE_ITEMS_BUCKETS, attr=attr)
+        yield items
+
+def _iter_paged_data(prefetcher, method, attr, *args):
+    '''Like :func:`_iter_pages`, but yields the individual items instead of whole pages'''
+    for page in _iter_pages(prefetcher, method, attr, *args):
+        yield from page
+
+def _page_fields(attr, fields):
+    '''Turn a per-item field projection into a partial-response mask for a whole page
+
+    Args:
+        attr (str): The attr holding the items, e.g. "mediaItems"
+        fields (str): Projection of each item, e.g. "id,mimeType". None for everything
 
-    return data
+    Returns:
+        str: Mask for the `fields` request parameter (None for everything). nextPageToken is
+            always included, or paging would stop after the first page.
+    '''
+    if not fields:
+        return None
+    return 'nextPageToken,{}({})'.format(attr, fields)
 
-def _run_batched_album_job(method, batch_these, batch_size, *args):
-    for batch in (batch_these[i:i+batch_size] for i in range(0, len(batch_these), batch_size)):
-        method(batch, *args)
+def _chunked(these, size):
+    '''Split a list into consecutive lists of (at most) `size` elements'''
+    return [these[i:i+size] for i in range(0, len(these), size)]
 
 
 class API:
@@ -37,10 +102,31 @@ class API:
     Args:
         service: The service instance from :func:`autoalbum.auth.get_service`
         creds: The login credentials object from :func:`autoalbum.auth.get_service`
+        index (autoalbum.index.MediaIndex, optional): Local index of album contents. If given,
+            :meth:`get_all_album_contents` only goes to Google when an album has changed.
+        batch_size (int, optional): Media ids per add/remove call. Default (and max) 50
+        concurrency (int, optional): How many add/remove calls may be in flight at once. That's
+            worker threads in "threads" mode, or calls per multipart request in "http_batch" mode
+            (the multipart requests themselves go one at a time). Default: the job mode's entry
+            in :data:`JOB_MODE_CONCURRENCY`
+        job_mode (str, optional): How add/remove jobs run their chunks; one of
+            :data:`JOB_MODES`. "serial" sends one call at a time, "threads" dispatches calls from
+            a worker pool and "http_batch" packs them into googleapiclient BatchHttpRequests.
+            Default "serial"
+        scheduler (autoalbum.scheduler.RequestScheduler, optional): Rate limits, retries and
+            budgets every request. Default: a scheduler with default settings
+        journal (autoalbum.journal.Journal, optional): Write-ahead journal for add/remove jobs.
+            If given, a job an earlier run didn't finish can be finished with :meth:`resume`
+        prefetch_threads (int, optional): Threads fetching the next page of listings. Listings
+            beyond this many at once wait their turn. Default :data:`PREFETCH_THREADS`
+
+    The Google client libraries are only imported once something actually needs them. The
+    prefetch threads (and so their connections) live as long as the API does; :meth:`close` it,
+    or use it as a context manager, when done.
     '''
 
     @staticmethod
-    def new(client_config, scopes=None):
+    def new(client_config, scopes=None, index=None, credentials_path=None, **kwargs):
         '''Static factory method for API
 
         Args:
@@ -49,71 +135,299 @@ class API:
             scopes (list, optional): A list of scope strings for which to authenticate.
                 (Default: :data:`autoalbum.auth.DEFAULT_SCOPES`)
                 See: https://developers.google.com/photos/library/guides/authorization
+            index (autoalbum.index.MediaIndex, optional): Local index of album contents
+            credentials_path (PathLike, optional): The shared credentials file.
+                (Default: :func:`autoalbum.credentials.default_credentials_path`)
+            kwargs: Further keyword arguments are forwarded to :class:`API`
 
         Returns:
             API: API instance
         '''
-        return API(*get_service(client_config, scopes))
-
-    def __init__(self, service, creds):
+        from autoalbum.auth import get_service
+        return API(*get_service(client_config, scopes, credentials_path=credentials_path),
+            index=index, **kwargs)
+
+    def __init__(self, service, creds, index=None, batch_size=MAX_BATCH_SIZE, concurrency=None,
+            job_mode='serial', scheduler=None, journal=None, prefetch_threads=PREFETCH_THREADS):
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError('batch_size must be between 1 and {}'.format(MAX_BATCH_SIZE))
+        if job_mode not in JOB_MODES:
+            raise ValueError('job_mode must be one of {}'.format(', '.join(JOB_MODES)))
+        if concurrency is None:
+            concurrency = JOB_MODE_CONCURRENCY[job_mode]
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
         self.service = service
         self.creds = creds
-
-    def list_albums(self, is_shared=False, page_token=None):
+        self.index = index
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.job_mode = job_mode
+        self.scheduler = scheduler or RequestScheduler()
+        self.journal = journal
+        self._local = threading.local()
+        self._scan_locks = {}
+        self._scan_locks_lock = threading.Lock()
+        # Long-lived, so each prefetch thread's connection gets reused from listing to listing
+        self._prefetcher = ThreadPoolExecutor(max_workers=prefetch_threads,
+            thread_name_prefix='autoalbum-prefetch')
+
+    def close(self):
+        '''Stop the prefetch threads. Listings can't be paged through after this'''
+        self._prefetcher.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _http(self):
+        '''Get this thread's Http object (authorized, if we have credentials)
+
+        httplib2 isn't thread-safe, and pages are prefetched on background threads, so each thread
+        gets its own connection. The prefetch threads keep theirs for as long as the API lives.
+        '''
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            import google_auth_httplib2
+            import httplib2
+            http = httplib2.Http() if self.creds is None else \
+                google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http())
+            http = self._local.http = CountingHttp(http)
+        return http
+
+    def _execute(self, request, cost=1):
+        '''Execute a request on this thread's connection, by way of the scheduler'''
+        return self.scheduler.execute(request, self._http(), cost)
+
+    @instrumented
+    def list_albums(self, is_shared=False, page_token=None, page_size=MAX_ALBUMS_PAGE_SIZE,
+            fields=None):
         '''Get a list of albums and metadata
 
         Args:
             is_shared (bool, optional): True if you want to get albums shared with you rather than
                 ones you own. Default False
             page_token (str): Continuation token to get the next page of results
+            page_size (int, optional): Albums per page. Default (and max) 50
+            fields (str, optional): Only return these fields of each album, in partial-response
+                syntax, e.g. "id,title,mediaItemsCount". Default: everything
 
         Returns:
-            list: List of albums' metadata (and pageToken, if present)
+            list: List of albums' metadata (and nextPageToken, if present)
         '''
         album_attr = 'sharedAlbums' if is_shared else 'albums'
-        albums = getattr(self.service, album_attr)().list(pageToken=page_token).execute()
+        kwargs = {'pageToken': page_token, 'pageSize': page_size}
+        if fields:
+            kwargs['fields'] = _page_fields(album_attr, fields)
+        albums = self._execute(getattr(self.service, album_attr)().list(**kwargs))
         return albums
 
-    def list_all_albums(self, is_shared=False):
+    @instrumented
+    def iter_all_albums(self, is_shared=False, fields=None):
+        '''Stream all albums and metadata, page by page as they arrive
+
+        Args:
+            is_shared (bool, optional): True if you want to get albums shared with you rather than
+                ones you own. Default False
+            fields (str, optional): Only return these fields of each album. See
+                :meth:`list_albums`
+
+        Yields:
+            dict: Album metadata
+        '''
+        album_attr = 'sharedAlbums' if is_shared else 'albums'
+        yield from _iter_paged_data(self._prefetcher,
+            functools.partial(self.list_albums, fields=fields), album_attr, is_shared)
+
+    @instrumented
+    def list_all_albums(self, is_shared=False, fields=None):
         '''Get a list of all albums and metadata
 
         Args:
             is_shared (bool, optional): True if you want to get albums shared with you rather than
                 ones you own. Default False
+            fields (str, optional): Only return these fields of each album. See
+                :meth:`list_albums`
 
         Returns:
             list: List of albums' metadata
         '''
-        album_attr = 'sharedAlbums' if is_shared else 'albums'
-        return _get_paged_data(self.list_albums, album_attr, is_shared)
+        return list(self.iter_all_albums(is_shared, fields))
+
+    @instrumented
+    def get_album(self, album_id, fields=None):
+        '''Get a single album's metadata by id
 
-    def get_album_contents(self, album_id, page_token=None):
-        '''Get an album by id
+        This is one cheap call, and the ``mediaItemsCount`` in here is what we use to decide
+        whether an indexed album needs re-scanning.
 
         Args:
-            album_title (str): Title to assign to new album
+            album_id (str): The ID of the album
+            fields (str, optional): Only return these fields, e.g. "mediaItemsCount".
+                Default: everything
 
         Returns:
-            dict: New album metadata
+            dict: Album metadata
+        '''
+        kwargs = {'fields': fields} if fields else {}
+        return self._execute(self.service.albums().get(albumId=album_id, **kwargs))
+
+    @instrumented
+    def get_album_contents(self, album_id, page_token=None, page_size=MAX_MEDIA_ITEMS_PAGE_SIZE,
+            fields=None):
+        '''Get one page of an album's media items
+
+        Args:
+            album_id (str): The ID of the album you want to enumerate
+            page_token (str): Continuation token to get the next page of results
+            page_size (int, optional): Media items per page. Default (and max) 100
+            fields (str, optional): Only return these fields of each media item, in
+                partial-response syntax, e.g. "id,mediaMetadata/creationTime". Default: everything
+
+        Returns:
+            dict: One page of media items (and nextPageToken, if present)
         '''
-        body = {'albumId': album_id}
+        body = {'albumId': album_id, 'pageSize': page_size}
         if page_token:
             body['pageToken'] = page_token
+        kwargs = {'fields': _page_fields('mediaItems', fields)} if fields else {}
 
-        results = self.service.mediaItems().search(body=body).execute()
+        results = self._execute(self.service.mediaItems().search(body=body, **kwargs))
         return results
 
-    def get_all_album_contents(self, album_id):
+    @instrumented
+    def iter_all_album_contents(self, album_id, refresh=False, fields=None):
+        '''Stream all media items in a specified album, page by page as they arrive
+
+        If this API has an index, the album is served from there unless its ``mediaItemsCount``
+        has changed since it was last scanned (or it was scanned with different `fields`).
+        Otherwise pages are written to the index as they go by; the album only counts as current
+        once the whole thing has been read. Scans of one album take turns, so threads listing
+        the same stale album at once page through it from Google only once.
+
+        Args:
+            album_id (str): The ID of the album you want to enumerate
+            refresh (bool, optional): Re-scan the album even if the index looks current
+            fields (str, optional): Only return these fields of each media item. See
+                :meth:`get_album_contents`
+
+        Yields:
+            dict: Media item
+        '''
+        if self.index is None:
+            for page in self._iter_album_pages(album_id, fields):
+                yield from page
+            return
+
+        yield from self._iter_indexed(album_id, refresh, fields, self.index.iter_album,
+            lambda page: page)
+
+    @instrumented
+    def iter_album_records(self, album_id, refresh=False, fields=MediaRecord.FIELDS):
+        '''Stream compact records of all media items in a specified album
+
+        Same as :meth:`iter_all_album_contents`, but yields :class:`autoalbum.media.MediaRecord`
+        instead of full dicts, and only asks Google for the fields a record needs. When the
+        album comes out of the index, the full items are never even decoded.
+
+        Args:
+            album_id (str): The ID of the album you want to enumerate
+            refresh (bool, optional): Re-scan the album even if the index looks current
+            fields (str, optional): Fields to ask for. Must cover :data:`MediaRecord.FIELDS`.
+                Default :data:`MediaRecord.FIELDS`
+
+        Yields:
+            autoalbum.media.MediaRecord: Media item record
+        '''
+        # A page at a time, so the timestamps get parsed in batches
+        if self.index is None:
+            for page in self._iter_album_pages(album_id, fields):
+                yield from MediaRecord.from_items(page)
+        else:
+            yield from self._iter_indexed(album_id, refresh, fields,
+                self.index.iter_album_records, MediaRecord.from_items)
+
+    def _iter_album_pages(self, album_id, fields=None):
+        return _iter_pages(self._prefetcher,
+            functools.partial(self.get_album_contents, fields=fields), 'mediaItems', album_id)
+
+    def _check_index(self, album_id, refresh=False, fields=None):
+        '''Is the indexed copy of an album current? Also returns its mediaItemsCount'''
+        count = self.get_album(album_id, fields='mediaItemsCount').get('mediaItemsCount', 0)
+        return not refresh and self.index.is_current(album_id, count, fields), count
+
+    def _iter_indexed(self, album_id, refresh, fields, from_index, from_page):
+        '''Stream an album out of the index if it's current, otherwise scan it
+
+        Scans of one album take turns: if another thread is scanning it, we wait for that to
+        finish and then look again, which usually means reading what it just indexed instead of
+        paging through the whole album a second time.
+
+        Args:
+            from_index (callable): Takes the album ID, returns an iterator over the indexed copy
+            from_page (callable): Takes a page of media items from Google, returns an iterator
+        '''
+        current, count = self._check_index(album_id, refresh, fields)
+        if not current:
+            lock = self._scan_lock(album_id)
+            if not lock.acquire(blocking=False):
+                lock.acquire()
+                current, count = self._check_index(album_id, refresh, fields)
+            try:
+                if not current:
+                    for page in self._scan_album_pages(album_id, count, fields):
+                        yield from from_page(page)
+                    return
+            finally:
+                lock.release()
+        yield from from_index(album_id)
+
+    def _scan_lock(self, album_id):
+        '''The lock that scans of an album take turns with'''
+        with self._scan_locks_lock:
+            # Reentrant, so a thread can nest listings of one album without waiting on itself
+            return self._scan_locks.setdefault(album_id, threading.RLock())
+
+    def _scan_album_pages(self, album_id, count, fields=None):
+        '''Page through an album from Google, writing it to the index on the way past'''
+        scan = self.index.scan(album_id, fields)
+        for page in self._iter_album_pages(album_id, fields):
+            scan.add(page)
+            yield page
+        scan.commit(count)
+
+    @instrumented
+    def get_all_album_contents(self, album_id, refresh=False, fields=None):
         '''Get a list of all media items in a specified album
 
+        See :meth:`iter_all_album_contents` if you don't need them all in memory at once.
+
         Args:
             album_id (str): The ID of the album you want to enumerate
+            refresh (bool, optional): Re-scan the album even if the index looks current
+            fields (str, optional): Only return these fields of each media item. See
+                :meth:`get_album_contents`
 
         Returns:
             list: List of albums' media items
         '''
-        return _get_paged_data(self.get_album_contents, 'mediaItems', album_id)
+        return list(self.iter_all_album_contents(album_id, refresh, fields))
+
+    @instrumented
+    def get_media_item(self, media_id):
+        '''Get a single media item by id, in full
+
+        Args:
+            media_id (str): The ID of the media item
+
+        Returns:
+            dict: Media item
+        '''
+        return self._execute(self.service.mediaItems().get(mediaItemId=media_id))
 
+    @instrumented
     def create_album(self, album_title):
         '''Create a new album by title
 
@@ -123,27 +437,224 @@ class API:
         Returns:
             dict: New album metadata
         '''
-        album = self.service.albums().create(body={'album': {'title':album_title}}).execute()
+        album = self._execute(self.service.albums().create(body={'album': {'title':album_title}}))
         return album
 
+    @instrumented
     def remove_album_media_contents(self, album_id, media_ids):
         '''Run (potentially batched) calls to remove media from an album
+
+        Args:
+            album_id (str): The ID of the album to remove media from
+            media_ids (list): IDs of the media items to remove
+
+        Returns:
+            list: A :class:`ChunkResult` per chunk
+
+        Raises:
+            BatchJobError: If any chunk failed. The exception carries every chunk's result.
         '''
-        _run_batched_album_job(self._remove_album_media_batch, media_ids, 50, album_id)
+        return self._run_album_edit('remove', album_id, media_ids)
 
     def _remove_album_media_batch(self, media_ids, album_id):
-        self.service.albums().batchRemoveMediaItems(
+        return self.service.albums().batchRemoveMediaItems(
             albumId=album_id,
             body={'mediaItemIds': media_ids},
-        ).execute()
+        )
 
+    @instrumented
     def add_album_media_contents(self, album_id, media_ids):
         '''Run (potentially batched) calls to add media to an album
+
+        Args:
+            album_id (str): The ID of the album to add media to
+            media_ids (list): IDs of the media items to add
+
+        Returns:
+            list: A :class:`ChunkResult` per chunk
+
+        Raises:
+            BatchJobError: If any chunk failed. The exception carries every chunk's result.
         '''
-        _run_batched_album_job(self._add_album_media_batch, media_ids, 50, album_id)
+        return self._run_album_edit('add', album_id, media_ids)
 
     def _add_album_media_batch(self, media_ids, album_id):
-        self.service.albums().batchAddMediaItems(
+        return self.service.albums().batchAddMediaItems(
             albumId=album_id,
             body={'mediaItemIds': media_ids},
-        ).execute()
+        )
+
+    def _edit_request(self, action):
+        '''The request factory for an album edit action, "add" or "remove"'''
+        return {'add': self._add_album_media_batch,
+            'remove': self._remove_album_media_batch}[action]
+
+    def _run_album_edit(self, action, album_id, media_ids):
+        if not media_ids:
+            return []
+        # An add and a remove of the same size leave mediaItemsCount alone, so the index can't be
+        # trusted to notice this change on its own. Forget the album before touching it too, in
+        # case this run doesn't live to do it afterwards
+        self._forget_album(album_id)
+        try:
+            return self._run_batched_album_job(self._edit_request(action), media_ids, album_id,
+                action=action)
+        finally:
+            self._forget_album(album_id)
+
+    def _forget_album(self, album_id):
+        if self.index is not None:
+            self.index.clear(album_id)
+
+    @instrumented
+    def _run_batched_album_job(self, make_request, batch_these, *args, action=None):
+        '''Split ids into chunks and send a request per chunk, as configured by `job_mode`
+
+        With a :attr:`journal` and an `action`, the chunks are journaled before anything is sent,
+        and each one as it goes through. An unfinished job for the same album and action counts
+        as superseded by this one and is ended; only :meth:`resume` replays unfinished jobs.
+
+        Args:
+            make_request: A bound method taking a chunk of ids (then *args) and returning the
+                unexecuted request for it
+            batch_these (list): Everything that needs sending
+            args: Further arguments are forwarded straight to `make_request`. For a journaled job,
+                the first is the album id
+            action (str, optional): "add" or "remove", to journal the job under
+
+        Returns:
+            list: A :class:`ChunkResult` per chunk, in order
+        '''
+        batch_these = list(batch_these)
+        if self.journal is None or action is None:
+            return self._run_chunks(make_request, _chunked(batch_these, self.batch_size), args)
+
+        album_id = args[0]
+        # `batch_these` was worked out from the album as it is now, so it's sent in full: what an
+        # old job got through may have been undone since (or never fully landed)
+        superseded = self.journal.unfinished(action, album_id)
+        # Plan the new job before letting go of the old ones, so a crash in between loses nothing
+        job = self.journal.plan(action, album_id, _chunked(batch_these, self.batch_size))
+        for old in superseded:
+            self.journal.end(old)
+        return self._run_journaled(make_request, job, list(range(len(job.chunks))))
+
+    @instrumented
+    def resume(self):
+        '''Finish the add/remove jobs an earlier run left unfinished, according to the journal
+
+        Only chunks that never went through are sent. Does nothing without a :attr:`journal`.
+
+        Returns:
+            list: A :class:`ChunkResult` per chunk sent
+
+        Raises:
+            BatchJobError: If any chunk failed. Its job stays unfinished, for next time
+        '''
+        if self.journal is None:
+            return []
+        results = []
+        for job in self.journal.unfinished():
+            self._forget_album(job.album_id)
+            pending = job.pending
+            REGISTRY.inc('autoalbum_journal_chunks_replayed_total', len(pending))
+            try:
+                results += self._run_journaled(self._edit_request(job.action), job, pending)
+            except BatchJobError as e:
+                results += e.results
+            finally:
+                self._forget_album(job.album_id)
+        if any(r.error is not None for r in results):
+            raise BatchJobError(results)
+        return results
+
+    def _run_journaled(self, make_request, job, indices):
+        '''Send chunks `indices` of a journaled job, marking each done as it goes through, and
+        end the job if they all did
+        '''
+        def on_success(position):
+            self.journal.done(job, indices[position])
+        results = self._run_chunks(make_request, [job.chunks[i] for i in indices],
+            (job.album_id,), on_success)
+        self.journal.end(job)
+        return results
+
+    def _run_chunks(self, make_request, chunks, args, on_success=None):
+        '''Send a request per chunk, as configured by `job_mode`
+
+        Args:
+            make_request: See :meth:`_run_batched_album_job`
+            chunks (list): Lists of ids, one per request
+            args (tuple): Forwarded to `make_request`
+            on_success (callable, optional): Called with a chunk's position as soon as it has
+                gone through
+
+        Returns:
+            list: A :class:`ChunkResult` per chunk, in order
+
+        Raises:
+            BatchJobError: If any chunk failed
+        '''
+        REGISTRY.inc('autoalbum_batch_jobs_total', mode=self.job_mode)
+
+        def run(position, chunk):
+            result = self._run_chunk(make_request, chunk, *args)
+            if result.error is None and on_success is not None:
+                on_success(position)
+            return result
+
+        if self.job_mode == 'http_batch':
+            results = []
+            # One multipart request per `concurrency` chunks, sent one after another
+            step = min(self.concurrency, MAX_HTTP_BATCH_CALLS)
+            for start, group in zip(range(0, len(chunks), step), _chunked(chunks, step)):
+                group_results = self._run_http_batch(make_request, group, *args)
+                for position, r in enumerate(group_results, start):
+                    if r.error is None and on_success is not None:
+                        on_success(position)
+                results += group_results
+        elif self.job_mode == 'threads' and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(run, range(len(chunks)), chunks))
+        else:
+            results = [run(position, c) for position, c in enumerate(chunks)]
+
+        for r in results:
+            REGISTRY.inc('autoalbum_batch_chunks_total', mode=self.job_mode,
+                outcome='ok' if r.error is None else 'failed')
+        if any(r.error is not None for r in results):
+            raise BatchJobError(results)
+        return results
+
+    def _run_chunk(self, make_request, chunk, *args):
+        try:
+            return ChunkResult(chunk, self._execute(make_request(chunk, *args)), None)
+        except Exception as e:
+            return ChunkResult(chunk, None, e)
+
+    def _run_http_batch(self, make_request, chunks, *args):
+        '''Send several chunks in one multipart HTTP request'''
+        results = [None] * len(chunks)
+
+        def callback(request_id, response, exception):
+            idx = int(request_id)
+            results[idx] = ChunkResult(chunks[idx], response, exception)
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for idx, chunk in enumerate(chunks):
+            batch.add(make_request(chunk, *args), request_id=str(idx))
+        try:
+            self._execute(batch, cost=len(chunks))
+        except Exception as e:
+            # The batch as a whole didn't make it; blame every chunk that didn't hear back
+            return [r or ChunkResult(c, None, e) for r, c in zip(results, chunks)]
+
+        # Calls inside a batch fail (and get throttled) individually. Everyone backs off, then the
+        # unlucky chunks are retried one by one through the scheduler
+        throttled = [r.error for r in results if self.scheduler.is_retryable(r.error)]
+        REGISTRY.inc('autoalbum_quota_errors_total',
+            sum(1 for e in throttled if self.scheduler.is_quota_error(e)))
+        if throttled:
+            self.scheduler.bucket.pause(self.scheduler.retry_delay(0, throttled[0]))
+        return [self._run_chunk(make_request, r.media_ids, *args)
+            if self.scheduler.is_retryable(r.error) else r for r in results]
@@ -1,14 +1,11 @@
 '''Google OAuth2 utilities
 
-TODO sources
+Credentials are kept in a shared :class:`autoalbum.credentials.CredentialStore` and refreshed in
+the background; see :mod:`autoalbum.credentials`.
 '''
 
-import os
-import pickle
-
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from autoalbum.credentials import CredentialStore, TokenRefresher
+from autoalbum.discovery import build_service
 
 DEFAULT_SCOPES = [
     'https://www.googleapis.com/auth/photoslibrary.edit.appcreateddata',
@@ -16,7 +13,31 @@ DEFAULT_SCOPES = [
     'https://www.googleapis.com/auth/photoslibrary.readonly',
 ]
 
-def get_service(client_config, scopes=None):
+def get_credentials(client_config, scopes=None, credentials_path=None, refresh_ahead=True):
+    '''Get login credentials from the shared store, logging in if need be
+
+    Args:
+        client_config (dict): Contents of a client_secret.json (or similarly named) file from the
+            Google API Console.
+        scopes (list, optional): A list of scope strings for which to authenticate.
+            (Default: :data:`autoalbum.auth.DEFAULT_SCOPES`)
+        credentials_path (PathLike, optional): The shared credentials file.
+            (Default: :func:`autoalbum.credentials.default_credentials_path`)
+        refresh_ahead (bool, optional): Keep the access token fresh from a background thread.
+            (Default: True)
+
+    Returns:
+        google.oauth2.credentials.Credentials: Login credentials
+    '''
+    # Logs in (or refreshes) only if the stored credentials won't do
+    store = CredentialStore(credentials_path)
+    creds = store.get(client_config, scopes or DEFAULT_SCOPES)
+    if refresh_ahead:
+        TokenRefresher(store, creds).start()
+    return creds
+
+def get_service(client_config, scopes=None, cache_dir=None, credentials_path=None,
+        refresh_ahead=True):
     '''Create an authenticated google APIClient service
 
     Args:
@@ -25,25 +46,16 @@ def get_service(client_config, scopes=None):
         scopes (list, optional): A list of scope strings for which to authenticate.
             (Default: :data:`autoalbum.auth.DEFAULT_SCOPES`)
             See: https://developers.google.com/photos/library/guides/authorization
+        cache_dir (PathLike, optional): Where the discovery document is cached.
+            (Default: :func:`autoalbum.discovery.default_cache_dir`)
+        credentials_path (PathLike, optional): The shared credentials file.
+            (Default: :func:`autoalbum.credentials.default_credentials_path`)
+        refresh_ahead (bool, optional): Keep the access token fresh from a background thread.
+            (Default: True)
 
     Returns:
         tuple: The service instance and login credentials object used for authentication
     '''
-    scopes = scopes or DEFAULT_SCOPES
-
-    creds = None
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_config(client_config, scopes)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
-    service = build('photoslibrary', 'v1', credentials=creds)
+    creds = get_credentials(client_config, scopes, credentials_path, refresh_ahead)
+    service = build_service(creds, cache_dir)
     return service, creds
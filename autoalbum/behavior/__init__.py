@@ -0,0 +1,83 @@
+'''Behaviors: what a job actually does with its source and destination albums
+
+A behavior is a module with ``SCOPES``, ``parse_args(args)`` and ``run(api, conf_data, ...)``
+(and optionally ``fingerprint(api, conf_data)``; see :mod:`autoalbum.runner`). They're looked up
+by name, without importing any of them until one is asked for:
+
+1. Behaviors that ship with autoalbum, from :data:`BUILTIN`
+2. Dotted module paths, imported as-is (``mypackage.my_behavior``)
+3. Behaviors other packages register under the :data:`ENTRY_POINT_GROUP` entry point group::
+
+       setup(..., entry_points={'autoalbum.behaviors': ['mine = mypackage.my_behavior']})
+
+4. Anything else is tried as a top-level module on the path
+'''
+import importlib
+
+#: Entry point group other packages register behaviors under
+ENTRY_POINT_GROUP = 'autoalbum.behaviors'
+
+#: Behaviors that ship with autoalbum: name to module. The one list of them; entry points are only
+#: for other packages' behaviors
+BUILTIN = {
+    'date_window': 'autoalbum.behavior.date_window',
+    'dedupe': 'autoalbum.behavior.dedupe',
+    'n_most_recent': 'autoalbum.behavior.n_most_recent',
+    'random_sample': 'autoalbum.behavior.random_sample',
+}
+
+_entry_points = None
+
+def entry_points():
+    '''Behaviors registered by installed packages
+
+    Reading package metadata isn't free, so this only happens when a lookup gets this far, and
+    only once.
+
+    Returns:
+        dict: Behavior name to entry point
+    '''
+    global _entry_points
+    if _entry_points is None:
+        try:
+            from importlib.metadata import entry_points as all_entry_points
+        except ImportError:
+            # Python 3.7 has no importlib.metadata; plugins need 3.8+
+            found = []
+        else:
+            eps = all_entry_points()
+            # Python 3.10+ returns EntryPoints; older versions a dict of groups
+            found = eps.select(group=ENTRY_POINT_GROUP) if hasattr(eps, 'select') \
+                else eps.get(ENTRY_POINT_GROUP, [])
+        _entry_points = {ep.name: ep for ep in found}
+    return _entry_points
+
+def available():
+    '''Every behavior that can be loaded by name
+
+    Returns:
+        dict: Behavior name to module (or entry point value)
+    '''
+    names = {name: ep.value for name, ep in entry_points().items()}
+    names.update(BUILTIN)
+    return names
+
+def load(name):
+    '''Load a behavior module by name
+
+    Args:
+        name (str): A registered behavior name, or a module path
+
+    Returns:
+        The behavior module
+
+    Raises:
+        ImportError: If there's no such behavior
+    '''
+    if name in BUILTIN:
+        return importlib.import_module(BUILTIN[name])
+    if '.' in name:
+        return importlib.import_module(name)
+    if name in entry_points():
+        return entry_points()[name].load()
+    return importlib.import_module(name)
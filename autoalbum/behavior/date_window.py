@@ -0,0 +1,358 @@
+'''Syncs the photos taken within a date window ("last 30 days", "on this day") into destination
+
+Re-scanning and re-sorting the whole source album every run (as :mod:`n_most_recent` does) is
+wasted work for windows. Instead, this behavior keeps a :class:`Timeline` of the source album on
+disk: the (creation time, id) of every image, in time order.
+
+* Each window is then two binary searches. "On this day" over twenty years is twenty windows,
+  which still takes microseconds.
+* The timeline is only brought up to date when the source album's fingerprint changes. Even then
+  only newly seen items are sorted and merged in, and items gone from the album are dropped.
+
+Windows are in local time, at the UTC offset in effect when the behavior runs. Every day the
+windows move, so :func:`fingerprint` changes at midnight even if the source album doesn't.
+'''
+import argparse
+import bisect
+import heapq
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from autoalbum import diff
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import REGISTRY
+from autoalbum.runner import source_fingerprint
+
+# Scopes required for this behavior
+SCOPES = [
+    'https://www.googleapis.com/auth/photoslibrary.edit.appcreateddata',
+    'https://www.googleapis.com/auth/photoslibrary.appendonly',
+    'https://www.googleapis.com/auth/photoslibrary.readonly',
+]
+
+# Media item fields this behavior reads off the source album
+FIELDS = MediaRecord.FIELDS
+
+# Bump this if the layout of the timeline file changes, so that old ones are simply rebuilt
+_TIMELINE_FORMAT = 1
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+def parse_args(args):
+    '''Parse arguments the caller's parser didn't understand
+
+    Args:
+        args (list): Forwarded list of arguments from the CLI
+
+    Returns:
+        The Namespace object resulting from parse_args
+    '''
+    parser = argparse.ArgumentParser(description='Photos from a date window')
+    window = parser.add_mutually_exclusive_group()
+    window.add_argument('--last', type=int, default=None, metavar='DAYS',
+        help='Photos from the last DAYS days, today included')
+    window.add_argument('--on-this-day', action='store_true',
+        help="Photos taken on today's date in any earlier year")
+    window.add_argument('--since', type=date.fromisoformat, default=None, metavar='YYYY-MM-DD',
+        help='Photos from this date on (see --until)')
+    parser.add_argument('--until', type=date.fromisoformat, default=None, metavar='YYYY-MM-DD',
+        help='With --since, photos up to and including this date. Default: today')
+    parser.add_argument('--days-around', type=int, default=0, metavar='DAYS',
+        help='With --on-this-day, also take this many days either side. Default 0')
+    parser.add_argument('-n', type=int, default=None,
+        help='At most this many images, the most recent ones. Default: all of them')
+    parser.add_argument('--timeline', type=Path, default=None, metavar='PATH',
+        help="Where to keep the source album's timeline. Default: timeline-<album id>.json "
+            'next to the local album index')
+    parser.add_argument('--dry-run', nargs='?', const='-', default=None, metavar='PATH',
+        help="Write the add/remove plan as JSON (to PATH, or stdout) instead of applying it")
+    parsed = parser.parse_args(args)
+    if parsed.last is None and not parsed.on_this_day and parsed.since is None:
+        parsed.last = 30
+    if parsed.until is not None and parsed.since is None:
+        parser.error('--until needs --since')
+    return parsed
+
+def _micros(moment):
+    '''An aware datetime as microseconds since the epoch'''
+    return (moment - _EPOCH) // _MICROSECOND
+
+def _midnight(day, tz):
+    return _micros(datetime(day.year, day.month, day.day, tzinfo=tz))
+
+
+class Timeline:
+    '''Sorted (timestamp, id) index of an album's images, kept on disk
+
+    Timestamps are microseconds since the epoch, as in :class:`autoalbum.media.MediaRecord`. The
+    two are kept as parallel lists sorted by (timestamp, id), so range queries are
+    :mod:`bisect` calls on ``timestamps``.
+
+    Args:
+        path (PathLike): The timeline file. Created if it doesn't exist
+        album_id (str): The album it's a timeline of
+    '''
+
+    def __init__(self, path, album_id):
+        self.path = Path(path)
+        self.album_id = album_id
+        self.fingerprint = None
+        self.timestamps = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self):
+        '''Read the timeline from disk, if it's there and belongs to this album
+
+        Returns:
+            Timeline: self
+        '''
+        try:
+            with open(str(self.path)) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return self
+        if data.get('format') != _TIMELINE_FORMAT or data.get('album_id') != self.album_id:
+            return self
+        self.fingerprint = data['fingerprint']
+        self.timestamps = data['timestamps']
+        self.ids = data['ids']
+        return self
+
+    def save(self):
+        '''Write the timeline to disk (atomically)'''
+        data = {'format': _TIMELINE_FORMAT, 'album_id': self.album_id,
+            'fingerprint': self.fingerprint, 'timestamps': self.timestamps, 'ids': self.ids}
+        tmp = self.path.with_name('{}.{}.{}.tmp'.format(
+            self.path.name, os.getpid(), threading.get_ident()))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(str(tmp), 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(str(tmp), str(self.path))
+
+    def is_current(self, fingerprint):
+        '''Was the timeline last brought up to date at this album fingerprint?'''
+        # JSON has no tuples, so compare as lists
+        return self.fingerprint is not None and self.fingerprint == list(fingerprint)
+
+    def update(self, records, fingerprint=None):
+        '''Bring the timeline in line with the album's current contents
+
+        Items already on the timeline stay where they are. Only the new ones get sorted, and are
+        then merged in with one linear pass. Items no longer in the album are dropped.
+
+        Args:
+            records (iterable): :class:`autoalbum.media.MediaRecord` of everything in the album.
+                Only images go on the timeline
+            fingerprint (tuple, optional): The album fingerprint these records are current for
+
+        Returns:
+            tuple: How many items were added and how many removed
+        '''
+        known = set(self.ids)
+        seen = set()
+        new = []
+        for m in records:
+            if not m.is_image or m.id in seen:
+                continue
+            seen.add(m.id)
+            if m.id not in known:
+                new.append((m.timestamp, m.id))
+        new.sort()
+
+        removed = len(known - seen)
+        old = zip(self.timestamps, self.ids)
+        if removed:
+            old = ((t, i) for t, i in old if i in seen)
+        merged = list(heapq.merge(old, new)) if new else list(old)
+        self.timestamps = [t for t, _ in merged]
+        self.ids = [i for _, i in merged]
+        self.fingerprint = list(fingerprint) if fingerprint is not None else None
+        return len(new), removed
+
+    def between(self, start, stop):
+        '''Ids of images taken in ``[start, stop)``, oldest first
+
+        Args:
+            start (int): Microseconds since the epoch, inclusive
+            stop (int): Microseconds since the epoch, exclusive
+
+        Returns:
+            list: Media item ids
+        '''
+        lo = bisect.bisect_left(self.timestamps, start)
+        hi = bisect.bisect_left(self.timestamps, stop, lo)
+        return self.ids[lo:hi]
+
+    def window(self, windows):
+        '''Ids of images in any of `windows`, oldest first
+
+        Args:
+            windows (iterable): ``(start, stop)`` pairs, as for :meth:`between`. Overlapping
+                windows don't list an image twice
+
+        Returns:
+            list: Media item ids
+        '''
+        spans = []
+        for start, stop in windows:
+            lo = bisect.bisect_left(self.timestamps, start)
+            hi = bisect.bisect_left(self.timestamps, stop, lo)
+            if lo < hi:
+                spans.append((lo, hi))
+        ids = []
+        end = 0
+        for lo, hi in sorted(spans):
+            lo = max(lo, end)
+            ids += self.ids[lo:hi]
+            end = max(end, hi)
+        return ids
+
+    @property
+    def first(self):
+        '''Timestamp of the oldest image, or None for an empty timeline'''
+        return self.timestamps[0] if self.timestamps else None
+
+def last_days(days, today, tz):
+    '''The window covering the last `days` days, `today` included
+
+    Returns:
+        list: One ``(start, stop)`` pair in microseconds since the epoch
+    '''
+    return [(_midnight(today - timedelta(days=days - 1), tz),
+        _midnight(today + timedelta(days=1), tz))]
+
+def date_range(since, until, tz):
+    '''The window from `since` to `until`, both days included
+
+    Returns:
+        list: One ``(start, stop)`` pair in microseconds since the epoch
+    '''
+    return [(_midnight(since, tz), _midnight(until + timedelta(days=1), tz))]
+
+def anniversaries(today, tz, first, days_around=0):
+    '''A window per earlier year for `today`'s date, back to the year of `first`
+
+    February 29th only has a window in leap years.
+
+    Args:
+        today (datetime.date): Whose date to look for
+        tz (datetime.tzinfo): Time zone days start and end in
+        first (int): Microseconds since the epoch of the oldest image there is. None for none
+        days_around (int, optional): Widen each window by this many days either side
+
+    Returns:
+        list: ``(start, stop)`` pairs in microseconds since the epoch, most recent year first
+    '''
+    if first is None:
+        return []
+    oldest = (_EPOCH + first * _MICROSECOND).astimezone(tz).year
+    windows = []
+    for year in range(today.year - 1, oldest - 1, -1):
+        try:
+            day = today.replace(year=year)
+        except ValueError:
+            continue
+        windows.append((_midnight(day - timedelta(days=days_around), tz),
+            _midnight(day + timedelta(days=days_around + 1), tz)))
+    return windows
+
+def windows_for(timeline, last=None, on_this_day=False, since=None, until=None, days_around=0,
+        now=None):
+    '''The windows the behavior's arguments ask for
+
+    Args:
+        timeline (Timeline): For "on this day", how far back to go
+        now (datetime.datetime, optional): Aware local time to measure from. Default: now
+
+    Returns:
+        list: ``(start, stop)`` pairs in microseconds since the epoch
+    '''
+    now = now or datetime.now().astimezone()
+    tz = now.tzinfo
+    today = now.date()
+    if on_this_day:
+        return anniversaries(today, tz, timeline.first, days_around)
+    if since is not None:
+        return date_range(since, until or today, tz)
+    return last_days(last, today, tz)
+
+def timeline_path(api, album_id, path=None):
+    '''Where the timeline for `album_id` lives: `path`, or next to the API's index'''
+    if path is not None:
+        return Path(path)
+    index = getattr(api, 'index', None)
+    directory = Path(index.path).parent if index is not None else Path()
+    return directory / 'timeline-{}.json'.format(album_id)
+
+def fingerprint(api, conf_data):
+    '''The source album's fingerprint, plus today's date: windows move at midnight'''
+    return source_fingerprint(api, conf_data) + (date.today(),)
+
+def select(timeline, n=None, **window_args):
+    '''Ids of the images to sync: those in the windows, only the `n` most recent if given'''
+    ids = timeline.window(windows_for(timeline, **window_args))
+    if n is not None:
+        ids = ids[-n:] if n > 0 else []
+    return ids
+
+def run(api, conf_data, last=None, on_this_day=False, since=None, until=None, days_around=0,
+        n=None, timeline=None, dry_run=None):
+    '''Run logic. See module comments
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        conf_data (dict): Configuration data from your configuration file
+        last (int, optional): Photos from the last this many days
+        on_this_day (bool, optional): Photos from today's date in earlier years
+        since (datetime.date, optional): Photos from this date on...
+        until (datetime.date, optional): ...up to this one. Default: today
+        days_around (int, optional): Widen "on this day" windows by this many days either side
+        n (int, optional): At most this many, the most recent ones
+        timeline (PathLike, optional): The timeline file. Default: see :func:`timeline_path`
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+
+    Returns:
+        diff.SyncPlan: The plan
+    '''
+    source = conf_data['source']['id']
+    line = Timeline(timeline_path(api, source, timeline), source).load()
+    with REGISTRY.phase('fetch'):
+        current = source_fingerprint(api, conf_data)
+        if not line.is_current(current):
+            line.update(api.iter_album_records(source, fields=FIELDS), current)
+            line.save()
+    with REGISTRY.phase('select'):
+        ids = select(line, n, last=last, on_this_day=on_this_day, since=since, until=until,
+            days_around=days_around)
+    return diff.sync_album(api, conf_data['destination']['id'], ids, dry_run)
+
+async def run_async(api, conf_data, last=None, on_this_day=False, since=None, until=None,
+        days_around=0, n=None, timeline=None, dry_run=None):
+    '''Same as :func:`run`, on an :class:`autoalbum.aio.AsyncAPI`
+
+    The timeline goes next to the working directory unless `timeline` says otherwise.
+    '''
+    source = conf_data['source']['id']
+    destination = conf_data['destination']['id']
+    line = Timeline(timeline_path(api, source, timeline), source).load()
+    with REGISTRY.phase('fetch'):
+        album = await api.get_album(source, fields='mediaItemsCount,coverPhotoMediaItemId')
+        current = (album.get('mediaItemsCount'), album.get('coverPhotoMediaItemId'))
+        if not line.is_current(current):
+            records = [m async for m in api.iter_album_records(source, fields=FIELDS)]
+            line.update(records, current)
+            line.save()
+        current_ids = await diff.collect_media_ids_async(api, destination)
+    with REGISTRY.phase('select'):
+        ids = select(line, n, last=last, on_this_day=on_this_day, since=since, until=until,
+            days_around=days_around)
+    with REGISTRY.phase('diff'):
+        plan = diff.plan_sync(destination, ids, current_ids)
+    await diff.apply_or_write_plan_async(api, plan, dry_run)
+    return plan
@@ -0,0 +1,287 @@
+'''Syncs source into destination with near-duplicates (burst shots and the like) thinned out
+
+Every image's thumbnail is downloaded through its ``baseUrl`` and given a perceptual hash (see
+:mod:`autoalbum.perceptual`). Images whose hashes are within ``--distance`` bits of each other
+count as one cluster, and only the most recent of each survives. Optionally only the newest
+``-n`` of the survivors go on to the destination.
+
+* Downloads run on a bounded thread pool (``--downloads`` at once).
+* Hashing runs on a process pool (``--workers``, default one per core). Each batch is hashed
+  while the next one downloads.
+* Hashes are cached on disk by media id (``--hash-cache``), so an image is only downloaded and
+  hashed once. After that, a run costs the album listing and nothing more.
+* Clusters come from a :class:`autoalbum.perceptual.MultiIndex`, which checks each image
+  against the survivors so far without comparing every pair.
+
+``baseUrl`` links expire after an hour. If a download fails, the media item is fetched again for
+a fresh link and the download is retried once. Images that still can't be hashed are kept.
+
+It's a :class:`autoalbum.pipeline.Pipeline`: source -> images only -> hash -> dedupe -> newest
+`n` -> sync.
+'''
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import REGISTRY
+from autoalbum.perceptual import HASH_SIZE, HashCache, MultiIndex, decoder, hash_images
+from autoalbum.pipeline import Pipeline, Source, Stage, images, sync_to, top
+
+# Scopes required for this behavior
+SCOPES = [
+    'https://www.googleapis.com/auth/photoslibrary.edit.appcreateddata',
+    'https://www.googleapis.com/auth/photoslibrary.appendonly',
+    'https://www.googleapis.com/auth/photoslibrary.readonly',
+]
+
+# Media item fields this behavior reads off the source album
+FIELDS = MediaRecord.FIELDS + ',baseUrl'
+#: Default thumbnail size (pixels per side) to hash
+THUMBNAIL_SIZE = 64
+#: Default most bits two hashes may differ by and still count as near-duplicates
+DISTANCE = 6
+#: Default downloads in flight at once
+DOWNLOADS = 8
+# Images looked up in the cache (and downloaded) per round
+_BATCH = 500
+_TIMEOUT = 30
+
+def parse_args(args):
+    '''Parse arguments the caller's parser didn't understand
+
+    Args:
+        args (list): Forwarded list of arguments from the CLI
+
+    Returns:
+        The Namespace object resulting from parse_args
+    '''
+    parser = argparse.ArgumentParser(description='Photos without near-duplicates')
+    parser.add_argument('-n', type=int, default=None,
+        help='Only the most recent this many images, after deduplication. Default: all of them')
+    parser.add_argument('--distance', type=int, default=DISTANCE,
+        help='Most bits (of 64) two images may differ by and count as near-duplicates. '
+            'Default {}'.format(DISTANCE))
+    parser.add_argument('--thumbnail-size', type=int, default=THUMBNAIL_SIZE, metavar='PIXELS',
+        help='Size of the thumbnails to hash. Default {}'.format(THUMBNAIL_SIZE))
+    parser.add_argument('--downloads', type=int, default=DOWNLOADS,
+        help='Thumbnail downloads in flight at once. Default {}'.format(DOWNLOADS))
+    parser.add_argument('--workers', type=int, default=None,
+        help='Hashing processes. 0 hashes in this process. Default: one per core')
+    parser.add_argument('--hash-cache', type=Path, default=None, metavar='PATH',
+        help='Where to keep computed hashes. Default: hashes.sqlite next to the local album '
+            'index')
+    parser.add_argument('--dry-run', nargs='?', const='-', default=None, metavar='PATH',
+        help="Write the add/remove plan as JSON (to PATH, or stdout) instead of applying it")
+    return parser.parse_args(args)
+
+
+class Candidate(MediaRecord):
+    '''A :class:`autoalbum.media.MediaRecord` with what deduplication needs on top
+
+    Args:
+        base_url (str): Where the item's pixels are
+        phash (int): Its perceptual hash, once known. None if it couldn't be hashed
+    '''
+    __slots__ = ('base_url', 'phash')
+
+    def __init__(self, media_id, mime_type, timestamp, base_url=None, phash=None):
+        super().__init__(media_id, mime_type, timestamp)
+        self.base_url = base_url
+        self.phash = phash
+
+def candidates(key='source', name='fetch'):
+    '''Source: :class:`Candidate` for every media item in one of the job's albums'''
+    def fetch(api, conf_data):
+        items = api.iter_all_album_contents(conf_data[key]['id'], fields=FIELDS)
+        while True:
+            page = list(islice(items, 100))
+            if not page:
+                return
+            for item, record in zip(page, MediaRecord.from_items(page)):
+                yield Candidate(record.id, record.mime_type, record.timestamp,
+                    item.get('baseUrl'))
+    return Source(name, fetch)
+
+def download(url, size):
+    '''Download an image at (at most) `size` pixels per side'''
+    with urlopen('{}=w{}-h{}'.format(url, size, size), timeout=_TIMEOUT) as response:
+        content = response.read()
+    REGISTRY.inc('autoalbum_thumbnail_downloads_total')
+    REGISTRY.inc('autoalbum_thumbnail_bytes_total', len(content))
+    return content
+
+
+class _InlineExecutor:
+    '''Stands in for the process pool with ``--workers 0``'''
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+def _process_pool(workers):
+    if workers == 0:
+        return _InlineExecutor()
+    # Not forked: the API's prefetch threads may be mid-request, and fork only copies this one
+    return ProcessPoolExecutor(max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'))
+
+def hashes(api, cache, size=THUMBNAIL_SIZE, downloads=DOWNLOADS, workers=None, name='hash'):
+    '''Stage: fill in each :class:`Candidate`'s ``phash``, from the cache or by hashing its
+    thumbnail
+
+    Works a batch at a time. A batch's thumbnails are downloaded while the one before it is
+    being hashed, and are handed to the process pool a slice per worker.
+
+    Args:
+        api (autoalbum.api.API): For fresh ``baseUrl`` links when old ones have expired
+        cache (autoalbum.perceptual.HashCache): Hashes already computed, and where new ones go
+        size (int, optional): Thumbnail size to hash. Default :data:`THUMBNAIL_SIZE`
+        downloads (int, optional): Downloads in flight at once. Default :data:`DOWNLOADS`
+        workers (int, optional): Hashing processes; 0 for none. Default: one per core
+        name (str, optional): Stage name. Default "hash"
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def fetch(candidate):
+        try:
+            return download(candidate.base_url, size)
+        except (URLError, OSError, ValueError):
+            # Most likely an expired link; try once more with a fresh one
+            pass
+        try:
+            candidate.base_url = api.get_media_item(candidate.id)['baseUrl']
+            return download(candidate.base_url, size)
+        except Exception:
+            REGISTRY.inc('autoalbum_thumbnail_failures_total')
+            return None
+
+    def start(batch, threads, pool):
+        '''Look a batch up in the cache, download what's missing and queue it for hashing'''
+        known = cache.get_many(c.id for c in batch)
+        REGISTRY.inc('autoalbum_hash_cache_hits_total', len(known))
+        missing = [c for c in batch if c.id not in known]
+        contents = list(threads.map(fetch, missing))
+        fetched = [(c, content) for c, content in zip(missing, contents) if content is not None]
+        step = max(-(-len(fetched) // max(workers, 1)), 1)
+        jobs = [(fetched[i:i + step], pool.submit(hash_images, [c for _, c in fetched[i:i + step]],
+            HASH_SIZE)) for i in range(0, len(fetched), step)]
+        return batch, known, jobs
+
+    def finish(batch, known, jobs):
+        computed = {}
+        for chunk, job in jobs:
+            for (candidate, _), value in zip(chunk, job.result()):
+                if value is None:
+                    REGISTRY.inc('autoalbum_thumbnail_failures_total')
+                else:
+                    computed[candidate.id] = value
+        cache.put_many(computed)
+        known.update(computed)
+        for candidate in batch:
+            candidate.phash = known.get(candidate.id)
+        return batch
+
+    def stage(items):
+        pool = _process_pool(workers)
+        try:
+            with ThreadPoolExecutor(max_workers=downloads) as threads:
+                pending = None
+                while True:
+                    batch = list(islice(items, _BATCH))
+                    started = start(batch, threads, pool) if batch else None
+                    if pending is not None:
+                        yield from finish(*pending)
+                    if started is None:
+                        return
+                    pending = started
+        finally:
+            pool.shutdown()
+    return Stage(name, stage)
+
+def distinct(radius=DISTANCE, name='dedupe'):
+    '''Stage: one item per cluster of near-duplicates, the most recent
+
+    Items are taken newest first, and each is kept unless one already kept is within `radius` of
+    it (looked up in a :class:`autoalbum.perceptual.MultiIndex`). Items without a hash are always
+    kept. Survivors come out in their original order.
+
+    Args:
+        radius (int, optional): Most differing bits for near-duplicates. Default :data:`DISTANCE`
+        name (str, optional): Stage name. Default "dedupe"
+    '''
+    def stage(items):
+        items = list(items)
+        kept = MultiIndex(radius)
+        keep = [False] * len(items)
+        # Newest first; among equal timestamps the later one, as with top()
+        for i in sorted(range(len(items)), key=lambda i: (items[i].timestamp, i), reverse=True):
+            value = items[i].phash
+            if value is None or next(kept.find(value), None) is None:
+                keep[i] = True
+                if value is not None:
+                    kept.add(value, i)
+        REGISTRY.inc('autoalbum_near_duplicates_total', keep.count(False))
+        yield from (m for m, k in zip(items, keep) if k)
+    return Stage(name, stage)
+
+def hash_cache_path(api, path=None):
+    '''Where the hash cache lives: `path`, or next to the API's index'''
+    if path is not None:
+        return Path(path)
+    index = getattr(api, 'index', None)
+    directory = Path(index.path).parent if index is not None else Path()
+    return directory / 'hashes.sqlite'
+
+def pipeline(api, cache, n=None, distance=DISTANCE, thumbnail_size=THUMBNAIL_SIZE,
+        downloads=DOWNLOADS, workers=None, dry_run=None):
+    '''This behavior's pipeline. See :func:`run` for the arguments
+
+    Returns:
+        autoalbum.pipeline.Pipeline: The pipeline, ready to run
+    '''
+    stages = [images(), hashes(api, cache, thumbnail_size, downloads, workers),
+        distinct(distance)]
+    if n is not None:
+        stages.append(top(n, key=lambda m: m.timestamp))
+    return Pipeline('dedupe', candidates('source'), stages, sync_to('destination', dry_run))
+
+def run(api, conf_data, n=None, distance=DISTANCE, thumbnail_size=THUMBNAIL_SIZE,
+        downloads=DOWNLOADS, workers=None, hash_cache=None, dry_run=None):
+    '''Run logic. See module comments
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        conf_data (dict): Configuration data from your configuration file
+        n (int, optional): Only the most recent this many, after deduplication
+        distance (int, optional): Most differing bits for near-duplicates
+        thumbnail_size (int, optional): Thumbnail size to hash
+        downloads (int, optional): Downloads in flight at once
+        workers (int, optional): Hashing processes; 0 for none. Default: one per core
+        hash_cache (PathLike, optional): The hash cache. Default: see :func:`hash_cache_path`
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+
+    Returns:
+        dict: Seconds spent in each stage of the pipeline
+    '''
+    # Worker processes decode with whatever this one would
+    cache = HashCache(hash_cache_path(api, hash_cache),
+        'dhash{}@{}/{}'.format(HASH_SIZE, thumbnail_size, decoder()))
+    try:
+        return pipeline(api, cache, n, distance, thumbnail_size, downloads, workers,
+            dry_run).run(api, conf_data)
+    finally:
+        cache.close()
@@ -4,9 +4,16 @@ Mostly this is an over-engineered way to do "most recents in an album" for the s
 current pictures on a google nest hub.
 
 ...or it *WOULD BE* if the API would let me do this.
+
+It's a :class:`autoalbum.pipeline.Pipeline`: source records -> images only -> newest `n` -> sync.
 '''
 import argparse
-import dateutil.parser
+from itertools import chain
+
+from autoalbum import diff
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import REGISTRY
+from autoalbum.pipeline import Pipeline, album_records, images, sync_to, top
 
 # Scopes required for this behavior
 ## wellp turns out there's no scope that allows you to actually do any of this
@@ -16,6 +23,11 @@ SCOPES = [
     'https://www.googleapis.com/auth/photoslibrary.readonly',
 ]
 
+# Media item fields this behavior reads off the source album
+FIELDS = MediaRecord.FIELDS
+# Records buffered between selection passes in run_async
+_ASYNC_BATCH = 1000
+
 def parse_args(args):
     '''Parse arguments the caller's parser didn't understand
 
@@ -27,44 +39,84 @@ def parse_args(args):
     '''
     parser = argparse.ArgumentParser(description='N most recent photos')
     parser.add_argument('-n', type=int, default=5, help='Number of recent images to synch')
+    parser.add_argument('--dry-run', nargs='?', const='-', default=None, metavar='PATH',
+        help="Write the add/remove plan as JSON (to PATH, or stdout) instead of applying it")
     return parser.parse_args(args)
 
-def run(api, conf_data, n):
+def select_most_recent(media, n):
+    '''Pick the `n` most recent images out of a stream of media records
+
+    Does one pass with a bounded heap, so memory stays at O(n) however big the album is, and
+    timestamps come already parsed. The result is identical to a stable sort by creation time
+    followed by ``[-n:]``: among items with equal timestamps, the ones that came later win.
+
+    Args:
+        media (iterable): :class:`autoalbum.media.MediaRecord` instances, e.g. from
+            :meth:`autoalbum.api.API.iter_album_records`
+        n (int): How many to keep
+
+    Returns:
+        list: The selected records, oldest first
+    '''
+    return list(_newest(n)(images()(media)))
+
+def _newest(n):
+    return top(n, key=lambda m: m.timestamp)
+
+def pipeline(n, dry_run=None):
+    '''This behavior's pipeline
+
+    Args:
+        n (int): Number of recent images to synch
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+
+    Returns:
+        autoalbum.pipeline.Pipeline: The pipeline, ready to run
+    '''
+    ## Stream contents of source album; filter out videos; keep the latest `n` by date
+    ## Then we do some quickmaths to determine what needs to be added to the destination album and
+    #  what needs to be removed. The destination gets paged all the way through too, in case
+    #  somebody has been adding content to it :eyes:
+    #### AAAnnnnnndddddd that's all folks. Turns out Google Photos' API is severely limited.
+    #### Logic beyond the plan runs but is disappointing
+    return Pipeline('n_most_recent', album_records('source', FIELDS), [images(), _newest(n)],
+        sync_to('destination', dry_run))
+
+def run(api, conf_data, n, dry_run=None):
     '''Run logic. See module comments
 
     Args:
         api (autoalbum.api.API): API instance to poke Google with
         conf_data (dict): Configuration data from your configuration file
+        n (int): Number of recent images to synch
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+
+    Returns:
+        dict: Seconds spent in each stage of the pipeline
     '''
-    ## Grab contents of source album; filter out videos; sort by date, ascending
-    source_media = api.get_all_album_contents(conf_data['source']['id'])
-    source_media = [m for m in source_media if m['mimeType'].startswith('image')]
-    source_media.sort(key=lambda e: dateutil.parser.isoparse(e['mediaMetadata']['creationTime']))
-    # Now only take the latter `n`
-    source_media = source_media[-n:]
-    # All we're really ultimately interested in is the media IDs (as a set)
-    source_ids = {m['id'] for m in source_media}
-
-    ## Less work for the destination album. We assume nobody adds content to it :eyes:
-    destination_media = list(api.get_album_contents(conf_data['destination']['id']))
-    destination_ids = {m['id'] for m in destination_media}
-
-    ## Now we do some quickmaths to determine what needs to be added to the destination album and
-    #  what needs to be removed
-    add_these_ids = list(source_ids - destination_ids)
-    remove_these_ids = list(destination_ids - source_ids)
+    return pipeline(n, dry_run).run(api, conf_data)
 
-    #### AAAnnnnnndddddd that's all folks. Turns out Google Photos' API is severely limited.
-    #### Logic beyond this point runs but is disappointing
-
-    print('Removing', len(remove_these_ids), 'images...')
-    try:
-        api.remove_album_media_contents(conf_data['destination']['id'], remove_these_ids)
-    except Exception:
-        print("Removal failed because Google's Photos API doesn't let you manage existing data.")
-
-    print('Adding', len(add_these_ids), 'images...')
-    try:
-        api.add_album_media_contents(conf_data['destination']['id'], add_these_ids)
-    except Exception:
-        print("Addition failed because Google's Photos API doesn't let you manage existing data.")
+async def run_async(api, conf_data, n, dry_run=None):
+    '''Same as :func:`run`, on an :class:`autoalbum.aio.AsyncAPI`
+
+    The source and destination albums are paged through at the same time.
+    '''
+    import asyncio
+
+    async def select_source():
+        # Fold each batch of records into the running selection, so memory stays at O(n).
+        # Earlier records go first, which keeps the later-wins tie-breaking intact
+        selected, batch = [], []
+        async for record in api.iter_album_records(conf_data['source']['id'], fields=FIELDS):
+            batch.append(record)
+            if n > 0 and len(batch) >= _ASYNC_BATCH:
+                selected, batch = select_most_recent(chain(selected, batch), n), []
+        return [m.id for m in select_most_recent(chain(selected, batch), n)]
+
+    destination = conf_data['destination']['id']
+    with REGISTRY.phase('fetch'):
+        source_ids, current_ids = await asyncio.gather(
+            select_source(), diff.collect_media_ids_async(api, destination))
+    with REGISTRY.phase('diff'):
+        plan = diff.plan_sync(destination, source_ids, current_ids)
+    await diff.apply_or_write_plan_async(api, plan, dry_run)
@@ -0,0 +1,264 @@
+'''Syncs a random sample of N photos from source into destination, for a rotating display
+
+Shuffling a 200k-item album means holding all of it. Instead, the sample is drawn with reservoir
+sampling: one pass over the source as its pages stream by, keeping only the N picks so far.
+
+* Uniform sampling uses Li's "Algorithm L", which works out how many items to skip before the
+  next replacement. It needs O(N (1 + log(size / N))) random numbers rather than one per item.
+* Weighted sampling (``--half-life``, which favors recent photos) is Efraimidis and Spirakis'
+  A-Res. Each item gets the key ``u ** (1 / weight)``, and the N largest keys win. Keys are
+  compared by their logarithms, so tiny weights don't underflow to a tie at zero.
+
+Pass ``--seed`` to get the same sample every time from the same source. Without it, every run
+draws a new one. That includes daemon ticks, since :func:`fingerprint` never reports the source
+as unchanged.
+
+It's a :class:`autoalbum.pipeline.Pipeline`: source records -> images only -> sample -> sync.
+'''
+import argparse
+import heapq
+import math
+import random
+from itertools import islice
+
+from autoalbum import diff
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import REGISTRY
+from autoalbum.pipeline import Pipeline, Stage, album_records, images, sync_to
+
+# Scopes required for this behavior
+SCOPES = [
+    'https://www.googleapis.com/auth/photoslibrary.edit.appcreateddata',
+    'https://www.googleapis.com/auth/photoslibrary.appendonly',
+    'https://www.googleapis.com/auth/photoslibrary.readonly',
+]
+
+# Media item fields this behavior reads off the source album
+FIELDS = MediaRecord.FIELDS
+_DAY = 86400 * 1000000
+_LN2 = math.log(2)
+_END = object()
+
+def parse_args(args):
+    '''Parse arguments the caller's parser didn't understand
+
+    Args:
+        args (list): Forwarded list of arguments from the CLI
+
+    Returns:
+        The Namespace object resulting from parse_args
+    '''
+    parser = argparse.ArgumentParser(description='N random photos')
+    parser.add_argument('-n', type=int, default=5, help='Number of random images to synch')
+    parser.add_argument('--seed', type=int, default=None,
+        help='Seed for the random number generator, for a reproducible sample. Default: a new '
+            'sample every run')
+    parser.add_argument('--half-life', type=float, default=None, metavar='DAYS',
+        help='Favor recent photos: one taken DAYS earlier is half as likely to be picked. '
+            'Default: every photo is equally likely')
+    parser.add_argument('--dry-run', nargs='?', const='-', default=None, metavar='PATH',
+        help="Write the add/remove plan as JSON (to PATH, or stdout) instead of applying it")
+    return parser.parse_args(args)
+
+
+class Reservoir:
+    '''Uniform random sample of a stream, with Algorithm L
+
+    Feed it items with :meth:`extend` (as often as you like) and read the sample off
+    :meth:`sample`. Each item of the stream so far is in the sample with equal probability.
+
+    Args:
+        n (int): Sample size
+        rng (random.Random, optional): Source of randomness. Default: a fresh, unseeded one
+    '''
+
+    def __init__(self, n, rng=None):
+        self.n = max(n, 0)
+        self.rng = rng or random.Random()
+        self.seen = 0
+        self._items = []
+        self._skip = 0
+        self._w = 1.0
+
+    def _random(self):
+        # random() can return 0.0, which log() doesn't care for
+        return 1.0 - self.rng.random()
+
+    def _next_skip(self):
+        '''Draw how many items go by before the next one replaces a pick'''
+        self._w *= math.exp(math.log(self._random()) / self.n)
+        if self._w >= 1.0:
+            # Can only happen through rounding, for n in the billions. Take the next item
+            self._skip = 0
+        else:
+            self._skip = int(math.log(self._random()) / math.log1p(-self._w))
+
+    def extend(self, items):
+        '''Offer a stream of items for the sample'''
+        if not self.n:
+            self.seen += sum(1 for _ in items)
+            return
+        items = iter(items)
+        if len(self._items) < self.n:
+            for item in islice(items, self.n - len(self._items)):
+                self._items.append(item)
+                self.seen += 1
+            if len(self._items) < self.n:
+                return
+            self._next_skip()
+        while True:
+            # Pass over the skipped items without so much as a random number
+            skipped = sum(1 for _ in islice(items, self._skip))
+            self.seen += skipped
+            if skipped < self._skip:
+                # Ran out partway through; the rest of the skip carries over to the next extend()
+                self._skip -= skipped
+                return
+            item = next(items, _END)
+            if item is _END:
+                self._skip = 0
+                return
+            self.seen += 1
+            self._items[self.rng.randrange(self.n)] = item
+            self._next_skip()
+
+    def sample(self):
+        '''The sample so far, in no particular order'''
+        return list(self._items)
+
+
+class WeightedReservoir:
+    '''Weighted random sample of a stream (without replacement), with A-Res
+
+    An item's chance to be picked first is its weight over the total weight. Weights are given as
+    their natural logarithms, so they can span any range.
+
+    Args:
+        n (int): Sample size
+        log_weight (callable): Takes an item, returns the log of its weight
+        rng (random.Random, optional): Source of randomness. Default: a fresh, unseeded one
+    '''
+
+    def __init__(self, n, log_weight, rng=None):
+        self.n = max(n, 0)
+        self.log_weight = log_weight
+        self.rng = rng or random.Random()
+        self.seen = 0
+        # Min-heap of (key, arrival, item): the weakest pick is the one to beat
+        self._heap = []
+
+    def extend(self, items):
+        '''Offer a stream of items for the sample'''
+        heap, n, rng, log_weight = self._heap, self.n, self.rng, self.log_weight
+        for item in items:
+            self.seen += 1
+            if not n:
+                continue
+            # log(u ** (1 / w)) = -E / w for an exponential E, so bigger log(w) - log(E) wins
+            clock = rng.expovariate(1.0)
+            key = log_weight(item) - math.log(clock) if clock else math.inf
+            if len(heap) < n:
+                heapq.heappush(heap, (key, self.seen, item))
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, (key, self.seen, item))
+
+    def sample(self):
+        '''The sample so far, strongest key first'''
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+def recency(half_life_days):
+    '''Log-weight function favoring recent media: weight halves every `half_life_days`
+
+    Args:
+        half_life_days (float): Days for the weight to halve
+
+    Returns:
+        callable: Takes a :class:`autoalbum.media.MediaRecord`, returns the log of its weight
+    '''
+    if half_life_days <= 0:
+        raise ValueError('half_life_days must be positive')
+    # Only differences between weights matter, so measuring from the epoch is fine
+    scale = _LN2 / (half_life_days * _DAY)
+    return lambda m: m.timestamp * scale
+
+def reservoir(n, seed=None, half_life=None):
+    '''The reservoir this behavior samples with
+
+    Args:
+        n (int): Sample size
+        seed (int, optional): Random seed. Default: unseeded
+        half_life (float, optional): Favor recent media with this half-life in days. Default:
+            uniform
+
+    Returns:
+        Reservoir or WeightedReservoir: An empty reservoir
+    '''
+    rng = random.Random(seed)
+    if half_life is None:
+        return Reservoir(n, rng)
+    return WeightedReservoir(n, recency(half_life), rng)
+
+def sample(n, seed=None, half_life=None, name='sample'):
+    '''Pipeline stage: a random sample of `n` of the incoming items. See :func:`reservoir`'''
+    def stage(items):
+        pool = reservoir(n, seed, half_life)
+        pool.extend(items)
+        yield from pool.sample()
+    return Stage(name, stage)
+
+def pipeline(n, seed=None, half_life=None, dry_run=None):
+    '''This behavior's pipeline
+
+    Args:
+        n (int): Number of random images to synch
+        seed (int, optional): Random seed, for a reproducible sample
+        half_life (float, optional): Favor recent media with this half-life in days
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+
+    Returns:
+        autoalbum.pipeline.Pipeline: The pipeline, ready to run
+    '''
+    return Pipeline('random_sample', album_records('source', FIELDS),
+        [images(), sample(n, seed, half_life)], sync_to('destination', dry_run))
+
+def fingerprint(api, conf_data):
+    '''Never the same twice, so a daemon draws a fresh sample every tick'''
+    return object()
+
+def run(api, conf_data, n, seed=None, half_life=None, dry_run=None):
+    '''Run logic. See module comments
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        conf_data (dict): Configuration data from your configuration file
+        n (int): Number of random images to synch
+        seed (int, optional): Random seed, for a reproducible sample
+        half_life (float, optional): Favor recent media with this half-life in days
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+
+    Returns:
+        dict: Seconds spent in each stage of the pipeline
+    '''
+    return pipeline(n, seed, half_life, dry_run).run(api, conf_data)
+
+async def run_async(api, conf_data, n, seed=None, half_life=None, dry_run=None):
+    '''Same as :func:`run`, on an :class:`autoalbum.aio.AsyncAPI`
+
+    The source and destination albums are paged through at the same time.
+    '''
+    import asyncio
+
+    async def select_source():
+        pool = reservoir(n, seed, half_life)
+        async for record in api.iter_album_records(conf_data['source']['id'], fields=FIELDS):
+            if record.is_image:
+                pool.extend((record,))
+        return [m.id for m in pool.sample()]
+
+    destination = conf_data['destination']['id']
+    with REGISTRY.phase('fetch'):
+        source_ids, current_ids = await asyncio.gather(
+            select_source(), diff.collect_media_ids_async(api, destination))
+    with REGISTRY.phase('diff'):
+        plan = diff.plan_sync(destination, source_ids, current_ids)
+    await diff.apply_or_write_plan_async(api, plan, dry_run)
@@ -0,0 +1,175 @@
+'''Local catalog of a library's albums, for the configurator
+
+Listing every album is a page per 50 albums, owned and shared separately, which gets slow for big
+libraries. :class:`AlbumCatalog` keeps the last listing on disk for a while (see
+:data:`DEFAULT_TTL`), fetches owned and shared albums at the same time when it does go to Google,
+and only asks for the few fields the configurator shows. :class:`AlbumSearch` indexes the titles
+so albums can be found by typing part of their name.
+'''
+import bisect
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+#: How long a cached catalog is good for, in seconds
+DEFAULT_TTL = 24 * 3600
+#: The album fields the catalog keeps
+FIELDS = 'id,title,mediaItemsCount'
+
+# Bump this if the layout of the cache changes, so that old caches are simply ignored
+_CACHE_FORMAT = 1
+_WORD = re.compile(r'\w+')
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+class AlbumSearch:
+    '''Prefix search over album titles
+
+    Every word of every title goes into a sorted list, so each word of a query is a binary search
+    for the range of title words starting with it. An album matches when all the query's words
+    match one of its title words: "bab 20" finds "Baby's first 2020".
+
+    Args:
+        albums (list): Albums, as returned by the API
+    '''
+
+    def __init__(self, albums):
+        # Results come back in title order, so sort once up front
+        self.albums = sorted(albums, key=lambda a: (a.get('title', '').lower(), a.get('id', '')))
+        postings = {}
+        for i, album in enumerate(self.albums):
+            for word in _words(album.get('title', '')):
+                postings.setdefault(word, set()).add(i)
+        self._words = sorted(postings)
+        self._postings = [postings[w] for w in self._words]
+
+    def _matching(self, prefix):
+        '''Positions of albums with a title word starting with `prefix`'''
+        start = bisect.bisect_left(self._words, prefix)
+        stop = bisect.bisect_left(self._words, prefix + '\U0010ffff', start)
+        if stop - start == 1:
+            return self._postings[start]
+        return set().union(*self._postings[start:stop])
+
+    def search(self, query):
+        '''Find albums whose titles match `query`
+
+        Args:
+            query (str): Words (or beginnings of words) to look for. Blank matches everything
+
+        Returns:
+            list: Matching albums, in title order
+        '''
+        found = None
+        for word in _words(query):
+            matching = self._matching(word)
+            found = matching if found is None else found & matching
+            if not found:
+                return []
+        if found is None:
+            return list(self.albums)
+        return [self.albums[i] for i in sorted(found)]
+
+
+class AlbumCatalog:
+    '''On-disk cache of a library's owned and shared albums
+
+    Args:
+        path (PathLike): The cache file. Created if it doesn't exist
+        ttl (float, optional): Seconds a cached listing is good for. Default :data:`DEFAULT_TTL`
+    '''
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at = None
+        self._albums = {False: [], True: []}
+        self._by_id = {False: {}, True: {}}
+        self._search = {}
+
+    def load(self, api, refresh=False):
+        '''Get the catalog from disk, or from Google if it's missing, stale or `refresh` is set
+
+        Args:
+            api (autoalbum.api.API): API instance to poke Google with
+            refresh (bool, optional): Ignore the cache. Default False
+
+        Returns:
+            AlbumCatalog: self
+        '''
+        if refresh or not self._read():
+            self.fetch(api)
+        return self
+
+    def fetch(self, api):
+        '''List owned and shared albums from Google (both at once) and cache them'''
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            owned, shared = pool.map(lambda s: api.list_all_albums(s, fields=FIELDS),
+                (False, True))
+        self._set(owned, shared, time.time())
+        self.save()
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if data.get('format') != _CACHE_FORMAT:
+            return False
+        if time.time() - data.get('fetched_at', 0) > self.ttl:
+            return False
+        self._set(data['owned'], data['shared'], data['fetched_at'])
+        return True
+
+    def save(self):
+        '''Write the catalog to disk (atomically)'''
+        data = {'format': _CACHE_FORMAT, 'fetched_at': self.fetched_at,
+            'owned': self._albums[False], 'shared': self._albums[True]}
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp, str(self.path))
+
+    def _set(self, owned, shared, fetched_at):
+        self.fetched_at = fetched_at
+        self._albums = {False: list(owned), True: list(shared)}
+        # Per kind: an owned album that's shared is in both listings
+        self._by_id = {False: {a['id']: a for a in owned}, True: {a['id']: a for a in shared}}
+        self._search = {}
+
+    def albums(self, is_shared=False):
+        '''All owned (or shared) albums'''
+        return self._albums[is_shared]
+
+    def get(self, album_id, is_shared=None):
+        '''Look an album up by id
+
+        Args:
+            album_id (str): The album's ID
+            is_shared (bool, optional): Only among shared (True) or owned (False) albums.
+                Default: either
+
+        Returns:
+            dict: The album, or None if it isn't in the catalog (among that kind)
+        '''
+        if is_shared is None:
+            return self._by_id[False].get(album_id) or self._by_id[True].get(album_id)
+        return self._by_id[is_shared].get(album_id)
+
+    def search(self, is_shared=False):
+        '''The :class:`AlbumSearch` for owned (or shared) albums, built on first use'''
+        if is_shared not in self._search:
+            self._search[is_shared] = AlbumSearch(self._albums[is_shared])
+        return self._search[is_shared]
+
+    def add(self, album, is_shared=False):
+        '''Record an album we just created, so the cache doesn't need a refresh to show it'''
+        self._albums[is_shared].append(album)
+        self._by_id[is_shared][album['id']] = album
+        self._search.pop(is_shared, None)
+        self.save()
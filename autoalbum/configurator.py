@@ -11,8 +11,12 @@ from pathlib import Path
 from inquirer import prompt, List, Confirm, Text, Path as iPath
 
 import autoalbum
+from autoalbum.catalog import DEFAULT_TTL, AlbumCatalog
 from autoalbum.util import load_json, save_json
 
+# Most albums a picker lists at once; past that, the user is asked to narrow the search
+MAX_CHOICES = 30
+
 def is_album_shared(source_or_dest, default=False):
     '''Ask the user if the specified album is owned or shared
 
@@ -33,30 +37,50 @@ def is_album_shared(source_or_dest, default=False):
     ]
     return prompt(question)['is_shared']
 
-def prompt_for_album(source_or_dest, albums, default=None):
-    '''Ask the user to select one from a list of albums
+def prompt_for_album(source_or_dest, search, default=None, extra_choices=()):
+    '''Ask the user to find and select an album
+
+    The user types (part of) a title first, then picks from the matches, so the list stays short
+    however many albums there are. Leaving the search blank keeps the current album, if any.
 
     Args:
         source_or_dest (str): A string to poke into the question: "Which album is the {}?"
             Typically one of "source" or "destination"
-        albums (list): List of albums to put in a big inquirer list.
-            Typically, this list is populated from `:meth:autoalbum.api.API.list_all_albums`
+        search (autoalbum.catalog.AlbumSearch): The albums to pick from
+        default (dict, optional): The currently configured album, offered first
+        extra_choices (list, optional): (name, value) choices to offer on top of the albums,
+            e.g. "create a new one"
 
     Returns:
-        dict: The album that the user selected
+        dict: The album (or extra choice value) that the user selected
     '''
-    # If a default exists, figure out which index to start at
-    default_album = None
-    if default:
-        try:
-            default_album = [a[1] for a in albums if a[1].get('id', None) == default][0]
-        except IndexError:
-            pass
+    retry = ('<Search again>', None)
+    while True:
+        query = prompt([
+            Text(name='query', message='Search for the {} album by title (blank for all)'.format(
+                source_or_dest)),
+        ])['query']
+        matches = search.search(query)
+
+        choices = list(extra_choices)
+        show_current = default is not None and not query.strip()
+        if show_current:
+            choices.append(('{} (current)'.format(_album_name(default)), default))
+        choices += format_album_choices(
+            m for m in matches[:MAX_CHOICES] if not show_current or m['id'] != default['id'])
+        if len(matches) > MAX_CHOICES:
+            choices.append(('<{} more; search again to narrow it down>'.format(
+                len(matches) - MAX_CHOICES), None))
+        else:
+            choices.append(retry)
 
-    question = [
-        List(name='album', message='Which album is the {}?'.format(source_or_dest), choices=albums, default=default_album),
-    ]
-    return prompt(question)['album']
+        question = [
+            List(name='album', message='Which album is the {}? ({} found)'.format(
+                source_or_dest, len(matches)), choices=choices),
+        ]
+        album = prompt(question)['album']
+        if album is not None:
+            return album
 
 def format_album_choices(all_albums):
     '''Create PyInquirer-formatted album list from one provided by API
@@ -71,14 +95,21 @@ def format_album_choices(all_albums):
             {all_albums[n]['title'] : all_albums[n]}
         If the album is untitled, we make some stuff up.
     '''
-    return [(a.get('title', '<Unnamed Album with size {}>'.format(a.get('mediaItemsCount', 0))), a) for a in all_albums]
+    return [(_album_name(a), a) for a in all_albums]
+
+def _album_name(album):
+    return album.get('title',
+        '<Unnamed Album with size {}>'.format(album.get('mediaItemsCount', 0)))
 
-def main(conf_path, secret_file=None):
+def main(conf_path, secret_file=None, refresh_albums=False, catalog_ttl=DEFAULT_TTL):
     '''Main entrypoint for this configurator
 
     Args:
         conf_path (PathLike): Path to configuration file
         secret_file (PathLike, optional): Path to secret file from Google API Console
+        refresh_albums (bool, optional): List albums from Google even if the cached catalog
+            (albums.json next to the configuration) is still fresh
+        catalog_ttl (float, optional): Seconds the cached catalog is good for
     '''
     conf = {'source': {}, 'destination': {}}
 
@@ -131,33 +162,28 @@ def main(conf_path, secret_file=None):
 
     # Now that we have that, we can use the actual API to get information about albums
     api = autoalbum.API.new(conf['auth'])
-    all_albums = {}
+    # Owned and shared albums, fetched together and cached for next time
+    catalog = AlbumCatalog(conf_path.parent / 'albums.json', catalog_ttl).load(api, refresh_albums)
 
     ## Source album information
     # Figure out if it's a shared album or not
     source_is_shared = is_album_shared('source', conf['source'].get('is_shared', None))
-    # Grab all albums of that type and store them, formatted for PyInquirer
-    options = all_albums[source_is_shared] = \
-        format_album_choices(api.list_all_albums(source_is_shared))
     # Ask the user which they want as the source:
     conf['source']['is_shared'] = source_is_shared
-    source_album = prompt_for_album('source', options, conf['source'].get('id', None))
+    # The current album is only the default if it's still the kind of album asked for
+    source_album = prompt_for_album('source', catalog.search(source_is_shared),
+        catalog.get(conf['source'].get('id', None), source_is_shared))
     conf['source']['id'] = source_album.get('id', None)
 
     ## Destination album information
     # Figure out if it's a shared album or not
     dest_is_shared = is_album_shared('destination', conf['destination'].get('is_shared', None))
-    # Grab all albums of that type and store them, formatted for PyInquirer
-    if dest_is_shared not in all_albums:
-        options = all_albums[dest_is_shared] = \
-            format_album_choices(api.list_all_albums(dest_is_shared))
     # In the destination case, we can create a new album, if not shared
-    if not dest_is_shared:
-        options.insert(0, ('<Create New Album>', {}))
+    extra = [] if dest_is_shared else [('<Create New Album>', {})]
     # Ask the user which they want as the destination:
     conf['destination']['is_shared'] = dest_is_shared
-    conf['destination']['id'] = \
-        prompt_for_album('destination', options, conf['destination'].get('id',None)).get('id',None)
+    conf['destination']['id'] = prompt_for_album('destination', catalog.search(dest_is_shared),
+        catalog.get(conf['destination'].get('id', None), dest_is_shared), extra).get('id', None)
 
     # One more step if the user wanted to create a new album
     if not conf['destination']['id']:
@@ -167,7 +193,9 @@ def main(conf_path, secret_file=None):
                 default='[AUTO] ' + source_name),
         ]
         ans = prompt(album_name_questions)
-        conf['destination']['id'] = api.create_album(ans['album_title'])['id']
+        album = api.create_album(ans['album_title'])
+        catalog.add(album)
+        conf['destination']['id'] = album['id']
 
     save_json(conf_path, conf)
     print('Wrote configuration file to:', conf_path)
@@ -182,5 +210,9 @@ if __name__ == '__main__':
         help='Client secret file from Google API Console')
     parser.add_argument('conf_path', type=Path, default=Path(), nargs='?',
         help='The file or directory location for the resulting configuration')
+    parser.add_argument('--refresh-albums', action='store_true',
+        help='List albums from Google rather than from the cached catalog')
+    parser.add_argument('--catalog-ttl', type=float, default=DEFAULT_TTL,
+        help='Seconds the cached album catalog is good for. Default {}'.format(DEFAULT_TTL))
     args = parser.parse_args()
-    main(args.conf_path, args.secret_file)
+    main(args.conf_path, args.secret_file, args.refresh_albums, args.catalog_ttl)
@@ -0,0 +1,221 @@
+'''Shared on-disk credential store, with access tokens refreshed ahead of expiry
+
+Credentials live in one JSON file (see :func:`default_credentials_path`) that any number of
+autoalbum processes can share. Every read-modify-write happens under an exclusive ``flock`` on a
+sidecar lock file. So when several runs start together, one of them refreshes the token and the
+rest pick up the fresh one from disk, rather than each doing its own round trip.
+
+Once running, a :class:`TokenRefresher` thread refreshes the access token some minutes before it
+expires. API calls therefore never find it stale and never stop to refresh it themselves.
+
+Older versions kept a pickle in ``./token.pickle``; :meth:`CredentialStore.get` migrates it.
+'''
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from autoalbum.metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:
+    # No fcntl on Windows. Runs there still work; they just don't coordinate with each other
+    fcntl = None
+
+#: Where older versions kept credentials (relative to the working directory)
+LEGACY_TOKEN_PATH = 'token.pickle'
+#: Refresh access tokens this long before they expire. google-auth itself only refreshes
+#: (synchronously, inside a request) in the last 3m45s, so this must be comfortably more
+REFRESH_MARGIN = timedelta(minutes=10)
+#: How long to wait before trying again after a failed background refresh
+RETRY_INTERVAL = timedelta(seconds=30)
+
+def default_credentials_path():
+    '''Where autoalbum keeps credentials
+
+    ``$AUTOALBUM_CREDENTIALS`` if set, else ``$XDG_CONFIG_HOME/autoalbum/credentials.json``, else
+    ``~/.config/autoalbum/credentials.json``
+
+    Returns:
+        Path: The credentials file (which may not exist yet)
+    '''
+    if 'AUTOALBUM_CREDENTIALS' in os.environ:
+        return Path(os.environ['AUTOALBUM_CREDENTIALS'])
+    config_dir = Path(os.environ.get('XDG_CONFIG_HOME', Path.home() / '.config'))
+    return config_dir / 'autoalbum' / 'credentials.json'
+
+def _utcnow():
+    # google-auth keeps expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _transport_request():
+    from google.auth.transport.requests import Request
+    return Request()
+
+def _expires_within(creds, margin):
+    '''Does `creds`' access token expire within `margin` (or is it missing altogether)?'''
+    if not creds.token:
+        return True
+    return creds.expiry is not None and creds.expiry - margin <= _utcnow()
+
+class CredentialStore:
+    '''A credentials file that concurrent processes can share
+
+    Args:
+        path (PathLike, optional): The credentials file. Default :func:`default_credentials_path`
+        margin (timedelta, optional): Tokens this close to expiry count as due for a refresh.
+            Default :data:`REFRESH_MARGIN`
+    '''
+
+    def __init__(self, path=None, margin=REFRESH_MARGIN):
+        self.path = Path(path) if path else default_credentials_path()
+        self.margin = margin
+
+    @contextmanager
+    def lock(self):
+        '''Hold the store's exclusive lock for the body of a with-statement'''
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(str(self.path) + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def load(self):
+        '''Read the stored credentials. Call with the lock held
+
+        Returns:
+            google.oauth2.credentials.Credentials: The credentials, or None if there are none
+        '''
+        from google.oauth2.credentials import Credentials
+        try:
+            info = json.loads(self.path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        return Credentials.from_authorized_user_info(info)
+
+    def save(self, creds):
+        '''Write credentials, atomically and readable only by us. Call with the lock held'''
+        tmp = self.path.with_name('{}.{}.tmp'.format(self.path.name, os.getpid()))
+        fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(creds.to_json())
+        os.replace(str(tmp), str(self.path))
+
+    def get(self, client_config, scopes):
+        '''Get valid credentials for `scopes`, refreshing or logging in as needed
+
+        Args:
+            client_config (dict): Contents of a client_secret.json, for logging in
+            scopes (list): Scope strings the credentials must cover
+
+        Returns:
+            google.oauth2.credentials.Credentials: Credentials good for at least
+                :attr:`margin` more
+        '''
+        with self.lock():
+            creds = self.load()
+            if creds is None:
+                creds = self._migrate_legacy()
+            if creds is not None and not creds.has_scopes(scopes):
+                creds = None
+            if creds is None or not creds.refresh_token:
+                from google_auth_oauthlib.flow import InstalledAppFlow
+                flow = InstalledAppFlow.from_client_config(client_config, scopes)
+                creds = flow.run_local_server(port=0)
+                self.save(creds)
+            elif _expires_within(creds, self.margin):
+                self._refresh(creds, 'startup')
+            return creds
+
+    def refresh(self, creds, reason='background'):
+        '''Bring `creds` up to date, from the store if somebody else already refreshed it
+
+        Updates `creds` in place, so everybody holding it sees the new token.
+
+        Args:
+            creds (google.oauth2.credentials.Credentials): Credentials to refresh
+            reason (str, optional): Label for the refresh counter. Default "background"
+        '''
+        with self.lock():
+            stored = self.load()
+            if stored is not None and stored.refresh_token == creds.refresh_token \
+                    and not _expires_within(stored, self.margin):
+                # Another process (or thread) beat us to it
+                creds.token = stored.token
+                creds.expiry = stored.expiry
+                REGISTRY.inc('autoalbum_token_refreshes_total', source='store')
+                return
+            self._refresh(creds, reason)
+
+    def _refresh(self, creds, reason):
+        with REGISTRY.timer('autoalbum_token_refresh_seconds'):
+            creds.refresh(_transport_request())
+        REGISTRY.inc('autoalbum_token_refreshes_total', source=reason)
+        self.save(creds)
+
+    def _migrate_legacy(self):
+        '''Adopt the ./token.pickle older versions left behind, if any. Call with the lock held'''
+        if not os.path.exists(LEGACY_TOKEN_PATH):
+            return None
+        import pickle
+        with open(LEGACY_TOKEN_PATH, 'rb') as token:
+            creds = pickle.load(token)
+        self.save(creds)
+        print('Migrated {} to {}; you can delete the old file'.format(
+            LEGACY_TOKEN_PATH, self.path), file=sys.stderr)
+        return creds
+
+
+class TokenRefresher:
+    '''Background thread that refreshes an access token before it expires
+
+    Args:
+        store (CredentialStore): Store to refresh through (and share the result with)
+        creds (google.oauth2.credentials.Credentials): The credentials in use. Updated in place
+    '''
+
+    def __init__(self, store, creds):
+        self.store = store
+        self.creds = creds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='autoalbum-token-refresher',
+            daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def next_refresh(self):
+        '''Seconds until the token is due for a refresh (0 if it already is)'''
+        if self.creds.expiry is None:
+            return None
+        due = self.creds.expiry - self.store.margin - _utcnow()
+        return max(due.total_seconds(), 0.0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            delay = self.next_refresh()
+            if delay is None:
+                # Tokens that never expire never need refreshing
+                return
+            if self._stop.wait(delay):
+                return
+            try:
+                self.store.refresh(self.creds)
+            except Exception as e:
+                # google-auth will still refresh inline if it really has to; try again soon
+                REGISTRY.inc('autoalbum_token_refresh_errors_total')
+                print('Background token refresh failed: {}'.format(e), file=sys.stderr)
+                self._stop.wait(RETRY_INTERVAL.total_seconds())
@@ -0,0 +1,172 @@
+'''Works out what to add to and remove from a destination album
+
+Both sides are streamed: media items are reduced to their ids as the pages go by, so a plan for
+two huge albums costs two sets of id strings and nothing more.
+
+The ``*_async`` functions do the same against an :class:`autoalbum.aio.AsyncAPI`.
+'''
+import json
+import sys
+from collections import namedtuple
+
+from autoalbum.metrics import REGISTRY
+
+SyncPlan = namedtuple('SyncPlan', ['album_id', 'add', 'remove'])
+SyncPlan.__doc__ = '''Minimal set of changes to bring an album in line
+
+``add`` is in the order the wanted ids were given; ``remove`` in the order the album listed them.
+'''
+
+def iter_media_ids(api, album_id):
+    '''Stream the ids of every media item in an album, all pages included
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        album_id (str): The ID of the album
+
+    Yields:
+        str: Media item id
+    '''
+    for media in api.iter_all_album_contents(album_id, fields='id'):
+        yield media['id']
+
+async def collect_media_ids_async(api, album_id):
+    '''Async twin of :func:`iter_media_ids`, collected into a list
+
+    Args:
+        api (autoalbum.aio.AsyncAPI): API instance to poke Google with
+        album_id (str): The ID of the album
+
+    Returns:
+        list: Media item ids, in album order
+    '''
+    return [media['id'] async for media in api.iter_all_album_contents(album_id, fields='id')]
+
+def plan_sync(album_id, wanted_ids, current_ids):
+    '''Diff what an album should contain against what it does contain
+
+    Args:
+        album_id (str): The ID of the album being synced
+        wanted_ids (iterable): Ids that should end up in the album
+        current_ids (iterable): Ids currently in the album, e.g. from :func:`iter_media_ids`
+
+    Returns:
+        SyncPlan: What to add and what to remove
+    '''
+    # dict rather than set: same lookups, but remembers the order things were listed in
+    current = dict.fromkeys(current_ids)
+    wanted = dict.fromkeys(wanted_ids)
+    return SyncPlan(
+        album_id,
+        [i for i in wanted if i not in current],
+        [i for i in current if i not in wanted],
+    )
+
+def plan_album_sync(api, album_id, wanted_ids):
+    '''Page through an album and diff it against the ids it should contain
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        album_id (str): The ID of the album being synced
+        wanted_ids (iterable): Ids that should end up in the album
+
+    Returns:
+        SyncPlan: What to add and what to remove
+    '''
+    return plan_sync(album_id, wanted_ids, iter_media_ids(api, album_id))
+
+def plan_to_dict(plan):
+    '''JSON-friendly form of a plan'''
+    return {'albumId': plan.album_id, 'add': plan.add, 'remove': plan.remove}
+
+def write_plan(plan, path):
+    '''Write a plan as JSON
+
+    Args:
+        plan (SyncPlan): The plan
+        path (PathLike): Where to write it, or "-" for stdout
+    '''
+    if str(path) == '-':
+        json.dump(plan_to_dict(plan), sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, 'w') as file:
+            json.dump(plan_to_dict(plan), file, indent=2)
+
+def _plan_edits(plan):
+    '''The edits a plan makes, removals first, for :func:`apply_plan` and its async twin
+
+    Announces each one as it comes up.
+
+    Yields:
+        tuple: Name of the API method to call, the media ids to call it with, and what to say if
+            it fails
+    '''
+    for verb, noun, method, media_ids in (
+            ('Removing', 'Removal', 'remove_album_media_contents', plan.remove),
+            ('Adding', 'Addition', 'add_album_media_contents', plan.add)):
+        print(verb, len(media_ids), 'images...')
+        yield method, media_ids, \
+            "{} failed because Google's Photos API doesn't let you manage existing data.".format(
+                noun)
+
+def apply_plan(api, plan):
+    '''Carry out a plan: removals first, then additions
+
+    Failures are reported rather than raised, because (see the README) Google won't actually let
+    us touch media we didn't upload.
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        plan (SyncPlan): The plan
+    '''
+    for method, media_ids, failure in _plan_edits(plan):
+        try:
+            getattr(api, method)(plan.album_id, media_ids)
+        except Exception:
+            print(failure)
+
+def sync_album(api, album_id, wanted_ids, dry_run=None):
+    '''Make an album contain exactly `wanted_ids`, or just say how we would
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        album_id (str): The ID of the album being synced
+        wanted_ids (iterable): Ids that should end up in the album
+        dry_run (PathLike, optional): If given, write the plan here as JSON ("-" for stdout)
+            instead of applying it
+
+    Returns:
+        SyncPlan: The plan
+    '''
+    with REGISTRY.phase('diff'):
+        plan = plan_album_sync(api, album_id, wanted_ids)
+    with REGISTRY.phase('apply'):
+        if dry_run:
+            write_plan(plan, dry_run)
+        else:
+            apply_plan(api, plan)
+    return plan
+
+async def apply_plan_async(api, plan):
+    '''Async twin of :func:`apply_plan`. Removals and additions still go in that order'''
+    for method, media_ids, failure in _plan_edits(plan):
+        try:
+            await getattr(api, method)(plan.album_id, media_ids)
+        except Exception:
+            print(failure)
+
+async def apply_or_write_plan_async(api, plan, dry_run=None):
+    '''The apply phase of :func:`sync_album`, for a plan worked out against an AsyncAPI
+
+    Args:
+        api (autoalbum.aio.AsyncAPI): API instance to poke Google with
+        plan (SyncPlan): The plan
+        dry_run (PathLike, optional): If given, write the plan here as JSON ("-" for stdout)
+            instead of applying it
+    '''
+    with REGISTRY.phase('apply'):
+        if dry_run:
+            write_plan(plan, dry_run)
+        else:
+            await apply_plan_async(api, plan)
@@ -0,0 +1,127 @@
+'''Local cache of the Photos Library API discovery document
+
+``googleapiclient.discovery.build`` downloads the discovery document every time it's called,
+which is a whole network round trip before we get to do anything useful. We keep a copy on disk
+instead and build the service from that. Run this module to (re-)download it:
+
+    $ python -m autoalbum.discovery --refresh
+'''
+import argparse
+import json
+import os
+from pathlib import Path
+
+API_NAME = 'photoslibrary'
+API_VERSION = 'v1'
+DISCOVERY_URL = 'https://photoslibrary.googleapis.com/$discovery/rest?version=' + API_VERSION
+
+# Bump this if the layout of the cache changes, so that old caches are simply ignored
+CACHE_FORMAT = 1
+
+def default_cache_dir():
+    '''Where autoalbum keeps its caches
+
+    ``$AUTOALBUM_CACHE_DIR`` if set, else ``$XDG_CACHE_HOME/autoalbum``, else
+    ``~/.cache/autoalbum``
+
+    Returns:
+        Path: The cache directory (which may not exist yet)
+    '''
+    if 'AUTOALBUM_CACHE_DIR' in os.environ:
+        return Path(os.environ['AUTOALBUM_CACHE_DIR'])
+    return Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'autoalbum'
+
+def cache_path(cache_dir=None):
+    '''Get the location of the cached discovery document
+
+    The path is versioned by cache format as well as by API name and version.
+
+    Args:
+        cache_dir (PathLike, optional): Cache directory. Default :func:`default_cache_dir`
+
+    Returns:
+        Path: Location of the cached document
+    '''
+    cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+    return cache_dir / 'discovery' / 'v{}'.format(CACHE_FORMAT) / '{}.{}.json'.format(
+        API_NAME, API_VERSION)
+
+def fetch_document():
+    '''Download the discovery document from Google
+
+    Returns:
+        str: The discovery document
+    '''
+    import httplib2
+    resp, content = httplib2.Http().request(DISCOVERY_URL)
+    if resp.status != 200:
+        raise RuntimeError('Failed to fetch discovery document ({}): {}'.format(
+            resp.status, DISCOVERY_URL))
+    content = content.decode('utf-8')
+    json.loads(content) # Don't cache garbage
+    return content
+
+def refresh(cache_dir=None):
+    '''Download the discovery document and (over)write the cached copy
+
+    Args:
+        cache_dir (PathLike, optional): Cache directory. Default :func:`default_cache_dir`
+
+    Returns:
+        str: The discovery document
+    '''
+    document = fetch_document()
+    path = cache_path(cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so that a concurrent reader never sees half a document
+    tmp = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+    tmp.write_text(document, encoding='utf-8')
+    os.replace(str(tmp), str(path))
+    return document
+
+def load_document(cache_dir=None):
+    '''Get the discovery document, from the cache if we have it
+
+    Only goes to the network the very first time (or after the cache has been deleted).
+
+    Args:
+        cache_dir (PathLike, optional): Cache directory. Default :func:`default_cache_dir`
+
+    Returns:
+        str: The discovery document
+    '''
+    path = cache_path(cache_dir)
+    if path.is_file():
+        return path.read_text(encoding='utf-8')
+    return refresh(cache_dir)
+
+def build_service(creds, cache_dir=None):
+    '''Build the Photos Library service from the cached discovery document
+
+    Args:
+        creds: The login credentials object to authenticate with
+        cache_dir (PathLike, optional): Cache directory. Default :func:`default_cache_dir`
+
+    Returns:
+        The service instance
+    '''
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(load_document(cache_dir), credentials=creds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Manage the cached Photos Library API discovery document')
+    parser.add_argument('--refresh', action='store_true',
+        help='Download a fresh copy of the discovery document')
+    parser.add_argument('--cache-dir', type=Path, default=None,
+        help='Cache directory. Default: $AUTOALBUM_CACHE_DIR or ~/.cache/autoalbum')
+    args = parser.parse_args()
+
+    if args.refresh:
+        refresh(args.cache_dir)
+        print('Refreshed discovery document at:', cache_path(args.cache_dir))
+    else:
+        path = cache_path(args.cache_dir)
+        print('Discovery document {}: {}'.format(
+            'cached' if path.is_file() else 'not cached yet', path))
@@ -0,0 +1,623 @@
+'''A local stand-in for the Photos Library API, for benchmarks and offline testing
+
+It speaks just enough of the real API (albums, shared albums, media item search, batch add/remove
+and multipart batch requests) for :class:`autoalbum.api.API` to run against it unchanged. Albums
+are generated on the fly from their size, so a million-item album costs no memory until somebody
+edits it. Every media item's ``baseUrl`` serves a generated grayscale PNG (``=wW-hH`` picks the
+size, as with Google), and items in the same burst look nearly the same.
+
+    >>> library = FakeLibrary()
+    >>> library.add_album('source', size=10000)
+    >>> with FakePhotosServer(library, latency=0.01) as server:
+    ...     api = API(server.build_service(), None)
+
+Or from the command line, to point something else at it:
+
+    $ python -m autoalbum.fakeserver --album source=100000 --port 8080
+'''
+import argparse
+import email.parser
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from autoalbum.perceptual import encode_png
+
+# What the real API allows, at most, per page
+MAX_ALBUMS_PAGE_SIZE = 50
+MAX_MEDIA_ITEMS_PAGE_SIZE = 100
+
+# Generated creation times fall somewhere in 2010-2020
+_EPOCH_START = 1262304000
+_EPOCH_SPAN = 10 * 365 * 24 * 3600
+# Size of a generated image when the URL doesn't ask for one, and the most it may ask for
+_IMAGE_SIZE = 256
+_MAX_IMAGE_SIZE = 512
+_TRAILING_NUMBER = re.compile(r'^(.*?)(\d+)$')
+
+
+class FakeAlbum:
+    '''An album whose contents are generated from its id and size
+
+    Args:
+        album_id (str): The album's id
+        size (int): How many generated media items it starts with
+        title (str, optional): The album's title
+        shared (bool, optional): Whether it shows up under sharedAlbums rather than albums
+    '''
+
+    def __init__(self, album_id, size=0, title=None, shared=False):
+        self.id = album_id
+        self.title = title or album_id
+        self.shared = shared
+        self.size = size
+        # Only materialized once somebody edits the album
+        self._ids = None
+
+    def media_id(self, i):
+        return '{}-{:07d}'.format(self.id, i)
+
+    def __len__(self):
+        return self.size if self._ids is None else len(self._ids)
+
+    def ids(self, start, stop):
+        '''Media ids at positions [start, stop)'''
+        if self._ids is None:
+            return [self.media_id(i) for i in range(start, min(stop, self.size))]
+        return self._ids[start:stop]
+
+    def _materialize(self):
+        if self._ids is None:
+            self._ids = [self.media_id(i) for i in range(self.size)]
+
+    def add(self, media_ids):
+        self._materialize()
+        present = set(self._ids)
+        self._ids += [i for i in media_ids if i not in present]
+
+    def remove(self, media_ids):
+        self._materialize()
+        gone = set(media_ids)
+        self._ids = [i for i in self._ids if i not in gone]
+
+    def resource(self):
+        album = {
+            'id': self.id,
+            'title': self.title,
+            'productUrl': 'https://photos.google.com/lr/album/' + self.id,
+            'isWriteable': True,
+            'mediaItemsCount': str(len(self)),
+        }
+        if len(self):
+            album['coverPhotoMediaItemId'] = self.ids(0, 1)[0]
+        return album
+
+
+class FakeLibrary:
+    '''A whole (fake) Google Photos library
+
+    Args:
+        video_fraction (float, optional): Roughly what fraction of media items are videos.
+            Default 0.1
+        burst_size (int, optional): Media items whose ids end in consecutive numbers come in
+            bursts of this many near-identical images. Default 1, for no bursts
+    '''
+
+    def __init__(self, video_fraction=0.1, burst_size=1):
+        self.video_fraction = video_fraction
+        self.burst_size = burst_size
+        self.albums = {}
+        self._lock = threading.Lock()
+
+    def add_album(self, album_id, size=0, title=None, shared=False):
+        '''Add a generated album
+
+        Returns:
+            FakeAlbum: The new album
+        '''
+        album = self.albums[album_id] = FakeAlbum(album_id, size, title, shared)
+        return album
+
+    def media_item(self, media_id, base_url):
+        '''Generate the full resource for a media item
+
+        Everything about it is derived from its id, so it comes out the same every time.
+        '''
+        h = zlib.crc32(media_id.encode('utf-8'))
+        is_video = (h % 1000) < self.video_fraction * 1000
+        created = time.gmtime(_EPOCH_START + h % _EPOCH_SPAN)
+        metadata = {
+            'creationTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', created),
+            'width': '4032',
+            'height': '3024',
+        }
+        if is_video:
+            metadata['video'] = {'cameraMake': 'Google', 'cameraModel': 'Pixel 4', 'fps': 30,
+                'status': 'READY'}
+        else:
+            metadata['photo'] = {'cameraMake': 'Google', 'cameraModel': 'Pixel 4',
+                'focalLength': 4.44, 'apertureFNumber': 1.73, 'isoEquivalent': 55,
+                'exposureTime': '0.000999s'}
+        return {
+            'id': media_id,
+            'productUrl': 'https://photos.google.com/lr/photo/' + media_id,
+            'baseUrl': '{}/media/{}'.format(base_url, media_id),
+            'mimeType': 'video/mp4' if is_video else 'image/jpeg',
+            'mediaMetadata': metadata,
+            'filename': 'PXL_{:08x}.{}'.format(h, 'mp4' if is_video else 'jpg'),
+        }
+
+    def scene(self, media_id):
+        '''Which burst a media item belongs to: its id, with the number at the end divided by
+        :attr:`burst_size`
+        '''
+        match = _TRAILING_NUMBER.match(media_id)
+        if not match or self.burst_size <= 1:
+            return media_id
+        return '{}#{}'.format(match.group(1), int(match.group(2)) // self.burst_size)
+
+    def media_image(self, media_id, width=_IMAGE_SIZE, height=_IMAGE_SIZE):
+        '''Generate a media item's image, as a grayscale PNG
+
+        A few smooth waves picked by the item's :meth:`scene`, plus a little noise picked by its
+        id. So items of one burst differ by the noise, and other images differ entirely.
+        '''
+        rng = random.Random(self.scene(media_id))
+        waves = [(rng.uniform(10, 40), rng.uniform(0.5, 3) * math.tau / width, rng.uniform(0,
+            math.tau), rng.uniform(0.5, 3) * math.tau / height, rng.uniform(0, math.tau))
+            for _ in range(4)]
+        rows = [[a * math.cos(fy * y + py) for y in range(height)] for a, _, _, fy, py in waves]
+        cols = [[math.cos(fx * x + px) for x in range(width)] for _, fx, px, _, _ in waves]
+        noise = random.Random(media_id)
+        pixels = bytearray()
+        for y in range(height):
+            terms = [[row[y] * c for c in col] for row, col in zip(rows, cols)]
+            pixels += bytes(min(max(int(128 + sum(wave) + noise.random() * 6 - 3), 0), 255)
+                for wave in zip(*terms))
+        return encode_png(pixels, width, height)
+
+
+class _ApiError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+    def body(self):
+        return {'error': {'code': self.status, 'message': str(self), 'status': 'ERROR'}}
+
+
+_ALBUM_EDIT = re.compile(r'^/v1/albums/([^/:]+):(batchAddMediaItems|batchRemoveMediaItems)$')
+_ALBUM_GET = re.compile(r'^/v1/albums/([^/:]+)$')
+_MEDIA_GET = re.compile(r'^/v1/mediaItems/([^/:]+)$')
+_MEDIA_CONTENT = re.compile(r'^/media/([^/=]+)(?:=(.*))?$')
+_SIZE_OPTION = re.compile(r'^([wh])(\d+)$')
+_FIELD_PATH = re.compile(r'[A-Za-z_*][A-Za-z0-9_]*(/[A-Za-z_*][A-Za-z0-9_]*)*')
+
+
+class FakePhotosServer(ThreadingMixIn, HTTPServer):
+    '''HTTP server for a :class:`FakeLibrary`
+
+    Args:
+        library (FakeLibrary): The library to serve
+        host (str, optional): Interface to bind. Default 127.0.0.1
+        port (int, optional): Port to bind. Default 0, for any free port
+        latency (float, optional): Seconds to sleep before answering each request. Default 0
+        error_rate (float, optional): Fraction of requests that fail with a 429 or 503.
+            Default 0
+        max_page_size (int, optional): Cap on media items per page, below the real API's 100 if
+            you like. Default 100
+        seed (int, optional): Seed for error injection
+    '''
+    daemon_threads = True
+
+    def __init__(self, library, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0,
+            max_page_size=MAX_MEDIA_ITEMS_PAGE_SIZE, seed=0):
+        super().__init__((host, port), _Handler)
+        self.library = library
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        self.requests_served = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        '''Root URL of the server, e.g. http://127.0.0.1:12345'''
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        '''Serve on a background thread'''
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        '''Stop serving and release the socket'''
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def discovery_document(self):
+        '''A trimmed-down discovery document pointing at this server'''
+        return discovery_document(self.url + '/')
+
+    def build_service(self, http=None):
+        '''Build a googleapiclient service that talks to this server
+
+        Args:
+            http (optional): httplib2.Http to use. Default: a fresh one
+
+        Returns:
+            The service instance
+        '''
+        import httplib2
+        from googleapiclient.discovery import build_from_document
+        return build_from_document(self.discovery_document(), http=http or httplib2.Http())
+
+    def _count(self, sent):
+        with self._lock:
+            self.requests_served += 1
+            self.bytes_sent += sent
+
+    def _injected_error(self):
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return None
+            throttle = self._random.random() < 0.5
+        if throttle:
+            return _ApiError(429, 'Quota exceeded (injected)', {'Retry-After': '0'})
+        return _ApiError(503, 'Backend unavailable (injected)')
+
+    def route(self, method, path, query, body):
+        '''Answer one (non-batch) API call
+
+        Returns:
+            tuple: HTTP status, extra headers and the JSON response body
+        '''
+        try:
+            error = self._injected_error()
+            if error:
+                raise error
+            payload = self._route(method, path, query, body)
+            if query.get('fields'):
+                payload = apply_fields(payload, parse_fields(query['fields']))
+            return 200, {}, payload
+        except _ApiError as e:
+            return e.status, e.headers, e.body()
+
+    def _route(self, method, path, query, body):
+        library = self.library
+
+        if method == 'GET' and path in ('/v1/albums', '/v1/sharedAlbums'):
+            shared = path == '/v1/sharedAlbums'
+            albums = [a for a in library.albums.values() if a.shared == shared]
+            size = min(int(query.get('pageSize', 20)), MAX_ALBUMS_PAGE_SIZE)
+            start = int(query.get('pageToken') or 0)
+            page = {}
+            if albums[start:start+size]:
+                page['sharedAlbums' if shared else 'albums'] = [
+                    a.resource() for a in albums[start:start+size]]
+            if start + size < len(albums):
+                page['nextPageToken'] = str(start + size)
+            return page
+
+        if method == 'POST' and path == '/v1/albums':
+            title = body.get('album', {}).get('title')
+            album_id = 'album{:05d}'.format(len(library.albums))
+            return library.add_album(album_id, 0, title).resource()
+
+        if method == 'POST' and path == '/v1/mediaItems:search':
+            album = self._album(body.get('albumId'))
+            size = min(int(body.get('pageSize', 25)), self.max_page_size)
+            start = int(body.get('pageToken') or 0)
+            with library._lock:
+                ids = album.ids(start, start + size)
+                total = len(album)
+            page = {}
+            if ids:
+                page['mediaItems'] = [library.media_item(i, self.url) for i in ids]
+            if start + size < total:
+                page['nextPageToken'] = str(start + size)
+            return page
+
+        match = _ALBUM_EDIT.match(path)
+        if method == 'POST' and match:
+            album = self._album(match.group(1))
+            media_ids = body.get('mediaItemIds', [])
+            if not 0 < len(media_ids) <= 50:
+                raise _ApiError(400, 'Request must contain between 1 and 50 media items')
+            with library._lock:
+                if match.group(2) == 'batchAddMediaItems':
+                    album.add(media_ids)
+                else:
+                    album.remove(media_ids)
+            return {}
+
+        match = _ALBUM_GET.match(path)
+        if method == 'GET' and match:
+            return self._album(match.group(1)).resource()
+
+        match = _MEDIA_GET.match(path)
+        if method == 'GET' and match:
+            return library.media_item(match.group(1), self.url)
+
+        raise _ApiError(404, 'No such method: {} {}'.format(method, path))
+
+    def _album(self, album_id):
+        try:
+            return self.library.albums[album_id]
+        except KeyError:
+            raise _ApiError(404, 'No such album: {}'.format(album_id))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle sit on the second one
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+
+        if url.path == '/$discovery/rest':
+            self._send(200, {}, server.discovery_document())
+        elif url.path.startswith('/media/'):
+            self._send_image(url.path)
+        elif url.path == '/batch':
+            self._send_batch(raw)
+        else:
+            body = json.loads(raw.decode('utf-8')) if raw else {}
+            self._send(*server.route(method, url.path, query, body))
+
+    def _send(self, status, headers, payload):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        # Count before writing, so the client never sees a response that isn't counted yet
+        self.server._count(len(content))
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on this one (e.g. a cancelled prefetch); not our problem
+            self.close_connection = True
+
+    def _send_image(self, path):
+        '''Serve a baseUrl: a media item's generated image, sized by options like "=w64-h64"'''
+        match = _MEDIA_CONTENT.match(path)
+        if not match:
+            self._send(404, {}, _ApiError(404, 'No such media').body())
+            return
+        size = {'w': _IMAGE_SIZE, 'h': _IMAGE_SIZE}
+        for option in (match.group(2) or '').split('-'):
+            dimension = _SIZE_OPTION.match(option)
+            if dimension:
+                size[dimension.group(1)] = min(max(int(dimension.group(2)), 1), _MAX_IMAGE_SIZE)
+        content = self.server.library.media_image(unquote(match.group(1)), size['w'], size['h'])
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.server._count(len(content))
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send_batch(self, raw):
+        '''Unpack a multipart/mixed batch, answer each part and pack the answers back up'''
+        envelope = 'Content-Type: {}\r\n\r\n'.format(self.headers['Content-Type']).encode('utf-8')
+        message = email.parser.BytesParser().parsebytes(envelope + raw)
+        boundary = 'batch_fake_boundary'
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload()
+            head, _, body = request.partition('\n\n')
+            method, target = head.splitlines()[0].split(' ')[:2]
+            url = urlsplit(target)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, headers, payload = self.server.route(
+                method, url.path, query, json.loads(body) if body.strip() else {})
+            content_id = part['Content-ID'][1:-1]
+            inner = ''.join('{}: {}\r\n'.format(k, v) for k, v in headers.items())
+            parts.append(
+                '--{}\r\nContent-Type: application/http\r\nContent-ID: <response-{}>\r\n\r\n'
+                'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n{}\r\n{}\r\n'.format(
+                    boundary, content_id, status, self.responses.get(status, ('',))[0], inner,
+                    json.dumps(payload)))
+        content = (''.join(parts) + '--{}--\r\n'.format(boundary)).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/mixed; boundary={}'.format(boundary))
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        # Count before writing, so the client never sees a response that isn't counted yet
+        self.server._count(len(content))
+        self.wfile.write(content)
+
+
+def parse_fields(spec):
+    '''Parse a partial-response field mask, e.g. "nextPageToken,mediaItems(id,mediaMetadata/width)"
+
+    Returns:
+        dict: Field name to sub-mask, with None meaning "all of it"
+    '''
+    mask, _ = _parse_fields(spec.replace(' ', ''), 0)
+    return mask
+
+def _parse_fields(spec, pos):
+    mask = {}
+    while pos < len(spec) and spec[pos] != ')':
+        match = _FIELD_PATH.match(spec, pos)
+        if not match:
+            raise _ApiError(400, 'Invalid field selection {}'.format(spec))
+        pos = match.end()
+        sub = None
+        if pos < len(spec) and spec[pos] == '(':
+            sub, pos = _parse_fields(spec, pos + 1)
+            if pos >= len(spec):
+                raise _ApiError(400, 'Invalid field selection {}'.format(spec))
+            pos += 1
+        # a/b/c is shorthand for a(b(c))
+        *parents, name = match.group(0).split('/')
+        for parent in reversed(parents):
+            sub, name = {name: sub}, parent
+        mask[name] = _merge_fields(mask.get(name, {}), sub) if name in mask else sub
+        if pos < len(spec) and spec[pos] == ',':
+            pos += 1
+    return mask, pos
+
+def _merge_fields(a, b):
+    if a is None or b is None:
+        return None
+    merged = dict(a)
+    for name, sub in b.items():
+        merged[name] = _merge_fields(merged[name], sub) if name in merged else sub
+    return merged
+
+def apply_fields(value, mask):
+    '''Cut a response down to a parsed field mask (lists are masked item by item)'''
+    if mask is None:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(v, mask) for v in value]
+    if not isinstance(value, dict):
+        return value
+    return {k: apply_fields(v, mask[k]) for k, v in value.items() if k in mask}
+
+
+def discovery_document(root_url):
+    '''The subset of the Photos Library discovery document that autoalbum uses
+
+    Args:
+        root_url (str): Where the API lives, with a trailing slash
+
+    Returns:
+        dict: Discovery document
+    '''
+    def method(method_id, http_method, path, params=None, request=None):
+        desc = {
+            'id': 'photoslibrary.' + method_id,
+            'httpMethod': http_method,
+            'path': path,
+            'flatPath': path,
+            'parameters': {},
+            'parameterOrder': [],
+            'response': {'$ref': 'Response'},
+        }
+        for name, location in (params or {}).items():
+            desc['parameters'][name] = {'type': 'string', 'location': location}
+            if location == 'path':
+                desc['parameters'][name]['required'] = True
+                desc['parameterOrder'].append(name)
+        if request:
+            desc['request'] = {'$ref': 'Request'}
+        return desc
+
+    return {
+        'kind': 'discovery#restDescription',
+        'discoveryVersion': 'v1',
+        'id': 'photoslibrary:v1',
+        'name': 'photoslibrary',
+        'version': 'v1',
+        'rootUrl': root_url,
+        'servicePath': '',
+        'batchPath': 'batch',
+        'protocol': 'rest',
+        'parameters': {
+            'alt': {'type': 'string', 'location': 'query', 'default': 'json'},
+            'fields': {'type': 'string', 'location': 'query'},
+        },
+        'schemas': {
+            'Request': {'id': 'Request', 'type': 'object', 'properties': {}},
+            'Response': {'id': 'Response', 'type': 'object', 'properties': {}},
+        },
+        'resources': {
+            'albums': {'methods': {
+                'list': method('albums.list', 'GET', 'v1/albums',
+                    {'pageSize': 'query', 'pageToken': 'query'}),
+                'get': method('albums.get', 'GET', 'v1/albums/{+albumId}',
+                    {'albumId': 'path'}),
+                'create': method('albums.create', 'POST', 'v1/albums', request=True),
+                'batchAddMediaItems': method('albums.batchAddMediaItems', 'POST',
+                    'v1/albums/{+albumId}:batchAddMediaItems', {'albumId': 'path'}, True),
+                'batchRemoveMediaItems': method('albums.batchRemoveMediaItems', 'POST',
+                    'v1/albums/{+albumId}:batchRemoveMediaItems', {'albumId': 'path'}, True),
+            }},
+            'sharedAlbums': {'methods': {
+                'list': method('sharedAlbums.list', 'GET', 'v1/sharedAlbums',
+                    {'pageSize': 'query', 'pageToken': 'query'}),
+            }},
+            'mediaItems': {'methods': {
+                'search': method('mediaItems.search', 'POST', 'v1/mediaItems:search',
+                    request=True),
+                'get': method('mediaItems.get', 'GET', 'v1/mediaItems/{+mediaItemId}',
+                    {'mediaItemId': 'path'}),
+            }},
+        },
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Photos Library API server')
+    parser.add_argument('--album', action='append', default=[], metavar='ID=SIZE',
+        help='Add a generated album (repeatable). Prefix the id with "shared:" to share it')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+        help='Fraction of requests answered with 429/503')
+    parser.add_argument('--max-page-size', type=int, default=MAX_MEDIA_ITEMS_PAGE_SIZE)
+    parser.add_argument('--burst-size', type=int, default=1,
+        help='Media items come in bursts of this many near-identical images')
+    args = parser.parse_args()
+
+    library = FakeLibrary(burst_size=args.burst_size)
+    for spec in args.album:
+        album_id, _, size = spec.partition('=')
+        shared = album_id.startswith('shared:')
+        library.add_album(album_id[len('shared:'):] if shared else album_id, int(size or 0),
+            shared=shared)
+
+    server = FakePhotosServer(library, args.host, args.port, args.latency, args.error_rate,
+        args.max_page_size)
+    print('Serving fake Photos Library API at', server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
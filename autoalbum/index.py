@@ -0,0 +1,278 @@
+'''On-disk index of album contents
+
+Paging through a big album costs a round trip per 100 items, so we keep a local SQLite copy of
+what each album held the last time we looked. An album is only re-scanned when its
+``mediaItemsCount`` no longer matches what we have on record (or when somebody asks for a cold
+rebuild). A copy scanned with a partial-response field mask only serves requests for that same
+mask; a full copy serves anything.
+'''
+import json
+import sqlite3
+import threading
+import time
+
+from autoalbum import timestamps
+from autoalbum.media import MediaRecord
+
+# Bump whenever _SCHEMA changes. It's only a cache, so an index from another version is dropped
+_SCHEMA_VERSION = 3
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS albums (
+    album_id TEXT PRIMARY KEY,
+    media_items_count INTEGER,
+    fields TEXT,
+    generation INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media_items (
+    album_id TEXT NOT NULL,
+    media_id TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    mime_type TEXT,
+    timestamp INTEGER,
+    item TEXT NOT NULL,
+    PRIMARY KEY (album_id, media_id)
+);
+CREATE INDEX IF NOT EXISTS media_items_by_position ON media_items (album_id, position);
+'''
+
+class MediaIndex:
+    '''Persistent index of album contents, keyed by album id and media id
+
+    Safe to share between threads; each thread gets its own connection.
+
+    Args:
+        path (PathLike): Location of the SQLite database. Created if it doesn't exist.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        if self._conn.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+            self._conn.executescript(
+                'DROP TABLE IF EXISTS media_items; DROP TABLE IF EXISTS albums;')
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute('PRAGMA user_version = {}'.format(_SCHEMA_VERSION))
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(
+                str(self.path), timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        '''Close the underlying database connections'''
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def album_count(self, album_id):
+        '''Get the ``mediaItemsCount`` recorded at the end of the last complete scan
+
+        Args:
+            album_id (str): The ID of the album
+
+        Returns:
+            int: The recorded count, or None if the album has never been fully scanned
+        '''
+        row = self._conn.execute(
+            'SELECT media_items_count FROM albums WHERE album_id = ?', (album_id,)).fetchone()
+        return row[0] if row else None
+
+    def is_current(self, album_id, media_items_count, fields=None):
+        '''Check whether our copy of an album is still good
+
+        Args:
+            album_id (str): The ID of the album
+            media_items_count (int or str): The album's ``mediaItemsCount`` as reported by Google
+            fields (str, optional): The media item fields the caller wants. A copy scanned with a
+                different projection won't do (a full copy always will). Default: everything
+
+        Returns:
+            bool: True if the album was scanned before, with suitable fields, and its item count
+                hasn't moved since
+        '''
+        row = self._conn.execute(
+            'SELECT media_items_count, fields FROM albums WHERE album_id = ?',
+            (album_id,)).fetchone()
+        if row is None or row[0] is None or row[0] != int(media_items_count or 0):
+            return False
+        return row[1] is None or row[1] == fields
+
+    def iter_album(self, album_id):
+        '''Iterate over the indexed media items of an album, in the order Google returned them
+
+        Args:
+            album_id (str): The ID of the album
+
+        Yields:
+            dict: Media item, exactly as it was returned by the API
+        '''
+        cursor = self._conn.execute(
+            'SELECT item FROM media_items WHERE album_id = ? ORDER BY position', (album_id,))
+        for (item,) in cursor:
+            yield json.loads(item)
+
+    def iter_album_records(self, album_id):
+        '''Like :meth:`iter_album`, but yields compact records without decoding the full items
+
+        Args:
+            album_id (str): The ID of the album
+
+        Yields:
+            autoalbum.media.MediaRecord: Media item record
+        '''
+        cursor = self._conn.execute(
+            'SELECT media_id, mime_type, timestamp FROM media_items WHERE album_id = ? '
+            'ORDER BY position', (album_id,))
+        for row in cursor:
+            yield MediaRecord(*row)
+
+    def scan(self, album_id, fields=None):
+        '''Start (re-)scanning an album into the index
+
+        Items are upserted as they're added and anything left over from a previous scan is
+        dropped on :meth:`AlbumScan.commit`. The album is marked stale for the duration, so an
+        interrupted scan is never mistaken for a current one.
+
+        Args:
+            album_id (str): The ID of the album being scanned
+            fields (str, optional): The partial-response projection the items were fetched with.
+                Default: everything
+
+        Returns:
+            AlbumScan: Scan handle to feed media items to
+        '''
+        return AlbumScan(self, album_id, fields)
+
+    def clear(self, album_id=None):
+        '''Forget an album (or everything, if no album is given)
+
+        A scan of the album that's still in progress is superseded too: whatever it read may
+        predate the change that made us forget the album, so it won't get to commit.
+
+        Args:
+            album_id (str, optional): The ID of the album to drop from the index
+        '''
+        # The albums rows stay, with their generations moved on, so no later scan can reuse
+        # the generation of one that's still running
+        with self._conn:
+            if album_id is None:
+                self._conn.execute('DELETE FROM media_items')
+                self._conn.execute('UPDATE albums SET media_items_count = NULL, fields = NULL, '
+                    'generation = generation + 1')
+            else:
+                self._conn.execute('DELETE FROM media_items WHERE album_id = ?', (album_id,))
+                self._conn.execute('UPDATE albums SET media_items_count = NULL, fields = NULL, '
+                    'generation = generation + 1 WHERE album_id = ?', (album_id,))
+
+    def _claim(self):
+        '''Open a write transaction right away on this thread's connection
+
+        Use as ``with index._claim() as conn:``. Everything in the block sees (and changes) the
+        index without any other connection writing in between.
+        '''
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+
+class AlbumScan:
+    '''Handle for an in-progress album scan. See :meth:`MediaIndex.scan`
+
+    Each scan claims the album's next generation. Starting another scan of the same album (or
+    clearing it) supersedes this one: from then on its :meth:`add` and :meth:`commit` write
+    nothing, so two scans running at once can't mix their rows or drop each other's.
+
+    Args:
+        index (MediaIndex): The index being written to
+        album_id (str): The ID of the album being scanned
+        fields (str, optional): The projection the items were fetched with
+    '''
+
+    def __init__(self, index, album_id, fields=None):
+        self.index = index
+        self.album_id = album_id
+        self.fields = fields
+        self.position = 0
+        self.superseded = False
+        # Read and bump the generation in one transaction, or two scans could claim the same one
+        with index._claim() as conn:
+            row = conn.execute(
+                'SELECT generation FROM albums WHERE album_id = ?', (album_id,)).fetchone()
+            self.generation = (row[0] + 1) if row else 1
+            conn.execute(
+                'INSERT OR REPLACE INTO albums '
+                '(album_id, media_items_count, generation, scanned_at) VALUES (?, NULL, ?, ?)',
+                (album_id, self.generation, time.time()))
+
+    def _is_latest(self, conn):
+        '''Is this still the album's newest scan? Call inside :meth:`MediaIndex._claim`'''
+        if not self.superseded:
+            row = conn.execute(
+                'SELECT generation FROM albums WHERE album_id = ?', (self.album_id,)).fetchone()
+            self.superseded = row is None or row[0] != self.generation
+        return not self.superseded
+
+    def add(self, items):
+        '''Add (or refresh) a batch of media items, typically one page
+
+        Args:
+            items (list): Media items as returned by the API
+        '''
+        # Projected items may lack these; the copy just won't be usable for records then
+        created = [item.get('mediaMetadata', {}).get('creationTime') for item in items]
+        if all(created):
+            parsed = timestamps.parse_many(created)
+        else:
+            parsed = [timestamps.parse(c) if c else None for c in created]
+        rows = []
+        for item, timestamp in zip(items, parsed):
+            rows.append((self.album_id, item['id'], self.generation, self.position,
+                item.get('mimeType'), timestamp, json.dumps(item, separators=(',', ':'))))
+            self.position += 1
+        with self.index._claim() as conn:
+            if not self._is_latest(conn):
+                return
+            conn.executemany(
+                'INSERT OR REPLACE INTO media_items '
+                '(album_id, media_id, generation, position, mime_type, timestamp, item) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def commit(self, media_items_count=None):
+        '''Finish the scan: drop stale items and record the album's item count
+
+        Does nothing if the scan has been superseded; the newer scan gets the last word.
+
+        Args:
+            media_items_count (int, optional): The album's ``mediaItemsCount``. Defaults to the
+                number of items seen during this scan.
+
+        Returns:
+            bool: True if the scan was committed, False if it was superseded
+        '''
+        if media_items_count is None:
+            media_items_count = self.position
+        with self.index._claim() as conn:
+            if not self._is_latest(conn):
+                return False
+            conn.execute(
+                'DELETE FROM media_items WHERE album_id = ? AND generation != ?',
+                (self.album_id, self.generation))
+            conn.execute(
+                'INSERT OR REPLACE INTO albums '
+                '(album_id, media_items_count, fields, generation, scanned_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (self.album_id, int(media_items_count), self.fields, self.generation, time.time()))
+        return True
@@ -0,0 +1,163 @@
+'''Write-ahead journal for batched album edits, so an interrupted run can pick up where it died
+
+Adding or removing 50,000 media items is a thousand calls. If the run dies partway (a crash, a
+quota, a SIGTERM), starting over would send every one of them again. With a :class:`Journal`,
+:meth:`autoalbum.api.API.add_album_media_contents` and friends write down each job's chunks
+before sending any, and each chunk once it has gone through. Each record is one JSON line::
+
+    {"op": "plan", "job": "3f2c...", "action": "add", "album": "...", "chunks": [[...], ...]}
+    {"op": "done", "job": "3f2c...", "chunk": 0}
+    {"op": "end", "job": "3f2c..."}
+
+A job without an ``end`` was interrupted. :meth:`autoalbum.api.API.resume` sends only its chunks
+without a ``done``. Chunks that were in flight when the run died may or may not have been
+applied, so they're simply sent again: adding media that's already in an album, or removing
+media that already isn't, changes nothing. A new job for the same album and action supersedes an
+interrupted one: the old job is ended, and the new one (worked out from the album as it is now)
+is sent in full.
+
+Lines are flushed (and fsync'd, unless told otherwise) before the call they describe goes out,
+or right after it comes back. A line cut short by a crash is cut off on the next load. Once no
+job is open, the file is emptied so it doesn't grow forever.
+'''
+import json
+import os
+import threading
+import uuid
+
+from autoalbum.metrics import REGISTRY
+
+
+class JournalJob:
+    '''One batched album edit, as the journal remembers it
+
+    Args:
+        job_id (str): The job's id in the journal
+        action (str): "add" or "remove"
+        album_id (str): The album being edited
+        chunks (list): Lists of media ids, one per call
+    '''
+
+    def __init__(self, job_id, action, album_id, chunks):
+        self.id = job_id
+        self.action = action
+        self.album_id = album_id
+        self.chunks = chunks
+        self.done = set()
+
+    @property
+    def pending(self):
+        '''Indices of the chunks that haven't gone through (yet)'''
+        return [i for i in range(len(self.chunks)) if i not in self.done]
+
+    def __repr__(self):
+        return 'JournalJob({!r}, {!r}, {!r}, {} of {} chunks done)'.format(
+            self.id, self.action, self.album_id, len(self.done), len(self.chunks))
+
+
+class Journal:
+    '''Append-only JSON-lines journal of batched album edits
+
+    Safe to share between threads. Not meant to be shared between processes: give each run (or
+    each account) its own file.
+
+    Args:
+        path (PathLike): The journal file. Created if it doesn't exist
+        fsync (bool, optional): fsync after every record, so it survives a power cut and not just
+            a crash. Default True
+    '''
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._load()
+        self._file = open(str(path), 'a', encoding='utf-8')
+
+    def _load(self):
+        '''Replay the file into the in-memory state of every job that never ended'''
+        try:
+            with open(str(self.path), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            # A record torn by a crash. Whatever it said never got confirmed, so drop it before
+            # appending anything after it
+            with open(str(self.path), 'r+b') as file:
+                file.truncate(complete)
+        for line in data[:complete].decode('utf-8').splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op, job_id = record.get('op'), record.get('job')
+            if op == 'plan':
+                self._jobs[job_id] = JournalJob(job_id, record['action'], record['album'],
+                    record['chunks'])
+            elif op == 'done' and job_id in self._jobs:
+                self._jobs[job_id].done.add(record['chunk'])
+            elif op == 'end':
+                self._jobs.pop(job_id, None)
+
+    def _write(self, record):
+        '''Append a record and get it onto disk. Call with the lock held'''
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        REGISTRY.inc('autoalbum_journal_records_total', op=record['op'])
+
+    def unfinished(self, action=None, album_id=None):
+        '''Jobs that were planned but never ended, optionally only for one action or album
+
+        Returns:
+            list: :class:`JournalJob` instances, oldest first
+        '''
+        with self._lock:
+            return [job for job in self._jobs.values()
+                if (action is None or job.action == action)
+                and (album_id is None or job.album_id == album_id)]
+
+    def plan(self, action, album_id, chunks):
+        '''Record a job's chunks, before any of them is sent
+
+        Args:
+            action (str): "add" or "remove"
+            album_id (str): The album being edited
+            chunks (list): Lists of media ids, one per call
+
+        Returns:
+            JournalJob: The new job
+        '''
+        job = JournalJob(uuid.uuid4().hex, action, album_id, [list(c) for c in chunks])
+        with self._lock:
+            self._write({'op': 'plan', 'job': job.id, 'action': action, 'album': album_id,
+                'chunks': job.chunks})
+            self._jobs[job.id] = job
+        return job
+
+    def done(self, job, chunk):
+        '''Record that chunk number `chunk` of `job` went through'''
+        with self._lock:
+            if chunk not in job.done:
+                self._write({'op': 'done', 'job': job.id, 'chunk': chunk})
+                job.done.add(chunk)
+
+    def end(self, job):
+        '''Record that `job` is finished with: every chunk went through, or it was superseded
+
+        Empties the file once no job is left open.
+        '''
+        with self._lock:
+            self._write({'op': 'end', 'job': job.id})
+            self._jobs.pop(job.id, None)
+            if not self._jobs:
+                self._file.truncate(0)
+
+    def close(self):
+        '''Close the journal file'''
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,95 @@
+'''Compact media item records
+
+The API hands back a fat dict per media item (URLs, filename, camera metadata, ...) when most of
+what we do only needs the id, the mime type and when it was taken. :class:`MediaRecord` keeps just
+those, with the timestamp already parsed, so big albums fit in a fraction of the memory. The full
+dict is still there for the asking via :meth:`MediaRecord.full`.
+'''
+import sys
+from datetime import datetime, timedelta, timezone
+
+from autoalbum import timestamps
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+#: Parse an RFC 3339 timestamp into integer microseconds since the epoch (UTC). See
+#: :func:`autoalbum.timestamps.parse`
+parse_timestamp = timestamps.parse
+
+
+class MediaRecord:
+    '''The bits of a media item we actually use
+
+    Args:
+        media_id (str): The media item's id
+        mime_type (str): Its mime type. Interned, since there are only a handful of distinct ones
+        timestamp (int): Its ``creationTime`` in microseconds since the epoch
+    '''
+    __slots__ = ('id', 'mime_type', 'timestamp')
+
+    #: The media item fields a record is built from, in partial-response syntax
+    FIELDS = 'id,mimeType,mediaMetadata/creationTime'
+
+    def __init__(self, media_id, mime_type, timestamp):
+        self.id = media_id
+        self.mime_type = sys.intern(mime_type)
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_item(cls, item):
+        '''Build a record from a media item dict as returned by the API
+
+        Args:
+            item (dict): The media item
+
+        Returns:
+            MediaRecord: Its compact record
+        '''
+        return cls(item['id'], item['mimeType'],
+            parse_timestamp(item['mediaMetadata']['creationTime']))
+
+    @classmethod
+    def from_items(cls, items):
+        '''Build records for a whole page of media items, parsing their timestamps in one batch
+
+        Args:
+            items (list): Media item dicts as returned by the API
+
+        Returns:
+            list: Their compact records, in the same order
+        '''
+        return [cls(item['id'], item['mimeType'], timestamp)
+            for item, timestamp in zip(items, timestamps.items_timestamps(items))]
+
+    @property
+    def is_image(self):
+        return self.mime_type.startswith('image')
+
+    @property
+    def creation_time(self):
+        '''The timestamp as an aware UTC datetime'''
+        return _EPOCH + self.timestamp * _MICROSECOND
+
+    def full(self, api):
+        '''Fetch the full media item from Google
+
+        Args:
+            api (autoalbum.api.API): API instance to poke Google with
+
+        Returns:
+            dict: The media item, as returned by the API
+        '''
+        return api.get_media_item(self.id)
+
+    def __eq__(self, other):
+        if not isinstance(other, MediaRecord):
+            return NotImplemented
+        return (self.id, self.mime_type, self.timestamp) == \
+            (other.id, other.mime_type, other.timestamp)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return 'MediaRecord({!r}, {!r}, {!r})'.format(self.id, self.mime_type, self.timestamp)
@@ -0,0 +1,310 @@
+'''Run metrics: call counts, latencies, pages, bytes, retries and behavior phases
+
+Everything is recorded into :data:`REGISTRY` as it happens. At the end of a run it can be dumped
+as JSON, or as a Prometheus text-file snapshot for node_exporter's textfile collector to pick up
+(write it into the collector's directory):
+
+    $ python -m autoalbum --metrics-json run.json --metrics-prom textfile/autoalbum.prom
+'''
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+#: Histogram buckets for durations, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+#: Histogram buckets for items per page
+PAGE_ITEMS_BUCKETS = (0, 10, 25, 50, 75, 100)
+
+
+class Histogram:
+    '''Cumulative-bucket histogram, Prometheus style
+
+    Args:
+        buckets (tuple): Upper bounds of the buckets, ascending. +Inf is implied
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        '''(upper bound, cumulative count) pairs, ending with +Inf'''
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class TimedIterator:
+    '''Wraps an iterator and adds up the time spent waiting on it
+
+    Handy for streaming pipelines, where "fetching" happens in little bits inside somebody else's
+    loop.
+
+    Args:
+        iterable: What to wrap
+        on_done (callable, optional): Called with the total elapsed time once exhausted
+    '''
+
+    def __init__(self, iterable, on_done=None):
+        self._it = iter(iterable)
+        self._on_done = on_done
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._it)
+        except StopIteration:
+            self.elapsed += time.perf_counter() - start
+            if self._on_done:
+                self._on_done(self.elapsed)
+                self._on_done = None
+            raise
+        self.elapsed += time.perf_counter() - start
+        return item
+
+
+class Metrics:
+    '''Thread-safe store of counters and histograms, keyed by name and labels'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        '''Add `value` to a counter'''
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        '''Record a value in a histogram'''
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        '''Time the body of a with-statement into a histogram'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def phase(self, name, exclude=()):
+        '''Time one phase of a behavior's run (fetch, select, diff, apply, ...)
+
+        Args:
+            name (str): The phase
+            exclude (iterable, optional): :class:`TimedIterator` instances whose time belongs to
+                some other phase and should be subtracted from this one
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start - sum(t.elapsed for t in exclude)
+            self.observe('autoalbum_phase_seconds', max(elapsed, 0.0), phase=name)
+
+    def timed_phase_iter(self, iterable, name):
+        '''Wrap an iterator so the time spent pulling from it is recorded as phase `name`
+
+        The time is recorded once the iterator is exhausted.
+
+        Returns:
+            TimedIterator: Pass this to :meth:`phase` as `exclude` for the consuming phase
+        '''
+        return TimedIterator(iterable,
+            lambda elapsed: self.observe('autoalbum_phase_seconds', elapsed, phase=name))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        '''Everything recorded so far, JSON-friendly'''
+        with self._lock:
+            return {
+                'counters': [dict(name=name, labels=dict(labels), value=value)
+                    for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [dict(name=name, labels=dict(labels), count=h.count, sum=h.sum,
+                    buckets=[[str(b), c] for b, c in h.cumulative()])
+                    for (name, labels), h in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self):
+        '''Everything recorded so far, in the Prometheus text exposition format'''
+        def fmt_labels(labels, **extra):
+            pairs = list(labels) + sorted(extra.items())
+            if not pairs:
+                return ''
+            return '{' + ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                for k, v in pairs) + '}'
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append('# TYPE {} counter'.format(name))
+                    typed.add(name)
+                lines.append('{}{} {}'.format(name, fmt_labels(labels), value))
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append('# TYPE {} histogram'.format(name))
+                    typed.add(name)
+                for bound, count in h.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append('{}_bucket{} {}'.format(name, fmt_labels(labels, le=le), count))
+                lines.append('{}_sum{} {}'.format(name, fmt_labels(labels), h.sum))
+                lines.append('{}_count{} {}'.format(name, fmt_labels(labels), h.count))
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        '''Write :meth:`to_dict` to a file'''
+        _atomic_write(path, json.dumps(self.to_dict(), indent=2))
+
+    def write_prometheus(self, path):
+        '''Write :meth:`to_prometheus` to a file, atomically (the textfile collector insists)'''
+        _atomic_write(path, self.to_prometheus())
+
+
+def _atomic_write(path, text):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as file:
+        file.write(text)
+    os.replace(tmp, str(path))
+
+
+#: The registry everything records into
+REGISTRY = Metrics()
+
+
+def instrumented(func):
+    '''Decorator for API methods: counts calls and errors and times them
+
+    Generator functions (and async generators) are timed inside each step until they're
+    exhausted, not just until they return a generator. The caller's time between items doesn't
+    count. Coroutine functions are timed until they're done.
+    '''
+    name = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            REGISTRY.inc('autoalbum_api_calls_total', method=name)
+            elapsed = 0.0
+            steps = func(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = await steps.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            except Exception:
+                REGISTRY.inc('autoalbum_api_errors_total', method=name)
+                raise
+            finally:
+                await steps.aclose()
+                REGISTRY.observe('autoalbum_api_call_seconds', elapsed, method=name)
+        return wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            REGISTRY.inc('autoalbum_api_calls_total', method=name)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                REGISTRY.inc('autoalbum_api_errors_total', method=name)
+                raise
+            finally:
+                REGISTRY.observe('autoalbum_api_call_seconds', time.perf_counter() - start,
+                    method=name)
+        return wrapper
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            REGISTRY.inc('autoalbum_api_calls_total', method=name)
+            elapsed = 0.0
+            steps = func(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(steps)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    # Not timed: the caller has the item now, and whatever it does is its business
+                    yield item
+            except Exception:
+                REGISTRY.inc('autoalbum_api_errors_total', method=name)
+                raise
+            finally:
+                steps.close()
+                REGISTRY.observe('autoalbum_api_call_seconds', elapsed, method=name)
+        return wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        REGISTRY.inc('autoalbum_api_calls_total', method=name)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            REGISTRY.inc('autoalbum_api_errors_total', method=name)
+            raise
+        finally:
+            REGISTRY.observe('autoalbum_api_call_seconds', time.perf_counter() - start,
+                method=name)
+    return wrapper
+
+
+class CountingHttp:
+    '''Wraps an httplib2.Http (or AuthorizedHttp) to count responses and bytes received'''
+
+    def __init__(self, http):
+        self.http = http
+
+    def request(self, *args, **kwargs):
+        resp, content = self.http.request(*args, **kwargs)
+        REGISTRY.inc('autoalbum_http_bytes_received_total', len(content or b''))
+        REGISTRY.inc('autoalbum_http_responses_total', status=str(resp.status))
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
@@ -0,0 +1,320 @@
+'''Perceptual hashes of thumbnails, and finding near-identical ones
+
+A difference hash (:func:`dhash`) boils an image down to 64 bits that barely change between
+near-identical frames: the image is shrunk to a 9x8 grid of grays, and each bit says whether a
+cell is brighter than its right-hand neighbor. Two images are near-duplicates when their hashes
+differ in only a few bits, which a :class:`MultiIndex` finds without comparing every pair.
+
+Decoding images needs Pillow (``pip install autoalbum[dedupe]``) for real thumbnails. Plain
+8-bit PNGs, such as the ones :mod:`autoalbum.fakeserver` serves, decode without it.
+:class:`HashCache` keeps computed hashes on disk by media id, so no thumbnail is hashed twice.
+'''
+import importlib.util
+import io
+import sqlite3
+import struct
+import zlib
+
+#: Bits per side of the hash grid: 8 makes a 64-bit hash
+HASH_SIZE = 8
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Channels per pixel for each PNG color type (8-bit depth only)
+_PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+def distance(a, b):
+    '''Hamming distance between two hashes: how many bits differ'''
+    return _popcount(a ^ b)
+
+def _popcount_py(value):
+    return bin(value).count('1')
+
+# int.bit_count is new in Python 3.10
+_popcount = getattr(int, 'bit_count', _popcount_py)
+
+def dhash(pixels, width, height, hash_size=HASH_SIZE):
+    '''Difference hash of a grayscale image
+
+    Args:
+        pixels (bytes): One gray byte per pixel, row by row
+        width (int): Image width
+        height (int): Image height
+        hash_size (int, optional): Grid size. Default :data:`HASH_SIZE`
+
+    Returns:
+        int: ``hash_size ** 2`` bits
+    '''
+    grid = _shrink(pixels, width, height, hash_size + 1, hash_size)
+    value = 0
+    for row in range(hash_size):
+        line = grid[row * (hash_size + 1):(row + 1) * (hash_size + 1)]
+        for left, right in zip(line, line[1:]):
+            value = value << 1 | (left > right)
+    return value
+
+def _shrink(pixels, width, height, to_width, to_height):
+    '''Box-filter a grayscale image down to `to_width` x `to_height`; a list of averages'''
+    def spans(size, to_size):
+        return [(i * size // to_size, max((i + 1) * size // to_size, i * size // to_size + 1))
+            for i in range(to_size)]
+    columns = spans(width, to_width)
+    grid = []
+    for top, bottom in spans(height, to_height):
+        sums = [0] * width
+        for y in range(top, bottom):
+            row = pixels[y * width:(y + 1) * width]
+            sums = [s + p for s, p in zip(sums, row)]
+        area = bottom - top
+        grid += [sum(sums[left:right]) / ((right - left) * area) for left, right in columns]
+    return grid
+
+def hash_image(data, hash_size=HASH_SIZE):
+    '''Decode an image and take its :func:`dhash`
+
+    See :func:`hash_images` for hashing in a process pool.
+
+    Args:
+        data (bytes): The encoded image
+        hash_size (int, optional): Grid size. Default :data:`HASH_SIZE`
+
+    Returns:
+        int: The hash
+
+    Raises:
+        ValueError: If the image can't be decoded
+    '''
+    try:
+        from PIL import Image
+    except ImportError:
+        width, height, pixels = decode_png(data)
+        return dhash(pixels, width, height, hash_size)
+    try:
+        image = Image.open(io.BytesIO(data)).convert('L')
+    except OSError as e:
+        raise ValueError('Not an image: {}'.format(e)) from None
+    # Let Pillow do the (much faster, and better filtered) shrinking
+    image = image.resize((hash_size + 1, hash_size), Image.BOX)
+    return dhash(image.tobytes(), hash_size + 1, hash_size, hash_size)
+
+def decoder():
+    '''Which decoder :func:`hash_image` uses here: "pil" (Pillow) or "png" (the built-in one)
+
+    They shrink images a little differently, so their hashes of the same image can differ by a
+    bit or two. Anything caching hashes should keep the two apart.
+    '''
+    return 'pil' if importlib.util.find_spec('PIL') is not None else 'png'
+
+def hash_images(images, hash_size=HASH_SIZE):
+    ''':func:`hash_image` for a batch of images
+
+    Meant for process pools: one call per batch keeps the cost of shipping work between
+    processes down. Images that can't be decoded don't stop the rest.
+
+    Args:
+        images (list): Encoded images
+        hash_size (int, optional): Grid size. Default :data:`HASH_SIZE`
+
+    Returns:
+        list: The hash of each image, or None where it couldn't be decoded
+    '''
+    hashes = []
+    for data in images:
+        try:
+            hashes.append(hash_image(data, hash_size))
+        except (ValueError, zlib.error, struct.error):
+            hashes.append(None)
+    return hashes
+
+def decode_png(data):
+    '''Decode a non-interlaced, 8-bit PNG to grayscale, without Pillow
+
+    Args:
+        data (bytes): The PNG file
+
+    Returns:
+        tuple: Width, height and the pixels as one gray byte each
+
+    Raises:
+        ValueError: For anything else (other formats need Pillow)
+    '''
+    if not data.startswith(_PNG_SIGNATURE):
+        raise ValueError('Not a PNG (install Pillow for other formats)')
+    pos, header, compressed = len(_PNG_SIGNATURE), None, []
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'IDAT':
+            compressed.append(chunk)
+        elif kind == b'IEND':
+            break
+    if header is None:
+        raise ValueError('PNG has no header')
+    width, height, depth, color, _, _, interlace = header
+    if depth != 8 or color not in _PNG_CHANNELS or interlace:
+        raise ValueError('Unsupported PNG layout (install Pillow)')
+    channels = _PNG_CHANNELS[color]
+    raw = _unfilter(zlib.decompress(b''.join(compressed)), width * channels, height, channels)
+    if channels <= 2:
+        return width, height, bytes(raw[::channels])
+    # Same weights as Pillow's convert('L')
+    gray = bytes((r * 299 + g * 587 + b * 114) // 1000
+        for r, g, b in zip(raw[0::channels], raw[1::channels], raw[2::channels]))
+    return width, height, gray
+
+def _unfilter(data, stride, height, bpp):
+    '''Undo PNG scanline filters; returns the raw samples'''
+    out = bytearray(stride * height)
+    prior = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        kind = data[pos]
+        line = bytearray(data[pos + 1:pos + 1 + stride])
+        pos += 1 + stride
+        if kind == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xff
+        elif kind == 2:
+            line = bytearray((a + b) & 0xff for a, b in zip(line, prior))
+        elif kind == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prior[i]) >> 1)) & 0xff
+        elif kind == 4:
+            for i in range(stride):
+                a = line[i - bpp] if i >= bpp else 0
+                b = prior[i]
+                c = prior[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                line[i] = (line[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) \
+                    & 0xff
+        elif kind != 0:
+            raise ValueError('Bad PNG filter type {}'.format(kind))
+        out[y * stride:(y + 1) * stride] = line
+        prior = line
+    return out
+
+def encode_png(pixels, width, height):
+    '''Encode grayscale pixels as a PNG
+
+    Args:
+        pixels (bytes): One gray byte per pixel, row by row
+        width (int): Image width
+        height (int): Image height
+
+    Returns:
+        bytes: The PNG file
+    '''
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + \
+            struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+    rows = b''.join(b'\x00' + bytes(pixels[y * width:(y + 1) * width]) for y in range(height))
+    return _PNG_SIGNATURE + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) \
+        + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+class MultiIndex:
+    '''Multi-index hashing, for "which hashes are within distance r of this one?"
+
+    Each hash is cut into r + 1 blocks, and every block has a table of the hashes by that
+    block's value. If two hashes differ in at most r bits, then at least one of their r + 1
+    blocks is identical (pigeonhole). So a lookup only has to check the hashes that share a block
+    with it, not every hash.
+
+    Args:
+        radius (int): Most differing bits lookups will ask about
+        bits (int, optional): Hash length. Default 64
+    '''
+
+    def __init__(self, radius, bits=HASH_SIZE * HASH_SIZE):
+        self.radius = radius
+        blocks = min(radius + 1, bits)
+        edges = [bits * i // blocks for i in range(blocks + 1)]
+        self._blocks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables = [{} for _ in self._blocks]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item=None):
+        '''Add a hash (and something to go with it)'''
+        self._size += 1
+        entry = (value, item)
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            table.setdefault(value >> shift & mask, []).append(entry)
+
+    def find(self, value):
+        '''Everything within :attr:`radius` of `value`, lazily (so stopping at the first is cheap)
+
+        Yields:
+            tuple: Distance, hash and item
+        '''
+        checked = set()
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            for entry in table.get(value >> shift & mask, ()):
+                # A hash sharing several blocks with `value` is in several tables
+                if id(entry) in checked:
+                    continue
+                checked.add(id(entry))
+                d = distance(value, entry[0])
+                if d <= self.radius:
+                    yield d, entry[0], entry[1]
+
+
+class HashCache:
+    '''On-disk cache of perceptual hashes, by media id
+
+    A media item's pixels never change, so a hash is good forever. Hashes of different kinds
+    (algorithm, grid or thumbnail size, :func:`decoder`) are kept apart.
+
+    Args:
+        path (PathLike): Location of the SQLite database. Created if it doesn't exist
+        kind (str): What kind of hash this cache holds, e.g. "dhash8@64/pil"
+    '''
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self._conn = sqlite3.connect(str(path), timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS hashes (media_id TEXT NOT NULL, '
+            'kind TEXT NOT NULL, hash TEXT NOT NULL, PRIMARY KEY (media_id, kind))')
+
+    def get_many(self, media_ids):
+        '''Look hashes up
+
+        Returns:
+            dict: Media id to hash, for those that are cached
+        '''
+        found = {}
+        media_ids = list(media_ids)
+        # Stay under SQLite's limit on query parameters
+        for start in range(0, len(media_ids), 500):
+            chunk = media_ids[start:start + 500]
+            rows = self._conn.execute('SELECT media_id, hash FROM hashes WHERE kind = ? AND '
+                'media_id IN ({})'.format(','.join('?' * len(chunk))), [self.kind] + chunk)
+            # Stored as hex: 64-bit hashes don't fit SQLite's signed integers
+            found.update((media_id, int(value, 16)) for media_id, value in rows)
+        return found
+
+    def put_many(self, hashes):
+        '''Store hashes
+
+        Args:
+            hashes (dict): Media id to hash
+        '''
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?)',
+                [(media_id, self.kind, '{:x}'.format(value)) for media_id, value in hashes.items()])
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM hashes WHERE kind = ?',
+            (self.kind,)).fetchone()[0]
+
+    def close(self):
+        '''Close the database connection'''
+        self._conn.close()
@@ -0,0 +1,200 @@
+'''Behaviors as streaming pipelines: source, then stages, then a sink
+
+Most behaviors have the same shape: stream media out of a source album, filter it, rank or sample
+it down to a handful, and make a destination album match. A :class:`Pipeline` strings those steps
+together out of generators, so items flow through one at a time and nothing is materialized
+between stages (unless a stage has to, like picking the top N):
+
+    >>> newest = Pipeline('n_most_recent', album_records('source'),
+    ...     [images(), top(5, key=lambda m: m.timestamp)],
+    ...     sync_to('destination'))
+    >>> newest.run(api, conf_data)
+    {'fetch': 1.92, 'images': 0.01, 'select': 0.03, 'sync': 0.41}
+
+Every stage is timed on its own, even though they all run interleaved. Each stage's time is
+recorded as a phase in :data:`autoalbum.metrics.REGISTRY` (the sink records its own ``diff`` and
+``apply`` phases), and :meth:`Pipeline.run` returns them all.
+'''
+import heapq
+import time
+from itertools import islice
+
+from autoalbum import diff
+from autoalbum.media import MediaRecord
+from autoalbum.metrics import REGISTRY, TimedIterator
+
+
+class Stage:
+    '''One step of a pipeline
+
+    Args:
+        name (str): What to report its time as
+        func (callable): Takes an iterator of items, returns an iterator of items. Should be lazy
+    '''
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+    def __call__(self, items):
+        return self.func(items)
+
+    def __repr__(self):
+        return 'Stage({!r})'.format(self.name)
+
+
+class Source(Stage):
+    '''Where a pipeline's items come from
+
+    Args:
+        name (str): What to report its time as
+        func (callable): Takes the API and the job's configuration data, returns an iterator
+    '''
+
+    def __call__(self, api, conf_data):
+        return self.func(api, conf_data)
+
+
+class Sink(Stage):
+    '''What a pipeline does with its items in the end
+
+    Args:
+        name (str): What to report its time as
+        func (callable): Takes an iterator of items, the API and the job's configuration data.
+            Its return value is thrown away
+    '''
+
+    def __call__(self, items, api, conf_data):
+        return self.func(items, api, conf_data)
+
+
+class Pipeline:
+    '''A source, any number of stages and (optionally) a sink
+
+    Args:
+        name (str): The pipeline's name, for reporting
+        source (Source): Where items come from
+        stages (list, optional): :class:`Stage` instances to pass items through, in order
+        sink (Sink, optional): What to do with the items that come out the other end
+    '''
+
+    def __init__(self, name, source, stages=(), sink=None):
+        self.name = name
+        self.source = source
+        self.stages = list(stages)
+        self.sink = sink
+
+    def _chain(self, api, conf_data):
+        '''The stages wired together, each one's output wrapped in a TimedIterator'''
+        timed = [TimedIterator(self.source(api, conf_data))]
+        for stage in self.stages:
+            timed.append(TimedIterator(stage(timed[-1])))
+        return timed
+
+    def iter(self, api, conf_data):
+        '''Stream the items that come out of the last stage, skipping the sink
+
+        Handy for trying a pipeline out, or for feeding it into something else.
+        '''
+        return self._chain(api, conf_data)[-1]
+
+    def run(self, api, conf_data):
+        '''Run the whole pipeline, sink included
+
+        Args:
+            api (autoalbum.api.API): API instance to poke Google with
+            conf_data (dict): Configuration data from your configuration file
+
+        Returns:
+            dict: Seconds spent in each stage (its own time, not its upstream's), by stage name
+        '''
+        timed = self._chain(api, conf_data)
+        start = time.perf_counter()
+        if self.sink is not None:
+            self.sink(timed[-1], api, conf_data)
+        else:
+            for _ in timed[-1]:
+                pass
+        total = time.perf_counter() - start
+
+        # Each TimedIterator counts its upstream's time too; peel that off
+        report = {}
+        upstream = 0.0
+        for stage, t in zip([self.source] + self.stages, timed):
+            report[stage.name] = max(t.elapsed - upstream, 0.0)
+            upstream = t.elapsed
+        for name, seconds in report.items():
+            REGISTRY.observe('autoalbum_phase_seconds', seconds, phase=name)
+        if self.sink is not None:
+            report[self.sink.name] = max(total - upstream, 0.0)
+        return report
+
+
+def album_records(key='source', fields=MediaRecord.FIELDS, name='fetch'):
+    '''Source: records of every media item in one of the job's albums
+
+    Args:
+        key (str, optional): Which album in the configuration data. Default "source"
+        fields (str, optional): Media item fields to fetch. Default :data:`MediaRecord.FIELDS`
+        name (str, optional): Stage name. Default "fetch"
+    '''
+    return Source(name,
+        lambda api, conf_data: api.iter_album_records(conf_data[key]['id'], fields=fields))
+
+def keep(predicate, name='filter'):
+    '''Stage: only the items `predicate` is true for'''
+    return Stage(name, lambda items: filter(predicate, items))
+
+def images(name='images'):
+    '''Stage: only images, no videos'''
+    return keep(lambda m: m.is_image, name)
+
+def transform(func, name='map'):
+    '''Stage: `func` applied to every item'''
+    return Stage(name, lambda items: map(func, items))
+
+def limit(n, name='limit'):
+    '''Stage: the first `n` items, after which upstream isn't pulled from any more'''
+    return Stage(name, lambda items: islice(items, max(n, 0)))
+
+def top(n, key, name='select'):
+    '''Stage: the `n` items with the largest `key`, smallest first
+
+    One pass with a bounded heap, so memory is O(n). The result is the same as a stable sort by
+    `key` followed by ``[-n:]``: among equal keys, the items that came later win. That includes
+    the slicing quirks for ``n <= 0`` (all items, or all but the first ``-n``).
+
+    Args:
+        n (int): How many to keep
+        key (callable): Sort key
+        name (str, optional): Stage name. Default "select"
+    '''
+    def select(items):
+        keyed = ((key(m), i, m) for i, m in enumerate(items))
+        if n <= 0:
+            # Slicing with [-0:] (or a negative n) doesn't mean "top n"; keep the old semantics
+            return iter([m for _, _, m in sorted(keyed, key=lambda e: e[:2])][-n:])
+        # (key, position) is unique, so the items themselves are never compared
+        return iter([m for _, _, m in reversed(heapq.nlargest(n, keyed, key=lambda e: e[:2]))])
+    return Stage(name, _deferred(select))
+
+def _deferred(func):
+    '''Make an eager items -> iterator function lazy: nothing happens until the first next()'''
+    def stage(items):
+        yield from func(items)
+    return stage
+
+def sync_to(key='destination', dry_run=None, name='sync'):
+    '''Sink: make one of the job's albums contain exactly the incoming items, in order
+
+    Only the final ids are collected; see :func:`autoalbum.diff.sync_album`.
+
+    Args:
+        key (str, optional): Which album in the configuration data. Default "destination"
+        dry_run (PathLike, optional): Write the plan here ("-" for stdout) instead of applying it
+        name (str, optional): Stage name. Default "sync"
+    '''
+    def sync(items, api, conf_data):
+        wanted = [m.id for m in items]
+        diff.sync_album(api, conf_data[key]['id'], wanted, dry_run)
+    return Sink(name, sync)
@@ -0,0 +1,219 @@
+'''Runs album jobs: one or many source/destination pairs, once or as a daemon
+
+A config file can either describe a single job (top-level ``source`` and ``destination``, with
+the behavior picked on the command line) or a list of them::
+
+    {
+        "auth": {...},
+        "parallelism": 4,
+        "jobs": [
+            {
+                "name": "recent baby pics",
+                "behavior": "n_most_recent",
+                "args": ["-n", "10"],
+                "source": {"id": "...", "is_shared": false},
+                "destination": {"id": "...", "is_shared": false}
+            }
+        ]
+    }
+
+``behavior`` is a registered behavior name or a dotted module path; see
+:mod:`autoalbum.behavior`. All jobs share one :class:`autoalbum.api.API` (and so one set of
+credentials, one rate limiter and one index), and run concurrently on a thread pool.
+'''
+import signal
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from autoalbum.behavior import load as load_behavior
+
+JobResult = namedtuple('JobResult', ['name', 'status', 'elapsed', 'error'])
+JobResult.__doc__ = '''Outcome of one job run
+
+``status`` is one of "ok", "skipped" (nothing changed) or "failed" (see ``error``)
+'''
+
+class Job:
+    '''One behavior run against one source/destination pair
+
+    Args:
+        name (str): Name to report this job by
+        module: The loaded behavior module
+        args (argparse.Namespace): The behavior's parsed arguments
+        conf_data (dict): Configuration data as the behavior expects it, i.e. with this job's
+            ``source`` and ``destination`` at the top level
+    '''
+
+    def __init__(self, name, module, args, conf_data):
+        self.name = name
+        self.module = module
+        self.args = args
+        self.conf_data = conf_data
+        self.fingerprint = getattr(module, 'fingerprint', source_fingerprint)
+        self.last_seen = None
+
+    def run(self, api, skip_unchanged=False):
+        '''Run this job's behavior
+
+        Args:
+            api (autoalbum.api.API): API instance to poke Google with
+            skip_unchanged (bool, optional): Don't bother if the source hasn't changed since this
+                job last ran successfully
+
+        Returns:
+            JobResult: How it went. Exceptions are caught and reported here, not raised.
+        '''
+        start = time.perf_counter()
+        try:
+            current = self.fingerprint(api, self.conf_data) if skip_unchanged else None
+            if skip_unchanged and current == self.last_seen:
+                return JobResult(self.name, 'skipped', time.perf_counter() - start, None)
+            self.module.run(api, self.conf_data, **vars(self.args))
+            # Only remember it once a run got all the way through
+            self.last_seen = current
+            return JobResult(self.name, 'ok', time.perf_counter() - start, None)
+        except Exception as e:
+            return JobResult(self.name, 'failed', time.perf_counter() - start, e)
+
+    async def run_async(self, api):
+        '''Run this job's behavior on an :class:`autoalbum.aio.AsyncAPI`
+
+        The behavior needs a ``run_async(api, conf_data, ...)`` coroutine function for this.
+
+        Returns:
+            JobResult: How it went. Exceptions are caught and reported here, not raised.
+        '''
+        start = time.perf_counter()
+        try:
+            if not hasattr(self.module, 'run_async'):
+                raise NotImplementedError(
+                    '{} has no run_async'.format(self.module.__name__))
+            await self.module.run_async(api, self.conf_data, **vars(self.args))
+            return JobResult(self.name, 'ok', time.perf_counter() - start, None)
+        except Exception as e:
+            return JobResult(self.name, 'failed', time.perf_counter() - start, e)
+
+
+def source_fingerprint(api, conf_data):
+    '''Cheap "has anything changed?" check: one call for the source album's metadata
+
+    Behaviors can override this by defining their own ``fingerprint(api, conf_data)``.
+
+    Args:
+        api (autoalbum.api.API): API instance to poke Google with
+        conf_data (dict): Configuration data from your configuration file
+
+    Returns:
+        tuple: Something that changes whenever the source album's contents do
+    '''
+    album = api.get_album(conf_data['source']['id'],
+        fields='mediaItemsCount,coverPhotoMediaItemId')
+    return (album.get('mediaItemsCount'), album.get('coverPhotoMediaItemId'))
+
+def load_jobs(conf_data, behavior, unknown_args):
+    '''Build the list of jobs described by a config file
+
+    Args:
+        conf_data (dict): Configuration data from your configuration file
+        behavior (str): Behavior (name or module) for single-job configs, and for jobs that don't
+            name one
+        unknown_args (list): Behavior arguments from the command line, for single-job configs
+
+    Returns:
+        list: :class:`Job` instances
+    '''
+    modules = {}
+    def load(name):
+        if name not in modules:
+            modules[name] = load_behavior(name)
+        return modules[name]
+
+    if 'jobs' not in conf_data:
+        mod = load(behavior)
+        return [Job(behavior, mod, mod.parse_args(unknown_args), conf_data)]
+
+    shared = {k: v for k, v in conf_data.items() if k not in ('jobs', 'parallelism')}
+    jobs = []
+    for i, spec in enumerate(conf_data['jobs']):
+        mod = load(spec.get('behavior', behavior))
+        job_conf = dict(shared, source=spec['source'], destination=spec['destination'])
+        jobs.append(Job(spec.get('name', 'job-{}'.format(i)), mod,
+            mod.parse_args(spec.get('args', [])), job_conf))
+    return jobs
+
+def required_scopes(jobs):
+    '''Union of the scopes every job's behavior needs, in a stable order'''
+    scopes = []
+    for job in jobs:
+        scopes += [s for s in job.module.SCOPES if s not in scopes]
+    return scopes
+
+def run_jobs(api, jobs, parallelism=1, skip_unchanged=False):
+    '''Run jobs concurrently against a shared API
+
+    Jobs that share a source album don't each page through it: scans of one album take turns
+    (see :meth:`autoalbum.api.API.iter_all_album_contents`), so whichever job gets there first scans
+    it into the index and the others wait, then read that copy.
+
+    Args:
+        api (autoalbum.api.API): API instance shared by every job
+        jobs (list): :class:`Job` instances
+        parallelism (int, optional): How many jobs may run at once. Default 1
+        skip_unchanged (bool, optional): See :meth:`Job.run`
+
+    Returns:
+        list: A :class:`JobResult` per job, in order
+    '''
+    if parallelism <= 1 or len(jobs) <= 1:
+        return [job.run(api, skip_unchanged) for job in jobs]
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        return list(pool.map(lambda job: job.run(api, skip_unchanged), jobs))
+
+async def run_jobs_async(api, jobs, parallelism=1):
+    '''Run jobs concurrently on one event loop, against a shared AsyncAPI
+
+    Args:
+        api (autoalbum.aio.AsyncAPI): API instance shared by every job
+        jobs (list): :class:`Job` instances
+        parallelism (int, optional): How many jobs may run at once. Default 1
+
+    Returns:
+        list: A :class:`JobResult` per job, in order
+    '''
+    import asyncio
+    limit = asyncio.Semaphore(max(parallelism, 1))
+    async def run(job):
+        async with limit:
+            return await job.run_async(api)
+    return list(await asyncio.gather(*(run(job) for job in jobs)))
+
+def print_summary(results):
+    '''Print a line per job result'''
+    width = max([len(r.name) for r in results] + [3])
+    for r in results:
+        print('{:<{width}}  {:<7}  {:>8.2f}s  {}'.format(
+            r.name, r.status, r.elapsed, repr(r.error) if r.error else '', width=width))
+
+def run_daemon(api, jobs, interval, parallelism=1):
+    '''Run jobs every `interval` seconds until SIGTERM (or SIGINT)
+
+    Jobs whose source looks unchanged since their last successful run are skipped.
+
+    Args:
+        api (autoalbum.api.API): API instance to reuse across ticks
+        jobs (list): :class:`Job` instances
+        interval (float): Seconds between change checks
+        parallelism (int, optional): How many jobs may run at once. Default 1
+    '''
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+    while not stop.is_set():
+        results = run_jobs(api, jobs, parallelism, skip_unchanged=True)
+        if any(r.status != 'skipped' for r in results):
+            print_summary(results)
+        stop.wait(interval)
+    print('Shutting down')
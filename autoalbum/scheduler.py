@@ -0,0 +1,286 @@
+'''Central request scheduler: rate limiting, retries and a request budget
+
+Every call :class:`autoalbum.api.API` (or :class:`autoalbum.aio.AsyncAPI`) makes goes through a
+:class:`RequestScheduler`. It paces requests with a token bucket so bursts don't set off Google's
+throttling, retries throttled (429) and server-side (5xx) failures with exponential backoff and
+jitter, honors ``Retry-After`` and stops the run once a request budget is used up.
+
+The pacing doesn't know about the daily quota (requests per project per day), which is shared
+by every run and every account of the project. To keep a run inside its share, give it a budget
+(``--request-budget``).
+
+See: https://developers.google.com/photos/library/guides/api-limits-quotas
+'''
+import email.utils
+import functools
+import random
+import socket
+import threading
+import time
+
+from autoalbum.metrics import REGISTRY
+
+#: Default sustained request rate, in requests per second
+DEFAULT_RATE = 5.0
+#: Default burst size, in requests
+DEFAULT_BURST = 10
+
+#: HTTP statuses worth trying again
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+@functools.lru_cache(maxsize=None)
+def _error_types():
+    '''googleapiclient's HttpError, and the transport-level failures worth trying again
+
+    Imported on first use rather than with this module: httplib2 alone takes ~0.1s to import.
+    '''
+    import httplib2
+    from googleapiclient.errors import HttpError
+    return HttpError, (ConnectionError, socket.timeout, httplib2.HttpLib2Error)
+
+
+class RequestBudgetExceeded(Exception):
+    '''Raised when a run tries to make more requests than its budget allows'''
+
+
+class TokenBucket:
+    '''Thread-safe token bucket
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Most tokens the bucket holds, i.e. the largest burst
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        '''Block until `tokens` tokens are available, then take them
+
+        Asking for more than the capacity is allowed; the caller just waits for the bucket to go
+        into debt and climb back out.
+
+        Args:
+            tokens (float, optional): How many tokens to take. Default 1
+        '''
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        '''Like :meth:`acquire`, but waits without blocking the event loop'''
+        import asyncio
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def try_acquire(self, tokens=1):
+        '''Take `tokens` tokens if they're available right now
+
+        Returns:
+            float: 0 if the tokens were taken, else roughly how long to wait before trying again
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._paused_until and self._tokens >= min(tokens, self.capacity):
+                self._tokens -= tokens
+                return 0.0
+            return max(self._paused_until - now,
+                (min(tokens, self.capacity) - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        '''Hand out no tokens at all for the next `seconds` seconds
+
+        Used when Google tells us to back off, so that every thread backs off, not just the one
+        that got the 429.
+        '''
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class RequestScheduler:
+    '''Executes googleapiclient requests under a rate limit, with retries and a budget
+
+    Args:
+        rate (float, optional): Sustained requests per second. Default :data:`DEFAULT_RATE`
+        burst (int, optional): Largest burst of requests. Default :data:`DEFAULT_BURST`
+        max_retries (int, optional): Retries per request before giving up. Default 5
+        base_delay (float, optional): First backoff delay, in seconds. Doubles every retry.
+            Default 1
+        max_delay (float, optional): Longest backoff delay, in seconds. Default 64
+        budget (int, optional): Most requests (retries included) this scheduler will ever send.
+            Default None, for no limit
+    '''
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_retries=5, base_delay=1.0,
+            max_delay=64.0, budget=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.requests_sent = 0
+        self._lock = threading.Lock()
+
+    def execute(self, request, http=None, cost=1):
+        '''Execute a request, waiting for the rate limiter and retrying as needed
+
+        Args:
+            request: A googleapiclient HttpRequest (or BatchHttpRequest)
+            http (optional): The Http object to execute on
+            cost (int, optional): How many quota units the request uses. A multipart batch costs
+                one per call inside it. Default 1
+
+        Returns:
+            The deserialized response
+
+        Raises:
+            RequestBudgetExceeded: If the request would go over budget
+            googleapiclient.errors.HttpError: If the request failed for good
+        '''
+        retryable_errors = _error_types()[1]
+        attempt = 0
+        while True:
+            self._spend(cost)
+            with REGISTRY.timer('autoalbum_rate_limit_wait_seconds'):
+                self.bucket.acquire(cost)
+            try:
+                return request.execute(http=http) if http else request.execute()
+            except Exception as e:
+                delay = self._next_attempt(e, attempt, retryable_errors)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def execute_async(self, send, cost=1, transport_errors=()):
+        '''Coroutine twin of :meth:`execute`, for :class:`autoalbum.aio.AsyncAPI`
+
+        Args:
+            send: Coroutine function that makes the request (afresh each time it's called) and
+                returns the response, raising googleapiclient's HttpError for error statuses
+            cost (int, optional): How many quota units the request uses. Default 1
+            transport_errors (tuple, optional): The transport's own exception types worth
+                retrying, on top of the usual ones
+
+        Returns:
+            Whatever `send` returned
+
+        Raises:
+            RequestBudgetExceeded: If the request would go over budget
+            googleapiclient.errors.HttpError: If the request failed for good
+        '''
+        import asyncio
+        retryable_errors = _error_types()[1] + tuple(transport_errors)
+        attempt = 0
+        while True:
+            self._spend(cost)
+            with REGISTRY.timer('autoalbum_rate_limit_wait_seconds'):
+                await self.bucket.acquire_async(cost)
+            try:
+                return await send()
+            except Exception as e:
+                delay = self._next_attempt(e, attempt, retryable_errors)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _next_attempt(self, error, attempt, retryable_errors):
+        '''Decide what happens after attempt number `attempt` (counting from 0) failed
+
+        The one place :meth:`execute` and :meth:`execute_async` make this call, so they can't
+        drift apart. Counts the failure, and on a 429 pauses the bucket for everybody.
+
+        Args:
+            error (Exception): What the attempt raised
+            attempt (int): Which attempt it was
+            retryable_errors (tuple): Transport-level exception types worth another try
+
+        Returns:
+            float: Seconds to wait before trying again, or None to give up (and re-raise)
+        '''
+        if isinstance(error, _error_types()[0]):
+            quota = self.is_quota_error(error)
+            if quota:
+                REGISTRY.inc('autoalbum_quota_errors_total')
+            if not self.is_retryable(error) or attempt >= self.max_retries:
+                return None
+            delay = self.retry_delay(attempt, error)
+            if quota:
+                self.bucket.pause(delay)
+            REGISTRY.inc('autoalbum_retries_total', reason=str(error.resp.status))
+            return delay
+        if not isinstance(error, retryable_errors) or attempt >= self.max_retries:
+            return None
+        REGISTRY.inc('autoalbum_retries_total', reason=type(error).__name__)
+        return self.retry_delay(attempt)
+
+    def _spend(self, cost):
+        with self._lock:
+            if self.budget is not None and self.requests_sent + cost > self.budget:
+                raise RequestBudgetExceeded(
+                    'Request budget of {} exhausted'.format(self.budget))
+            self.requests_sent += cost
+
+    @staticmethod
+    def is_quota_error(error):
+        '''Check whether an error is Google telling us to slow down (HTTP 429)'''
+        return isinstance(error, _error_types()[0]) and error.resp.status == 429
+
+    @staticmethod
+    def is_retryable(error):
+        '''Check whether an error is worth another try
+
+        Args:
+            error (Exception): Whatever a request raised (or a batch callback was handed)
+
+        Returns:
+            bool: True for throttling, 5xx responses and dropped connections
+        '''
+        http_error, retryable_errors = _error_types()
+        if isinstance(error, http_error):
+            return error.resp.status in RETRYABLE_STATUSES
+        return isinstance(error, retryable_errors)
+
+    def retry_delay(self, attempt, error=None):
+        '''How long to wait before retry number `attempt` (counting from 0)
+
+        ``Retry-After`` wins if the server sent one. Otherwise it's "full jitter" exponential
+        backoff: a uniformly random delay up to ``base_delay * 2**attempt``, capped at
+        ``max_delay``.
+        '''
+        retry_after = _parse_retry_after(error.resp.get('retry-after')) if error else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def _parse_retry_after(value):
+    '''Parse a Retry-After header (delay in seconds, or an HTTP date) into seconds from now'''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
@@ -0,0 +1,345 @@
+'''Runs many accounts at once: one directory per account, spread over a process pool
+
+Point it at a directory with a subdirectory per account::
+
+    accounts/
+        grandma/
+            config.json         # From autoalbum.configurator: auth, source/destination or jobs
+            credentials.json    # This account's login (see autoalbum.credentials)
+        smith-family/
+            config.json
+            credentials.json
+
+and each account runs its config's jobs, as ``python -m autoalbum -c accounts/grandma
+--credentials accounts/grandma/credentials.json`` would, but with up to ``--workers`` accounts
+running at once in separate processes. Wall time then grows with the number of accounts per
+core rather than with the number of accounts.
+
+Accounts are kept apart:
+
+* Each account has its own credentials, its own local index and journal (``index.sqlite`` and
+  ``journal.jsonl`` in its directory, as are behavior caches), and its own
+  :class:`autoalbum.scheduler.RequestScheduler`. Its config can set its own limits, which
+  override the command line's::
+
+      "limits": {"rate": 2, "burst": 5, "max_retries": 3, "request_budget": 20000}
+
+* A failing account (a bad config, an expired login, a job that raises) is reported as failed
+  and doesn't stop the others. Accounts never log in interactively from here: an account without
+  a ``credentials.json`` fails right away. Log it in once with ``python -m autoalbum`` first.
+* Metrics are reset for each account, so each account's report only counts its own requests.
+
+When every account is done, a report with a line per account (and, with ``--report``, a JSON
+file with each job's outcome and each account's metrics) is printed. The exit status is 1 if any
+account failed.
+
+``--endpoint`` (or ``"endpoint"`` in an account's config) sends an account's requests to a
+Photos Library look-alike instead of Google, such as :mod:`autoalbum.fakeserver`. No credentials
+are needed for that::
+
+    $ python -m autoalbum.fakeserver --album src=5000 --album dst --latency 0.01 &
+    $ python -m autoalbum.tenants accounts/ --endpoint http://127.0.0.1:8080 --workers 8
+'''
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from pathlib import Path
+from urllib.request import urlopen
+
+from autoalbum import runner
+from autoalbum.metrics import REGISTRY
+from autoalbum.scheduler import DEFAULT_RATE, RequestScheduler
+from autoalbum.util import load_json, save_json
+
+#: An account's config file, in its directory
+CONFIG_NAME = 'config.json'
+#: An account's credentials file, in its directory
+CREDENTIALS_NAME = 'credentials.json'
+# Per-account limits and the RequestScheduler arguments they set
+_LIMITS = {'rate': 'rate', 'burst': 'burst', 'max_retries': 'max_retries',
+    'request_budget': 'budget'}
+_TIMEOUT = 30
+
+AccountReport = namedtuple('AccountReport',
+    ['name', 'status', 'elapsed', 'requests', 'jobs', 'error', 'metrics'])
+AccountReport.__doc__ = '''Outcome of one account's run
+
+``status`` is "ok" if every job was, else "failed". ``jobs`` holds a
+:class:`autoalbum.runner.JobResult` per job, with errors as strings so they cross process
+boundaries. ``error`` is set if the account couldn't run at all. ``requests`` counts what the
+account's scheduler sent (retries included), and ``metrics`` is its
+:meth:`autoalbum.metrics.Metrics.to_dict`.
+'''
+
+def find_accounts(root, names=None):
+    '''The account directories under `root`: those with a config file, by name
+
+    Args:
+        root (PathLike): Directory of account directories
+        names (list, optional): Only these accounts. Default: all of them
+
+    Returns:
+        list: Paths of the account directories
+
+    Raises:
+        ValueError: If one of `names` isn't an account under `root`
+    '''
+    accounts = sorted(p for p in Path(root).iterdir() if (p / CONFIG_NAME).is_file())
+    if names is None:
+        return accounts
+    by_name = {p.name: p for p in accounts}
+    missing = [n for n in names if n not in by_name]
+    if missing:
+        raise ValueError('No such account(s) under {}: {}'.format(root, ', '.join(missing)))
+    return [by_name[n] for n in names]
+
+def endpoint_service(root_url):
+    '''Build a service for a Photos Library look-alike, from the discovery document it serves
+
+    Args:
+        root_url (str): Where it lives, e.g. the :attr:`autoalbum.fakeserver.FakePhotosServer.url`
+
+    Returns:
+        The service instance (unauthenticated)
+    '''
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    with urlopen(root_url.rstrip('/') + '/$discovery/rest', timeout=_TIMEOUT) as response:
+        document = response.read().decode('utf-8')
+    return build_from_document(document, http=httplib2.Http())
+
+def _scheduler(conf_data, limits):
+    '''The account's scheduler: the config's "limits" over the defaults in `limits`'''
+    merged = dict(limits or {}, **conf_data.get('limits', {}))
+    unknown = set(merged) - set(_LIMITS)
+    if unknown:
+        raise ValueError('Unknown limits: {}'.format(', '.join(sorted(unknown))))
+    return RequestScheduler(**{_LIMITS[k]: v for k, v in merged.items() if v is not None})
+
+def run_account(path, behavior='n_most_recent', behavior_args=(), endpoint=None, limits=None,
+        parallelism=None, **api_kwargs):
+    '''Run one account's jobs, start to finish. This is what each worker process does
+
+    Unfinished album edits in the account's journal are resumed first, as with
+    ``python -m autoalbum``.
+
+    Args:
+        path (PathLike): The account's directory
+        behavior (str, optional): Behavior for single-job configs, and jobs that don't name one.
+            Default n_most_recent
+        behavior_args (list, optional): Arguments for that behavior, for single-job configs
+        endpoint (str, optional): Root URL of a Photos Library look-alike to use instead of
+            Google. The config's "endpoint" wins over this
+        limits (dict, optional): Default rate, burst, max_retries and request_budget. The
+            config's "limits" win over these
+        parallelism (int, optional): Jobs at once within the account. Default: the config's
+            "parallelism", or 1
+        api_kwargs: Further keyword arguments are forwarded to :class:`autoalbum.api.API`
+
+    Returns:
+        AccountReport: How it went. Exceptions are caught and reported here, not raised.
+    '''
+    from autoalbum.api import API, BatchJobError
+    from autoalbum.index import MediaIndex
+    from autoalbum.journal import Journal
+
+    path = Path(path)
+    start = time.perf_counter()
+    # Worker processes are reused; don't let one account's numbers leak into the next's
+    REGISTRY.reset()
+    scheduler, results, refresher = None, [], None
+    try:
+        conf_data = load_json(path / CONFIG_NAME)
+        jobs = runner.load_jobs(conf_data, behavior, list(behavior_args))
+        scheduler = _scheduler(conf_data, limits)
+        endpoint = conf_data.get('endpoint', endpoint)
+        if endpoint:
+            service, creds = endpoint_service(endpoint), None
+        else:
+            service, creds, refresher = _google_service(path, conf_data['auth'],
+                runner.required_scopes(jobs))
+        # Whatever got opened gets closed (in reverse), even if opening the next thing fails
+        with ExitStack() as stack:
+            index = MediaIndex(path / 'index.sqlite')
+            stack.callback(index.close)
+            journal = Journal(path / 'journal.jsonl')
+            stack.callback(journal.close)
+            api = stack.enter_context(API(service, creds, index=index, scheduler=scheduler,
+                journal=journal, **api_kwargs))
+            if journal.unfinished():
+                resume_start = time.perf_counter()
+                try:
+                    api.resume()
+                except BatchJobError as e:
+                    # Like the jobs themselves: report it, and carry on with the rest
+                    results.append(runner.JobResult('(resume)', 'failed',
+                        time.perf_counter() - resume_start, e))
+            results += runner.run_jobs(api, jobs, parallelism or conf_data.get('parallelism', 1))
+    except Exception as e:
+        return _report(path, start, scheduler, results, e)
+    finally:
+        if refresher is not None:
+            refresher.stop()
+    return _report(path, start, scheduler, results)
+
+def _google_service(path, client_config, scopes):
+    '''Service, credentials and token refresher for an account, from its own credentials file'''
+    from autoalbum.credentials import CredentialStore, TokenRefresher
+    from autoalbum.discovery import build_service
+
+    credentials_path = path / CREDENTIALS_NAME
+    if not credentials_path.is_file():
+        # Logging in means a browser; not something to spring on a worker process
+        raise FileNotFoundError('{} not found; log in with python -m autoalbum -c {} '
+            '--credentials {} first'.format(credentials_path, path, credentials_path))
+    store = CredentialStore(credentials_path)
+    creds = store.get(client_config, scopes)
+    # Started here (not by autoalbum.auth) so it can be stopped when the account is done:
+    # this process may go on to run other accounts
+    refresher = TokenRefresher(store, creds).start()
+    return build_service(creds), creds, refresher
+
+def _report(path, start, scheduler, results, error=None):
+    failed = error is not None or any(r.status == 'failed' for r in results)
+    return AccountReport(path.name, 'failed' if failed else 'ok', time.perf_counter() - start,
+        scheduler.requests_sent if scheduler is not None else 0,
+        [r._replace(error=repr(r.error) if r.error is not None else None) for r in results],
+        repr(error) if error is not None else None, REGISTRY.to_dict())
+
+def run_accounts(accounts, workers=None, on_done=None, **kwargs):
+    '''Run accounts on a process pool
+
+    Args:
+        accounts (list): Account directories; see :func:`find_accounts`
+        workers (int, optional): Accounts at once. Default: one per core
+        on_done (callable, optional): Called with each :class:`AccountReport` as it comes in
+        kwargs: Further keyword arguments are forwarded to :func:`run_account`
+
+    Returns:
+        list: An :class:`AccountReport` per account, in order
+    '''
+    workers = min(workers or os.cpu_count() or 1, max(len(accounts), 1))
+    reports = [None] * len(accounts)
+    # Spawned, not forked, so no worker inherits another thread's half-finished state
+    with ProcessPoolExecutor(max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(run_account, str(path), **kwargs): i
+            for i, path in enumerate(accounts)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                reports[i] = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed, or out of memory)
+                reports[i] = AccountReport(Path(accounts[i]).name, 'failed', 0.0, 0, [],
+                    repr(e), None)
+            if on_done is not None:
+                on_done(reports[i])
+    return reports
+
+def summary(reports, wall, workers):
+    '''The consolidated report of a run, JSON-friendly
+
+    Args:
+        reports (list): :class:`AccountReport` per account
+        wall (float): Seconds the whole run took
+        workers (int): Worker processes it had
+
+    Returns:
+        dict: Totals, and every account's report
+    '''
+    busy = sum(r.elapsed for r in reports)
+    return {
+        'wall_seconds': wall,
+        'account_seconds': busy,
+        'speedup': busy / wall if wall else None,
+        'workers': workers,
+        'accounts': len(reports),
+        'failed': sum(1 for r in reports if r.status == 'failed'),
+        'requests': sum(r.requests for r in reports),
+        'reports': [dict(r._asdict(), jobs=[j._asdict() for j in r.jobs]) for r in reports],
+    }
+
+def print_report(report):
+    '''Print a line per account of a :func:`summary`, then the totals'''
+    rows = report['reports']
+    width = max([len(r['name']) for r in rows] + [7])
+    for r in rows:
+        jobs = r['jobs']
+        ok = sum(1 for j in jobs if j['status'] != 'failed')
+        problems = [r['error']] if r['error'] else \
+            ['{}: {}'.format(j['name'], j['error']) for j in jobs if j['error']]
+        print('{:<{width}}  {:<6}  {:>3}/{:<3} jobs  {:>7} requests  {:>8.2f}s  {}'.format(
+            r['name'], r['status'], ok, len(jobs), r['requests'], r['elapsed'],
+            '; '.join(problems), width=width))
+    print('{} accounts ({} failed), {} requests, {:.2f}s wall for {:.2f}s of account time '
+        '({:.1f}x) on {} workers'.format(report['accounts'], report['failed'],
+            report['requests'], report['wall_seconds'], report['account_seconds'],
+            report['speedup'] or 0.0, report['workers']))
+
+
+if __name__ == '__main__':
+    from autoalbum.api import JOB_MODES
+
+    parser = argparse.ArgumentParser(
+        description='Run autoalbum for every account in a directory, several at once')
+    parser.add_argument('accounts', type=Path,
+        help='Directory with a subdirectory (config.json, credentials.json) per account')
+    parser.add_argument('behavior', type=str, default='n_most_recent', nargs='?',
+        help='Behavior for single-job configs and jobs that don\'t name one. Default '
+            'n_most_recent')
+    parser.add_argument('--account', action='append', default=None, metavar='NAME',
+        help='Only run this account (repeatable). Default: all of them')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+        help='Accounts running at once, each in its own process. Default: one per core')
+    parser.add_argument('--parallelism', '-j', type=int, default=None,
+        help='Jobs at once within each account. Default: the account config\'s '
+            '"parallelism", or 1')
+    parser.add_argument('--endpoint', default=None, metavar='URL',
+        help='Talk to this Photos Library look-alike (e.g. autoalbum.fakeserver) instead of '
+            'Google. Default: Google')
+    parser.add_argument('--batch-size', type=int, default=50,
+        help='Media ids per album add/remove call (max 50). Default 50')
+    parser.add_argument('--concurrency', type=int, default=None,
+        help='Album add/remove calls in flight at once, per account. Default: 1 serial, '
+            '8 threads, 50 http_batch')
+    parser.add_argument('--job-mode', choices=JOB_MODES, default='serial',
+        help='How album add/remove calls are sent. Default serial')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+        help='Most API requests per second, per account. Default {}'.format(DEFAULT_RATE))
+    parser.add_argument('--max-retries', type=int, default=5,
+        help='Retries for throttled or failed requests before giving up. Default 5')
+    parser.add_argument('--request-budget', type=int, default=None,
+        help='Most API requests each account may make (retries included). Default unlimited')
+    parser.add_argument('--report', type=Path, default=None, metavar='PATH',
+        help='Also write the run report, with every job and each account\'s metrics, as JSON')
+
+    args, unknowns = parser.parse_known_args()
+    try:
+        accounts = find_accounts(args.accounts, args.account)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not accounts:
+        parser.error('No accounts (directories with a {}) in {}'.format(
+            CONFIG_NAME, args.accounts))
+    workers = min(args.workers or os.cpu_count() or 1, len(accounts))
+
+    start = time.perf_counter()
+    reports = run_accounts(accounts, workers,
+        on_done=lambda r: print('{}: {} in {:.2f}s'.format(r.name, r.status, r.elapsed)),
+        behavior=args.behavior, behavior_args=unknowns, endpoint=args.endpoint,
+        limits={'rate': args.rate, 'max_retries': args.max_retries,
+            'request_budget': args.request_budget},
+        parallelism=args.parallelism, batch_size=args.batch_size,
+        concurrency=args.concurrency, job_mode=args.job_mode)
+    report = summary(reports, time.perf_counter() - start, workers)
+    print()
+    print_report(report)
+    if args.report:
+        save_json(args.report, report)
+    sys.exit(1 if report['failed'] else 0)
@@ -0,0 +1,150 @@
+'''Fast RFC 3339 timestamp parsing, one at a time or a page at a time
+
+Media items carry their ``creationTime`` as an RFC 3339 string, nearly always in the one layout
+Google emits (``2015-09-17T03:36:42Z``, sometimes with a fraction). Parsing those with
+``dateutil`` costs several microseconds apiece, which adds up over a big album, so:
+
+* :func:`parse` slices that common layout apart by hand and looks the date part up in a cache,
+  falling back to a regular expression for other offsets and to ``dateutil`` for anything else.
+* :func:`parse_many` does a whole list in one call, and hands it to NumPy's ``datetime64``
+  conversion when NumPy is installed and the batch is big enough to be worth it.
+
+Either way the result is integer microseconds since the epoch (UTC), which sorts and compares
+cheaply.
+'''
+import functools
+import re
+from datetime import date, datetime, timedelta, timezone
+
+#: Smallest batch :func:`parse_many` hands to NumPy; below that the setup costs more than it saves
+NUMPY_MIN_BATCH = 64
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_MICROSECOND = timedelta(microseconds=1)
+_DAY = 86400 * 1000000
+
+_RFC3339 = re.compile(
+    r'(\d{4}-\d\d-\d\d)[Tt ](\d\d):(\d\d):(\d\d)(?:\.(\d+))?(?:[Zz]|([+-])(\d\d):(\d\d))$')
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    '''NumPy, or None if it isn't installed
+
+    Imported on first use rather than with this module: it takes ~50ms, and everything that
+    touches the API imports this module, ``--help`` included.
+    '''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+@functools.lru_cache(maxsize=8192)
+def _day_micros(day):
+    '''Microseconds from the epoch to midnight UTC of a "YYYY-MM-DD" date
+
+    Albums are full of photos taken on the same few days, so this is cached. Invalid dates raise
+    ValueError.
+    '''
+    if len(day) != 10 or day[4] != '-' or day[7] != '-':
+        raise ValueError('Invalid date: {!r}'.format(day))
+    return (date(int(day[:4]), int(day[5:7]), int(day[8:])).toordinal() - _EPOCH_ORDINAL) * _DAY
+
+def _time_micros(hour, minute, second, fraction):
+    if not (hour < 24 and minute < 60 and second < 60):
+        raise ValueError('Time out of range')
+    micros = ((hour * 60 + minute) * 60 + second) * 1000000
+    if fraction:
+        micros += int((fraction + '00000')[:6])
+    return micros
+
+def parse(value):
+    '''Parse an RFC 3339 timestamp into integer microseconds since the epoch (UTC)
+
+    Timestamps without an offset are taken to be UTC. Fractions finer than a microsecond are
+    truncated.
+
+    Args:
+        value (str): Timestamp, e.g. a media item's ``creationTime``
+
+    Returns:
+        int: Microseconds since 1970-01-01T00:00:00Z
+
+    Raises:
+        ValueError: If `value` isn't a timestamp
+    '''
+    # The layout Google uses: 2015-09-17T03:36:42Z or 2015-09-17T03:36:42.123Z
+    length = len(value)
+    if length >= 20 and value[-1] == 'Z' and value[10] == 'T' and value[13] == ':' \
+            and value[16] == ':' and (length == 20 or value[19] == '.'):
+        try:
+            return _day_micros(value[:10]) + _time_micros(
+                int(value[11:13]), int(value[14:16]), int(value[17:19]), value[20:-1])
+        except ValueError:
+            pass
+
+    match = _RFC3339.match(value)
+    if match:
+        day, hour, minute, second, fraction, sign, off_hour, off_minute = match.groups()
+        try:
+            micros = _day_micros(day) + _time_micros(int(hour), int(minute), int(second), fraction)
+        except ValueError:
+            pass
+        else:
+            if sign:
+                offset = (int(off_hour) * 60 + int(off_minute)) * 60000000
+                micros += -offset if sign == '+' else offset
+            return micros
+
+    return _parse_slow(value)
+
+def _parse_slow(value):
+    '''Anything ISO 8601 that the fast paths don't handle, via dateutil'''
+    import dateutil.parser
+
+    parsed = dateutil.parser.isoparse(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - _EPOCH) // _MICROSECOND
+
+def parse_many(values):
+    '''Parse a batch of RFC 3339 timestamps, e.g. the ``creationTime`` of a page of media items
+
+    Args:
+        values (list): Timestamp strings
+
+    Returns:
+        list: Microseconds since the epoch for each one, in the same order
+
+    Raises:
+        ValueError: If any of them isn't a timestamp
+    '''
+    if len(values) >= NUMPY_MIN_BATCH and _numpy() is not None:
+        parsed = _parse_numpy(values)
+        if parsed is not None:
+            return parsed
+    return [parse(v) for v in values]
+
+def _parse_numpy(values):
+    '''Vectorized :func:`parse_many` for the all-UTC case. None if NumPy won't take the batch'''
+    # NumPy only parses naive timestamps without complaint; a trailing Z is all we strip
+    if not all(v[-1:] == 'Z' for v in values):
+        return None
+    numpy = _numpy()
+    try:
+        array = numpy.array([v[:-1] for v in values], dtype='datetime64[us]')
+    except (TypeError, ValueError):
+        return None
+    return array.astype(numpy.int64).tolist()
+
+def items_timestamps(items):
+    '''The ``creationTime`` of each of a page of media items, parsed in one batch
+
+    Args:
+        items (list): Media items as returned by the API
+
+    Returns:
+        list: Microseconds since the epoch for each item, in the same order
+    '''
+    return parse_many([item['mediaMetadata']['creationTime'] for item in items])
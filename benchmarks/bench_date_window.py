@@ -0,0 +1,57 @@
+'''Timings for autoalbum.behavior.date_window's timeline
+
+Builds a timeline for a synthetic album, then times many windows against it and an incremental
+update with a few new items, checking the windows against a brute-force scan.
+
+    $ python benchmarks/bench_date_window.py --size 100000 --new 100
+'''
+import argparse
+import tempfile
+import time
+from datetime import date, timezone
+from pathlib import Path
+
+from bench_n_most_recent import make_album
+
+from autoalbum.behavior.date_window import Timeline, anniversaries, last_days
+from autoalbum.media import MediaRecord
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='date_window timeline benchmark')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--new', type=int, default=100, help='Items added before the update')
+    args = parser.parse_args()
+
+    album = make_album(args.size + args.new)
+    records = MediaRecord.from_items(album)
+    images = [m for m in records if m.is_image]
+    tz = timezone.utc
+    with tempfile.TemporaryDirectory() as tmp:
+        timeline = Timeline(Path(tmp) / 'timeline.json', 'album')
+        _, build = timed(timeline.update, records[:args.size])
+        _, save = timed(timeline.save)
+        timeline, load = timed(lambda: Timeline(timeline.path, 'album').load())
+        _, update = timed(timeline.update, records)
+
+    windows = []
+    for day in range(1, 366):
+        today = date.fromordinal(date(2021, 1, 1).toordinal() + day - 1)
+        windows.append(anniversaries(today, tz, timeline.first))
+        windows.append(last_days(30, today, tz))
+    _, query = timed(lambda: [timeline.window(w) for w in windows])
+
+    sample = windows[100]
+    expected = sorted((m.timestamp, m.id) for m in images
+        if any(start <= m.timestamp < stop for start, stop in sample))
+    assert timeline.window(sample) == [i for _, i in expected]
+
+    print('{:<36} {:>10.3f} s'.format('build ({} items)'.format(args.size), build))
+    print('{:<36} {:>10.3f} s'.format('save', save))
+    print('{:<36} {:>10.3f} s'.format('load', load))
+    print('{:<36} {:>10.3f} s'.format('update (+{} items)'.format(args.new), update))
+    print('{:<36} {:>10.3f} s'.format('{} window sets'.format(len(windows)), query))
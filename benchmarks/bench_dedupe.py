@@ -0,0 +1,74 @@
+'''Timings for autoalbum.behavior.dedupe: hashing across processes, and clustering
+
+Hashes the same batch of generated thumbnails with 0 (inline), 1, 2, ... worker processes (pool
+startup included), then clusters a large set of synthetic hashes and checks a sample of the
+result against brute force.
+
+    $ python benchmarks/bench_dedupe.py --images 2000 --workers 0 1 2 4 --hashes 100000
+'''
+import argparse
+import random
+import time
+
+from autoalbum.behavior.dedupe import DISTANCE, Candidate, _process_pool, distinct
+from autoalbum.fakeserver import FakeLibrary
+from autoalbum.perceptual import distance, hash_images
+
+def hash_all(images, workers):
+    '''Hash `images` a slice per worker, as the dedupe behavior does'''
+    pool = _process_pool(workers)
+    step = max(-(-len(images) // max(workers, 1)), 1)
+    try:
+        futures = [pool.submit(hash_images, images[i:i + step])
+            for i in range(0, len(images), step)]
+        return [h for f in futures for h in f.result()]
+    finally:
+        pool.shutdown()
+
+def synthetic(count, burst, seed=0):
+    '''Candidates with hashes: bursts of `burst` hashes a bit apart'''
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        if i % burst == 0:
+            base = rng.getrandbits(64)
+        phash = base ^ (1 << rng.randrange(64)) if rng.random() < 0.5 else base
+        records.append(Candidate(str(i), 'image/jpeg', i, phash=phash))
+    return records
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='dedupe benchmark')
+    parser.add_argument('--images', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=64, help='Thumbnail size')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--hashes', type=int, default=100000)
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--distance', type=int, default=DISTANCE)
+    args = parser.parse_args()
+
+    library = FakeLibrary(burst_size=args.burst)
+    images = [library.media_image('img-{:07d}'.format(i), args.size, args.size)
+        for i in range(args.images)]
+    expected = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        hashes = hash_all(images, workers)
+        elapsed = time.perf_counter() - start
+        assert expected is None or hashes == expected
+        expected = hashes
+        print('hash {} images, {} workers {:>16.3f} s ({:.0f}/s)'.format(
+            args.images, workers, elapsed, args.images / elapsed))
+
+    records = synthetic(args.hashes, args.burst)
+    start = time.perf_counter()
+    kept = list(distinct(args.distance)(records))
+    elapsed = time.perf_counter() - start
+    print('cluster {} hashes, distance {} {:>15.3f} s ({} kept)'.format(
+        args.hashes, args.distance, elapsed, len(kept)))
+
+    sample = records[:2000]
+    survivors = []
+    for m in sorted(sample, key=lambda m: m.timestamp, reverse=True):
+        if all(distance(m.phash, s.phash) > args.distance for s in survivors):
+            survivors.append(m)
+    assert [m.id for m in survivors][::-1] == [m.id for m in distinct(args.distance)(sample)]
@@ -0,0 +1,97 @@
+'''Cold-start import times
+
+Imports each module in a fresh interpreter with ``-X importtime`` and reports the cumulative
+time, plus the wall time of ``python -m autoalbum --help``. With ``--budget`` it exits non-zero if
+anything takes longer than that, so it can guard startup as behaviors are added.
+
+Optional extras (NumPy from ``autoalbum[fast]`` and the like) must not be imported at startup
+either, even when they're installed. Each one that is installed is checked for, and any module
+that pulls it in makes the run fail. Install them (``pip install -e .[fast,async,dedupe]``) to
+cover those cases.
+
+    $ python benchmarks/bench_import.py --repeat 5 --budget 0.15
+'''
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+#: Modules whose import time we care about, cheapest expected first
+MODULES = [
+    'autoalbum',
+    'autoalbum.api',
+    'autoalbum.runner',
+    'autoalbum.__main__',
+    'autoalbum.behavior.n_most_recent',
+]
+#: Optional dependencies that only get imported once they're actually used
+OPTIONAL = ['numpy', 'aiohttp', 'PIL']
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(_ROOT), env.get('PYTHONPATH')]))
+    return env
+
+def import_time(module):
+    '''Cumulative import time of `module` in a fresh interpreter, in seconds'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        env=_env(), stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, check=True)
+    for line in reversed(result.stderr.decode().splitlines()):
+        # import time: self [us] | cumulative | imported package
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise RuntimeError('No import time reported for {}'.format(module))
+
+def startup_imports(module, candidates):
+    '''Which of `candidates` importing `module` pulls in, in a fresh interpreter'''
+    code = 'import sys, {}; print(" ".join(m for m in {!r} if m in sys.modules))'.format(
+        module, list(candidates))
+    result = subprocess.run([sys.executable, '-c', code], env=_env(), stdout=subprocess.PIPE,
+        check=True)
+    return result.stdout.decode().split()
+
+def help_time():
+    '''Wall time of `python -m autoalbum --help`, interpreter startup included, in seconds'''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'autoalbum', '--help'], env=_env(),
+        stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='autoalbum import time benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (median)')
+    parser.add_argument('--budget', type=float, default=None,
+        help='Fail if any module import takes longer than this many seconds')
+    args = parser.parse_args()
+
+    over = []
+    for module in MODULES:
+        seconds = statistics.median(import_time(module) for _ in range(args.repeat))
+        print('{:<44} {:>8.1f} ms'.format('import ' + module, seconds * 1000))
+        if args.budget is not None and seconds > args.budget:
+            over.append(module)
+    seconds = statistics.median(help_time() for _ in range(args.repeat))
+    print('{:<44} {:>8.1f} ms'.format('python -m autoalbum --help', seconds * 1000))
+
+    installed = [name for name in OPTIONAL if importlib.util.find_spec(name) is not None]
+    found = {module: startup_imports(module, installed) if installed else []
+        for module in MODULES}
+    eager = []
+    for name in OPTIONAL:
+        importers = [module for module in MODULES if name in found[module]]
+        eager += ['{} (by {})'.format(name, ', '.join(importers))] if importers else []
+        status = 'not installed' if name not in installed else \
+            'imported by ' + ', '.join(importers) if importers else 'lazy'
+        print('{:<44} {}'.format('startup with ' + name, status))
+
+    if over:
+        sys.exit('Over the {}s budget: {}'.format(args.budget, ', '.join(over)))
+    if eager:
+        sys.exit('Optional dependencies imported at startup: {}'.format(', '.join(eager)))
@@ -0,0 +1,33 @@
+'''Memory held by an album's worth of full media item dicts vs. compact MediaRecords
+
+    $ python benchmarks/bench_media_memory.py --sizes 10000 100000
+'''
+import argparse
+import tracemalloc
+
+from autoalbum.fakeserver import FakeLibrary
+from autoalbum.media import MediaRecord
+
+def allocated(build):
+    '''Bytes still allocated by whatever `build` returns'''
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Media item memory benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    library = FakeLibrary()
+    print('{:>8} {:>12} {:>12}'.format('size', 'dicts (MB)', 'records (MB)'))
+    for size in args.sizes:
+        album = library.add_album('album{}'.format(size), size)
+        ids = album.ids(0, size)
+        dicts = allocated(lambda: [library.media_item(i, 'http://localhost') for i in ids])
+        records = allocated(lambda: [
+            MediaRecord.from_item(library.media_item(i, 'http://localhost')) for i in ids])
+        print('{:>8} {:>12.1f} {:>12.1f}'.format(size, dicts / 2**20, records / 2**20))
@@ -0,0 +1,40 @@
+'''Startup timings: building the Photos Library service with and without the discovery cache
+
+Needs network access (for the uncached case, and to fill the cache the first time).
+
+    $ python benchmarks/bench_startup.py --repeat 5
+'''
+import argparse
+import statistics
+import tempfile
+import time
+
+from googleapiclient.discovery import build
+
+from autoalbum import discovery
+
+def timed(func, repeat):
+    '''Run `func` `repeat` times and return the individual timings, in seconds'''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Service build benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        discovery.refresh(cache_dir)
+        cases = {
+            'network': lambda: build(discovery.API_NAME, discovery.API_VERSION,
+                static_discovery=False, cache_discovery=False, developerKey='unused'),
+            'cached': lambda: discovery.build_service(None, cache_dir),
+        }
+        for name, func in cases.items():
+            timings = timed(func, args.repeat)
+            print('{:>8}: median {:.3f}s, min {:.3f}s'.format(
+                name, statistics.median(timings), min(timings)))
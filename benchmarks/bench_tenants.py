@@ -0,0 +1,62 @@
+'''Timings for autoalbum.tenants: many accounts against one fake server, over 1, 2, ... workers
+
+Every account gets its own source and destination album on a local fake server (with some
+latency per request, as Google has) and its own directory, then runs n_most_recent. Each round
+starts from empty destinations and a fresh set of account directories, and checks that every
+destination ends up with the right media.
+
+    $ python benchmarks/bench_tenants.py --accounts 16 --size 2000 --latency 0.01 --workers 1 4 8
+'''
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.tenants import find_accounts, run_accounts, summary
+from autoalbum.util import save_json
+
+def make_accounts(root, library, count, size, tag):
+    '''`count` account directories, each syncing its own source album into its own destination'''
+    for i in range(count):
+        name = 'account-{:03d}'.format(i)
+        source, destination = '{}-src'.format(name), '{}-{}-dst'.format(name, tag)
+        if source not in library.albums:
+            library.add_album(source, size)
+        library.add_album(destination)
+        (root / name).mkdir(parents=True)
+        save_json(root / name / 'config.json', {
+            'source': {'id': source, 'is_shared': False},
+            'destination': {'id': destination, 'is_shared': False},
+        })
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='multi-tenant runner benchmark')
+    parser.add_argument('--accounts', type=int, default=16)
+    parser.add_argument('--size', type=int, default=2000, help='Media items per source album')
+    parser.add_argument('-n', type=int, default=200, help='n_most_recent\'s -n')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds per request')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--report', type=Path, default=None,
+        help='Write the last round\'s report here as JSON')
+    args = parser.parse_args()
+
+    library = FakeLibrary()
+    with FakePhotosServer(library, latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            root = Path(tmp) / 'w{}'.format(workers)
+            make_accounts(root, library, args.accounts, args.size, 'w{}'.format(workers))
+            start = time.perf_counter()
+            reports = run_accounts(find_accounts(root), workers, endpoint=server.url,
+                behavior_args=['-n', str(args.n)], limits={'rate': 1e9, 'burst': 1e9})
+            report = summary(reports, time.perf_counter() - start, workers)
+            assert not report['failed'], [r.error or r.jobs for r in reports]
+            for i in range(args.accounts):
+                album = library.albums['account-{:03d}-w{}-dst'.format(i, workers)]
+                assert len(album) == min(args.n, args.size), len(album)
+            print('{} accounts, {} workers {:>14.3f} s wall ({:.1f}x), {} requests'.format(
+                args.accounts, workers, report['wall_seconds'], report['speedup'],
+                report['requests']))
+        if args.report:
+            save_json(args.report, report)
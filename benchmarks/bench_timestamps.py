@@ -0,0 +1,76 @@
+'''Timings for parsing media item creation times
+
+Compares the original per-item ``dateutil.parser.isoparse`` with :func:`autoalbum.timestamps.parse`
+item by item and :func:`autoalbum.timestamps.parse_many` a page (100 items) at a time, with and
+without NumPy, and checks that they all agree.
+
+    $ python benchmarks/bench_timestamps.py --sizes 10000 100000
+'''
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import dateutil.parser
+
+from autoalbum import timestamps
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+PAGE_SIZE = 100
+
+def make_timestamps(size, seed=0):
+    '''`size` creation times the way Google writes them, a few with fractional seconds'''
+    rng = random.Random(seed)
+    values = []
+    for _ in range(size):
+        when = datetime(2010, 1, 1) + timedelta(seconds=rng.randrange(10 * 365 * 86400))
+        value = when.strftime('%Y-%m-%dT%H:%M:%S')
+        if rng.random() < 0.1:
+            value += '.{:03d}'.format(rng.randrange(1000))
+        values.append(value + 'Z')
+    return values
+
+def isoparse(value):
+    '''The original implementation, kept here as the reference'''
+    return (dateutil.parser.isoparse(value) - _EPOCH) // timedelta(microseconds=1)
+
+def pages(values):
+    return [values[i:i+PAGE_SIZE] for i in range(0, len(values), PAGE_SIZE)]
+
+def by_page(values):
+    return [t for page in pages(values) for t in timestamps.parse_many(page)]
+
+def by_page_without_numpy(values):
+    find_numpy, timestamps._numpy = timestamps._numpy, lambda: None
+    try:
+        return by_page(values)
+    finally:
+        timestamps._numpy = find_numpy
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='creationTime parsing benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    methods = [
+        ('isoparse', lambda values: [isoparse(v) for v in values]),
+        ('parse', lambda values: [timestamps.parse(v) for v in values]),
+        ('parse_many', by_page_without_numpy),
+    ]
+    if timestamps._numpy() is not None:
+        methods.append(('parse_many+numpy', by_page))
+
+    print('{:>8} '.format('size') + ' '.join('{:>18}'.format(name + ' (s)') for name, _ in methods))
+    for size in args.sizes:
+        values = make_timestamps(size)
+        timestamps._day_micros.cache_clear()
+        results = [timed(func, values) for _, func in methods]
+        expected = results[0][0]
+        for (name, _), (result, _) in zip(methods, results):
+            assert result == expected, name
+        print('{:>8} '.format(size) + ' '.join('{:>18.3f}'.format(t) for _, t in results))
@@ -0,0 +1,154 @@
+'''Benchmark suite: runs autoalbum's API against a local fake Photos Library server
+
+Nothing here touches Google. Albums are generated by :mod:`autoalbum.fakeserver` at whatever size
+you ask for, with configurable page size, latency and error rate. Results are written as JSON
+(tagged with the current commit) so runs can be compared across commits.
+
+    $ python benchmarks/suite.py --sizes 1000 10000 100000 --latency 0.005 --out results.json
+'''
+import argparse
+import asyncio
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Benchmark the checkout this script is in, not whatever autoalbum happens to be installed
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from autoalbum import diff # noqa: E402
+from autoalbum.api import API, JOB_MODES # noqa: E402
+from autoalbum.behavior.n_most_recent import select_most_recent # noqa: E402
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer # noqa: E402
+from autoalbum.scheduler import RequestScheduler # noqa: E402
+
+def git_commit():
+    '''The current commit, if we're in a git checkout'''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            cwd=str(Path(__file__).parent), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def make_scheduler():
+    '''A scheduler that never throttles but does retry'''
+    return RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01,
+        max_retries=20)
+
+def make_api(server, **kwargs):
+    '''API against the fake server'''
+    return API(server.build_service(), None, scheduler=make_scheduler(), **kwargs)
+
+def scan_async(server, album_ids, concurrency):
+    '''Page through several albums at once with the AsyncAPI. Total items seen'''
+    from autoalbum.aio import AsyncAPI
+
+    async def scan():
+        async with AsyncAPI(None, root_url=server.url, concurrency=concurrency,
+                scheduler=make_scheduler()) as api:
+            albums = await asyncio.gather(*(api.get_all_album_contents(a) for a in album_ids))
+        return sum(len(a) for a in albums)
+    return asyncio.run(scan())
+
+def have_aiohttp():
+    return importlib.util.find_spec('aiohttp') is not None
+
+class Bench:
+    '''Collects measurements, along with how much work the server did for each'''
+
+    def __init__(self, server):
+        self.server = server
+        self.results = []
+
+    def measure(self, name, func, **params):
+        requests, sent = self.server.requests_served, self.server.bytes_sent
+        start = time.perf_counter()
+        items = func()
+        elapsed = time.perf_counter() - start
+        result = dict(params, name=name, seconds=round(elapsed, 6), items=items,
+            items_per_second=round(items / elapsed, 1) if elapsed else None,
+            requests=self.server.requests_served - requests,
+            bytes=self.server.bytes_sent - sent)
+        self.results.append(result)
+        print('{name:<28} {size:>8} {seconds:>9.3f}s {requests:>6} requests'.format(**result))
+        return result
+
+def run(args):
+    library = FakeLibrary()
+    for i in range(args.albums):
+        library.add_album('album{:05d}'.format(i), i % 100)
+    for size in args.sizes:
+        library.add_album('source{}'.format(size), size)
+
+    server = FakePhotosServer(library, latency=args.latency, error_rate=args.error_rate,
+        max_page_size=args.page_size)
+    bench = Bench(server)
+    with server, make_api(server) as api:
+        bench.measure('list_all_albums', lambda: len(api.list_all_albums()), size=args.albums)
+
+        for size in args.sizes:
+            album_id = 'source{}'.format(size)
+            bench.measure('get_all_album_contents',
+                lambda: len(api.get_all_album_contents(album_id)), size=size)
+            bench.measure('iter_media_ids',
+                lambda: sum(1 for _ in diff.iter_media_ids(api, album_id)), size=size)
+            bench.measure('n_most_recent_select',
+                lambda: len(select_most_recent(api.iter_album_records(album_id), args.n)),
+                size=size, n=args.n)
+
+        sources = ['source{}'.format(size) for size in args.sizes]
+        bench.measure('scan_sources_serial',
+            lambda: sum(len(api.get_all_album_contents(a)) for a in sources), size=sum(args.sizes))
+        if have_aiohttp():
+            bench.measure('scan_sources_async',
+                lambda: scan_async(server, sources, args.concurrency), size=sum(args.sizes),
+                concurrency=args.concurrency)
+
+        edit_ids = ['source{}-{:07d}'.format(max(args.sizes), i) for i in range(args.edit_count)]
+        for mode in JOB_MODES:
+            album_id = 'edit-{}'.format(mode)
+            library.add_album(album_id)
+            with make_api(server, job_mode=mode, concurrency=args.concurrency) as edit_api:
+                bench.measure('add_album_media_contents',
+                    lambda: len(edit_api.add_album_media_contents(album_id, edit_ids)),
+                    size=len(edit_ids), job_mode=mode, concurrency=args.concurrency)
+                bench.measure('remove_album_media_contents',
+                    lambda: len(edit_api.remove_album_media_contents(album_id, edit_ids)),
+                    size=len(edit_ids), job_mode=mode, concurrency=args.concurrency)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'params': {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        'results': bench.results,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='autoalbum benchmark suite (fake server)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+        help='Source album sizes to benchmark (up to 10^6 is fine)')
+    parser.add_argument('--albums', type=int, default=500, help='Albums in the library')
+    parser.add_argument('--page-size', type=int, default=100, help='Media items per page')
+    parser.add_argument('--latency', type=float, default=0.0, help='Server latency, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+        help='Fraction of requests failing with 429/503')
+    parser.add_argument('-n', type=int, default=50, help='n for n_most_recent selection')
+    parser.add_argument('--edit-count', type=int, default=2000,
+        help='Media ids per add/remove job')
+    parser.add_argument('--concurrency', type=int, default=8,
+        help='Concurrency for threaded and multipart add/remove jobs')
+    parser.add_argument('--out', type=Path, default=None,
+        help='Write JSON results here (default: stdout only)')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+        print('Wrote', args.out)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -20,7 +20,7 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[
         'google-auth-oauthlib',
         'google-auth',
@@ -28,4 +28,12 @@ setuptools.setup(
         'python-dateutil',
         'inquirer',
     ],
+    extras_require={
+        # Vectorized timestamp parsing in autoalbum.timestamps
+        'fast': ['numpy'],
+        # autoalbum.aio.AsyncAPI
+        'async': ['aiohttp'],
+        # Decoding real thumbnails in autoalbum.perceptual
+        'dedupe': ['Pillow'],
+    },
 )
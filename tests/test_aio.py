@@ -0,0 +1,92 @@
+'''AsyncAPI against the fake server: prefetching pages, throttling and stopping early'''
+import asyncio
+import gc
+import threading
+
+from autoalbum.aio import AsyncAPI
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.scheduler import RequestScheduler
+
+def make_api(server, **kwargs):
+    scheduler = RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01)
+    return AsyncAPI(None, root_url=server.url, scheduler=scheduler, **kwargs)
+
+def run(coro):
+    '''Run `coro`, failing if the loop reported any exception nobody dealt with'''
+    errors = []
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        try:
+            return await coro
+        finally:
+            gc.collect()
+            await asyncio.sleep(0)
+    result = asyncio.run(main())
+    assert errors == []
+    return result
+
+def test_pages_through_an_album():
+    library = FakeLibrary()
+    album = library.add_album('album', 230)
+    with FakePhotosServer(library, max_page_size=50) as server:
+        async def scan():
+            async with make_api(server) as api:
+                return [item['id'] async for item in api.iter_all_album_contents('album')]
+        assert run(scan()) == album.ids(0, len(album))
+        assert server.requests_served == 5
+
+def test_retries_throttled_requests():
+    library = FakeLibrary()
+    album = library.add_album('album', 500)
+    # Half the injected errors are 429s with Retry-After: 0, the rest 503s
+    with FakePhotosServer(library, max_page_size=50, error_rate=0.3, seed=3) as server:
+        async def scan():
+            async with make_api(server) as api:
+                return [r.id async for r in api.iter_album_records('album')]
+        assert run(scan()) == album.ids(0, len(album))
+        assert server.requests_served > 10
+
+def test_stopping_early_then_closing():
+    library = FakeLibrary()
+    library.add_album('album', 500)
+    with FakePhotosServer(library, latency=0.01, max_page_size=50) as server:
+        async def first_item():
+            api = make_api(server)
+            async for item in api.iter_all_album_contents('album'):
+                break
+            # The next page is still on its way
+            assert api._prefetches
+            await api.close()
+            assert not api._prefetches
+            # Long enough for a prefetch that outlived the session to fail
+            await asyncio.sleep(0.05)
+            return item
+        assert run(first_item())['id'] == 'album-0000000'
+
+def test_refreshes_through_the_store():
+    refreshes = []
+
+    class Creds:
+        valid = False
+        token = None
+
+    class Store:
+        def refresh(self, creds, reason='background'):
+            refreshes.append((reason, threading.current_thread()))
+            creds.valid, creds.token = True, 'fresh'
+
+    library = FakeLibrary()
+    library.add_album('album')
+    with FakePhotosServer(library) as server:
+        async def get_albums():
+            scheduler = RequestScheduler(rate=1e9, burst=1e9)
+            async with AsyncAPI(Creds(), root_url=server.url, scheduler=scheduler,
+                    store=Store()) as api:
+                return await asyncio.gather(*(api.get_album('album') for _ in range(4)))
+        assert [a['id'] for a in run(get_albums())] == ['album'] * 4
+
+    # Once for everybody, and off the event loop's thread
+    assert len(refreshes) == 1
+    assert refreshes[0][0] == 'request'
+    assert refreshes[0][1] is not threading.main_thread()
@@ -0,0 +1,21 @@
+'''The sync API against the fake server: how album edits get sent'''
+from autoalbum.api import API, JOB_MODE_CONCURRENCY
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.scheduler import RequestScheduler
+
+def test_http_batch_packs_calls_together_by_default():
+    library = FakeLibrary()
+    album = library.add_album('album')
+    media_ids = ['m{:03d}'.format(i) for i in range(100)]
+    scheduler = RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01)
+
+    with FakePhotosServer(library) as server, API(server.build_service(), None, batch_size=5,
+            job_mode='http_batch', scheduler=scheduler) as api:
+        assert api.concurrency == JOB_MODE_CONCURRENCY['http_batch']
+        served = server.requests_served
+        results = api.add_album_media_contents('album', media_ids)
+        # All 20 calls in one multipart request
+        assert server.requests_served - served == 1
+
+    assert len(results) == 20
+    assert album.ids(0, len(album)) == media_ids
@@ -0,0 +1,22 @@
+'''The configurator's album catalog: looking albums up by id, per kind'''
+from autoalbum.catalog import AlbumCatalog
+
+def test_get_only_finds_albums_of_the_kind_asked_for(tmp_path):
+    mine, theirs = {'id': 'mine', 'title': 'Trip'}, {'id': 'theirs', 'title': 'Trip'}
+
+    class API:
+        def list_all_albums(self, is_shared=False, fields=None):
+            return [theirs] if is_shared else [mine]
+
+    catalog = AlbumCatalog(tmp_path / 'albums.json').load(API())
+
+    assert catalog.get('mine', False) is mine
+    assert catalog.get('mine', True) is None
+    assert catalog.get('theirs', False) is None
+    assert catalog.get('theirs', True) is theirs
+    assert catalog.get('theirs') is theirs
+
+    created = {'id': 'new', 'title': 'Trip'}
+    catalog.add(created)
+    assert catalog.get('new', False) is created
+    assert catalog.get('new', True) is None
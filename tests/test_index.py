@@ -0,0 +1,68 @@
+'''The media index: scans of one album that overlap, from the index and through the API'''
+import threading
+
+from autoalbum.api import API
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.index import MediaIndex
+from autoalbum.scheduler import RequestScheduler
+
+def make_api(server, index):
+    scheduler = RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01)
+    return API(server.build_service(), None, index=index, scheduler=scheduler)
+
+def items(ids):
+    return [{'id': media_id, 'mimeType': 'image/jpeg',
+        'mediaMetadata': {'creationTime': '2020-01-01T00:00:00Z'}} for media_id in ids]
+
+def test_older_scan_cannot_undo_a_newer_one(tmp_path):
+    index = MediaIndex(tmp_path / 'index.sqlite')
+    old = index.scan('album')
+    old.add(items(['a', 'b']))
+    new = index.scan('album')
+    new.add(items(['a', 'b', 'c']))
+    # The old scan is still going; it must neither restamp the new scan's rows nor commit
+    old.add(items(['c']))
+    assert new.commit(3)
+    assert not old.commit(2)
+
+    assert index.is_current('album', 3)
+    assert [item['id'] for item in index.iter_album('album')] == ['a', 'b', 'c']
+    index.close()
+
+def test_clear_supersedes_a_running_scan(tmp_path):
+    index = MediaIndex(tmp_path / 'index.sqlite')
+    scan = index.scan('album')
+    scan.add(items(['a']))
+    index.clear('album')
+    assert not scan.commit(1)
+    assert not index.is_current('album', 1)
+    assert index.scan('album').generation > scan.generation
+    index.close()
+
+def test_concurrent_scans_of_one_album(tmp_path):
+    library = FakeLibrary()
+    album = library.add_album('album', 450)
+    index = MediaIndex(tmp_path / 'index.sqlite')
+    with FakePhotosServer(library, latency=0.002, max_page_size=50) as server, \
+            make_api(server, index) as api:
+        start = threading.Barrier(4)
+        results = [None] * 4
+
+        def list_album(i):
+            start.wait()
+            results[i] = [item['id'] for item in api.iter_all_album_contents('album')]
+
+        threads = [threading.Thread(target=list_album, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        served = server.requests_served
+
+    expected = album.ids(0, len(album))
+    assert results == [expected] * 4
+    assert index.is_current('album', len(album))
+    assert len(list(index.iter_album('album'))) == len(album)
+    # One scan of 9 pages; the others waited for it and read the index
+    assert served < 9 * 2 + 4
+    index.close()
@@ -0,0 +1,43 @@
+'''Journaled album edits against the fake server: resuming, and superseding old jobs'''
+from autoalbum.api import API
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.journal import Journal
+from autoalbum.scheduler import RequestScheduler
+
+def make_api(server, journal):
+    scheduler = RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01)
+    return API(server.build_service(), None, batch_size=2, scheduler=scheduler, journal=journal)
+
+def test_new_job_sends_ids_an_old_job_already_got_through(tmp_path):
+    library = FakeLibrary()
+    album = library.add_album('album')
+    wanted = ['a', 'b', 'c', 'd']
+    # An earlier run got 'a' and 'b' in, then died; since then somebody took them out again
+    journal = Journal(tmp_path / 'journal.jsonl', fsync=False)
+    old = journal.plan('add', 'album', [['a', 'b'], ['c', 'd']])
+    journal.done(old, 0)
+    assert old.done == {0}
+
+    with FakePhotosServer(library) as server, make_api(server, journal) as api:
+        api.add_album_media_contents('album', wanted)
+
+    assert sorted(album.ids(0, len(album))) == wanted
+    assert journal.unfinished() == []
+    journal.close()
+
+def test_resume_sends_only_pending_chunks(tmp_path):
+    library = FakeLibrary()
+    album = library.add_album('album')
+    journal = Journal(tmp_path / 'journal.jsonl', fsync=False)
+    job = journal.plan('add', 'album', [['a', 'b'], ['c', 'd']])
+    journal.done(job, 0)
+    journal.close()
+
+    journal = Journal(tmp_path / 'journal.jsonl', fsync=False)
+    with FakePhotosServer(library) as server, make_api(server, journal) as api:
+        results = api.resume()
+
+    assert [r.media_ids for r in results] == [['c', 'd']]
+    assert album.ids(0, len(album)) == ['c', 'd']
+    assert journal.unfinished() == []
+    journal.close()
@@ -0,0 +1,62 @@
+'''Perceptual hashing: the PNG codec, multi-index lookups and the dedupe behavior end to end'''
+import random
+
+from autoalbum.api import API
+from autoalbum.behavior import dedupe
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.perceptual import (HASH_SIZE, HashCache, MultiIndex, decode_png, decoder, distance,
+    encode_png)
+from autoalbum.scheduler import RequestScheduler
+
+def test_png_round_trip():
+    rng = random.Random(1)
+    for width, height in [(1, 1), (9, 8), (64, 48), (3, 100)]:
+        pixels = bytes(rng.randrange(256) for _ in range(width * height))
+        assert decode_png(encode_png(pixels, width, height)) == (width, height, pixels)
+
+def test_multi_index_matches_brute_force():
+    rng = random.Random(2)
+    bits = HASH_SIZE * HASH_SIZE
+    hashes = [rng.getrandbits(bits) for _ in range(200)]
+    # Plus near-copies, so there's something within range to find
+    for value in hashes[:100]:
+        for _ in range(rng.randrange(1, 4)):
+            for bit in rng.sample(range(bits), rng.randrange(0, 10)):
+                value ^= 1 << bit
+            hashes.append(value)
+    for radius in (0, 3, 6, 12):
+        index = MultiIndex(radius)
+        for i, value in enumerate(hashes):
+            index.add(value, i)
+        for value in hashes[::7]:
+            found = sorted((d, i) for d, _, i in index.find(value))
+            expected = sorted((distance(value, other), i) for i, other in enumerate(hashes)
+                if distance(value, other) <= radius)
+            assert found == expected
+
+def test_dedupe_keeps_one_of_each_burst(tmp_path):
+    library = FakeLibrary(video_fraction=0, burst_size=4)
+    library.add_album('source', 24)
+    destination = library.add_album('destination')
+    conf_data = {'source': {'id': 'source', 'is_shared': False},
+        'destination': {'id': 'destination', 'is_shared': False}}
+    scheduler = RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01)
+    cache_path = tmp_path / 'hashes.sqlite'
+
+    with FakePhotosServer(library) as server, \
+            API(server.build_service(), None, scheduler=scheduler) as api:
+        dedupe.run(api, conf_data, workers=0, hash_cache=cache_path)
+        kept = destination.ids(0, len(destination))
+        assert sorted(library.scene(media_id) for media_id in kept) == \
+            sorted({library.scene(media_id) for media_id in library.albums['source'].ids(0, 24)})
+
+        # Every hash is cached now, so a second run downloads nothing
+        served = server.requests_served
+        dedupe.run(api, conf_data, workers=0, hash_cache=cache_path)
+        assert server.requests_served - served < 5
+        assert destination.ids(0, len(destination)) == kept
+
+    cache = HashCache(cache_path, 'dhash{}@{}/{}'.format(HASH_SIZE, dedupe.THUMBNAIL_SIZE,
+        decoder()))
+    assert len(cache) == 24
+    cache.close()
@@ -0,0 +1,32 @@
+'''Running several jobs at once against one API'''
+from autoalbum.api import API
+from autoalbum.behavior.n_most_recent import FIELDS
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.index import MediaIndex
+from autoalbum.runner import load_jobs, run_jobs
+from autoalbum.scheduler import RequestScheduler
+
+def test_jobs_sharing_a_source_index_it_once(tmp_path):
+    library = FakeLibrary()
+    source = library.add_album('source', 300)
+    conf_data = {'jobs': [{
+        'name': 'job-{}'.format(i),
+        'behavior': 'n_most_recent',
+        'args': ['-n', '20'],
+        'source': {'id': 'source', 'is_shared': False},
+        'destination': {'id': library.add_album('dst-{}'.format(i)).id, 'is_shared': False},
+    } for i in range(4)]}
+    jobs = load_jobs(conf_data, 'n_most_recent', [])
+    index = MediaIndex(tmp_path / 'index.sqlite')
+    scheduler = RequestScheduler(rate=1e9, burst=1e9, base_delay=0.001, max_delay=0.01)
+
+    with FakePhotosServer(library, latency=0.002, max_page_size=50) as server, \
+            API(server.build_service(), None, index=index, scheduler=scheduler) as api:
+        results = run_jobs(api, jobs, parallelism=4)
+
+    assert [r.status for r in results] == ['ok'] * 4, [r.error for r in results]
+    assert index.is_current('source', len(source), FIELDS)
+    assert len(list(index.iter_album_records('source'))) == len(source)
+    for i in range(4):
+        assert len(library.albums['dst-{}'.format(i)]) == 20
+    index.close()
@@ -0,0 +1,61 @@
+'''Several accounts at once: each one's state stays in its own directory'''
+import sqlite3
+
+from autoalbum import tenants
+from autoalbum.fakeserver import FakeLibrary, FakePhotosServer
+from autoalbum.index import MediaIndex
+from autoalbum.util import save_json
+
+def make_account(root, library, name):
+    library.add_album(name + '-src', 12)
+    library.add_album(name + '-dst')
+    (root / name).mkdir()
+    save_json(root / name / tenants.CONFIG_NAME, {'jobs': [{
+        'behavior': 'dedupe',
+        'args': ['--workers', '0'],
+        'source': {'id': name + '-src', 'is_shared': False},
+        'destination': {'id': name + '-dst', 'is_shared': False},
+    }]})
+
+def rows(path, query):
+    conn = sqlite3.connect(str(path))
+    try:
+        return {row[0] for row in conn.execute(query)}
+    finally:
+        conn.close()
+
+def test_accounts_keep_to_their_own_files(tmp_path):
+    library = FakeLibrary(video_fraction=0, burst_size=3)
+    for name in ('alice', 'bob'):
+        make_account(tmp_path, library, name)
+
+    with FakePhotosServer(library) as server:
+        reports = tenants.run_accounts(tenants.find_accounts(tmp_path), 2, endpoint=server.url,
+            limits={'rate': 1e9, 'burst': 1e9})
+
+    assert [(r.name, r.status) for r in reports] == [('alice', 'ok'), ('bob', 'ok')], reports
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['alice', 'bob']
+    for name in ('alice', 'bob'):
+        directory = tmp_path / name
+        assert (directory / 'journal.jsonl').is_file()
+        assert rows(directory / 'index.sqlite', 'SELECT album_id FROM albums') == \
+            {name + '-src', name + '-dst'}
+        hashed = rows(directory / 'hashes.sqlite', 'SELECT media_id FROM hashes')
+        assert hashed == set(library.albums[name + '-src'].ids(0, 12))
+        assert len(library.albums[name + '-dst']) == 4
+
+def test_index_is_closed_if_the_journal_cannot_open(tmp_path, monkeypatch):
+    library = FakeLibrary()
+    make_account(tmp_path, library, 'alice')
+    closed = []
+    monkeypatch.setattr(MediaIndex, 'close', lambda self: closed.append(self.path))
+    def broken_journal(path):
+        raise OSError('disk full')
+    monkeypatch.setattr('autoalbum.journal.Journal', broken_journal)
+
+    with FakePhotosServer(library) as server:
+        report = tenants.run_account(tmp_path / 'alice', endpoint=server.url)
+
+    assert report.status == 'failed'
+    assert 'disk full' in report.error
+    assert closed == [tmp_path / 'alice' / 'index.sqlite']